@@ -0,0 +1 @@
+"""Build step for the self-hosted stylesheet."""
@@ -0,0 +1,89 @@
+"""Build the purged, minified stylesheet served from /static/css.
+
+Scans the templates for class names, generates only the utilities that are
+actually used and writes ``static/css/app.<hash>.css`` plus a manifest that
+maps ``app.css`` to the hashed file name.
+
+Usage:
+    python -m assets.build
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterable, Optional, Set
+
+from assets.tailwind import generate_css
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.join(REPO_ROOT, "templates")
+OUTPUT_DIR = os.path.join(REPO_ROOT, "static", "css")
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")
+
+# Same idea as Tailwind's content scanner: every class-like word is a
+# candidate, including ones inside JS strings (className = '...')
+CANDIDATE = re.compile(r"[a-z0-9:/.\-]*[a-z0-9%]")
+
+def template_files() -> Iterable[str]:
+    return sorted(glob.glob(os.path.join(TEMPLATE_DIR, "**", "*.html"), recursive=True))
+
+def scan_candidates(paths: Iterable[str]) -> Set[str]:
+    candidates: Set[str] = set()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            candidates.update(CANDIDATE.findall(f.read()))
+    return candidates
+
+def load_manifest() -> Dict[str, str]:
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def is_stale() -> bool:
+    """Whether the stylesheet is missing or older than any template."""
+    manifest = load_manifest()
+    built = manifest.get("app.css")
+    if not built or not os.path.exists(os.path.join(OUTPUT_DIR, built)):
+        return True
+    built_at = os.path.getmtime(MANIFEST_PATH)
+    sources = list(template_files()) + glob.glob(os.path.join(REPO_ROOT, "assets", "*.py"))
+    return any(os.path.getmtime(path) > built_at for path in sources)
+
+def build() -> str:
+    """Write the hashed stylesheet and manifest; return the file name."""
+    css, classes = generate_css(scan_candidates(template_files()))
+    digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:10]
+    filename = f"app.{digest}.css"
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(OUTPUT_DIR, filename), "w", encoding="utf-8") as f:
+        f.write(css)
+    for old in glob.glob(os.path.join(OUTPUT_DIR, "app.*.css")):
+        if os.path.basename(old) != filename:
+            os.remove(old)
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump({"app.css": filename}, f, indent=2)
+        f.write("\n")
+
+    logger.info("Built stylesheet", extra={"file": filename, "classes": len(classes), "bytes": len(css)})
+    return filename
+
+def ensure_built(force: bool = False) -> Optional[str]:
+    """Build the stylesheet if it is missing or stale; never fail startup."""
+    try:
+        if force or is_stale():
+            return build()
+    except OSError as e:
+        logger.warning("Could not build stylesheet: %s", e)
+    return load_manifest().get("app.css")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    print(build())
@@ -0,0 +1,338 @@
+"""Offline generator for the Tailwind utility classes used by the templates.
+
+Implements the subset of Tailwind CSS v3 (plus the project's ``primary`` and
+``accent`` palettes from the old in-browser config) that StupidBookmarks
+uses, so the stylesheet can be built without Node or network access. Classes
+it doesn't know are skipped, just like the Tailwind JIT skips unknown words.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+PALETTE: Dict[str, Dict[str, str]] = {
+    "gray": {
+        "50": "#f9fafb", "100": "#f3f4f6", "200": "#e5e7eb", "300": "#d1d5db", "400": "#9ca3af",
+        "500": "#6b7280", "600": "#4b5563", "700": "#374151", "800": "#1f2937", "900": "#111827",
+    },
+    "red": {
+        "50": "#fef2f2", "100": "#fee2e2", "200": "#fecaca", "300": "#fca5a5", "400": "#f87171",
+        "500": "#ef4444", "600": "#dc2626", "700": "#b91c1c", "800": "#991b1b", "900": "#7f1d1d",
+    },
+    "green": {
+        "50": "#f0fdf4", "100": "#dcfce7", "200": "#bbf7d0", "300": "#86efac", "400": "#4ade80",
+        "500": "#22c55e", "600": "#16a34a", "700": "#15803d", "800": "#166534", "900": "#14532d",
+    },
+    "blue": {
+        "50": "#eff6ff", "100": "#dbeafe", "200": "#bfdbfe", "300": "#93c5fd", "400": "#60a5fa",
+        "500": "#3b82f6", "600": "#2563eb", "700": "#1d4ed8", "800": "#1e40af", "900": "#1e3a8a",
+    },
+    "yellow": {
+        "50": "#fefce8", "100": "#fef9c3", "200": "#fef08a", "300": "#fde047", "400": "#facc15",
+        "500": "#eab308", "600": "#ca8a04", "700": "#a16207", "800": "#854d0e", "900": "#713f12",
+    },
+    "primary": {
+        "50": "#fff7ed", "100": "#ffedd5", "200": "#fed7aa", "300": "#fdba74", "400": "#fb923c",
+        "500": "#f97316", "600": "#ea580c", "700": "#c2410c", "800": "#9a3412", "900": "#7c2d12",
+    },
+    "accent": {
+        "50": "#fef2f2", "100": "#fee2e2", "200": "#fecaca", "300": "#fca5a5", "400": "#f87171",
+        "500": "#ef4444", "600": "#dc2626", "700": "#b91c1c", "800": "#991b1b", "900": "#7f1d1d",
+    },
+}
+
+SCREENS = {"sm": "640px", "md": "768px", "lg": "1024px"}
+PSEUDO_VARIANTS = {"focus-within": ":focus-within", "hover": ":hover", "focus": ":focus"}
+
+FONT_SANS = 'Inter,ui-sans-serif,system-ui,-apple-system,"Segoe UI",Roboto,"Helvetica Neue",Arial,sans-serif'
+FONT_MONO = 'ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono","Courier New",monospace'
+
+# Condensed Tailwind v3 preflight plus the defaults utilities rely on
+PREFLIGHT = (
+    "*,::before,::after{box-sizing:border-box;border-width:0;border-style:solid;border-color:#e5e7eb;"
+    "--tw-ring-inset: ;--tw-ring-offset-width:0px;--tw-ring-offset-color:#fff;"
+    "--tw-ring-color:rgb(59 130 246/0.5);--tw-ring-offset-shadow:0 0 #0000;--tw-ring-shadow:0 0 #0000;"
+    "--tw-shadow:0 0 #0000}"
+    "html{line-height:1.5;-webkit-text-size-adjust:100%;tab-size:4;font-family:" + FONT_SANS + "}"
+    "body{margin:0;line-height:inherit}"
+    "hr{height:0;color:inherit;border-top-width:1px}"
+    "h1,h2,h3,h4,h5,h6{font-size:inherit;font-weight:inherit}"
+    "a{color:inherit;text-decoration:inherit}"
+    "b,strong{font-weight:bolder}"
+    "code,kbd,samp,pre{font-family:" + FONT_MONO + ";font-size:1em}"
+    "small{font-size:80%}"
+    "table{text-indent:0;border-color:inherit;border-collapse:collapse}"
+    "button,input,optgroup,select,textarea{font-family:inherit;font-size:100%;font-weight:inherit;"
+    "line-height:inherit;color:inherit;margin:0;padding:0}"
+    "button,select{text-transform:none}"
+    "button,[type='button'],[type='reset'],[type='submit']{-webkit-appearance:button;"
+    "background-color:transparent;background-image:none}"
+    "progress{vertical-align:baseline}"
+    "summary{display:list-item}"
+    "blockquote,dl,dd,h1,h2,h3,h4,h5,h6,hr,figure,p,pre{margin:0}"
+    "fieldset{margin:0;padding:0}"
+    "legend{padding:0}"
+    "ol,ul,menu{list-style:none;margin:0;padding:0}"
+    "textarea{resize:vertical}"
+    "input::placeholder,textarea::placeholder{opacity:1;color:#9ca3af}"
+    "button,[role='button']{cursor:pointer}"
+    ":disabled{cursor:default}"
+    "img,svg,video,canvas,audio,iframe,embed,object{display:block;vertical-align:middle}"
+    "img,video{max-width:100%;height:auto}"
+    "[hidden]{display:none}"
+)
+
+SPACING_STEPS = {"0": "0px", "px": "1px", "0.5": "0.125rem"}
+
+def spacing(value: str) -> Optional[str]:
+    if value in SPACING_STEPS:
+        return SPACING_STEPS[value]
+    if value == "auto":
+        return "auto"
+    if re.fullmatch(r"\d+(\.5)?", value):
+        return f"{float(value) / 4:g}rem"
+    return None
+
+def rgb(hex_color: str) -> str:
+    return " ".join(str(int(hex_color[i:i + 2], 16)) for i in (1, 3, 5))
+
+def color(value: str) -> Optional[Tuple[str, Optional[str]]]:
+    """``gray-500`` / ``red-900/50`` -> (``"r g b"``, alpha or None)."""
+    alpha = None
+    if "/" in value:
+        value, percent = value.split("/", 1)
+        if not percent.isdigit():
+            return None
+        alpha = f"{int(percent) / 100:g}"
+    if value == "white":
+        return "255 255 255", alpha
+    if value == "black":
+        return "0 0 0", alpha
+    if "-" not in value:
+        return None
+    name, shade = value.rsplit("-", 1)
+    hex_color = PALETTE.get(name, {}).get(shade)
+    return (rgb(hex_color), alpha) if hex_color else None
+
+def color_rule(prop: str, opacity_var: Optional[str]) -> Callable[[str], Optional[str]]:
+    def rule(value: str) -> Optional[str]:
+        parsed = color(value)
+        if value == "transparent":
+            return f"{prop}:transparent"
+        if not parsed:
+            return None
+        channels, alpha = parsed
+        if alpha is not None:
+            return f"{prop}:rgb({channels}/{alpha})"
+        if opacity_var:
+            return f"{opacity_var}:1;{prop}:rgb({channels}/var({opacity_var}))"
+        return f"{prop}:rgb({channels})"
+    return rule
+
+def box(props: Tuple[str, ...], negative: bool = False) -> Callable[[str], Optional[str]]:
+    def rule(value: str) -> Optional[str]:
+        size = spacing(value)
+        if size is None:
+            return None
+        if negative:
+            size = f"-{size}"
+        return ";".join(f"{prop}:{size}" for prop in props)
+    return rule
+
+def child_spacing(prop: str, negative: bool = False) -> Callable[[str], Optional[str]]:
+    def rule(value: str) -> Optional[str]:
+        size = spacing(value)
+        if size is None:
+            return None
+        return f"{prop}:{'-' if negative else ''}{size}"
+    return rule
+
+SHADOWS = {
+    "sm": "0 1px 2px 0 rgb(0 0 0/0.05)",
+    "": "0 1px 3px 0 rgb(0 0 0/0.1),0 1px 2px -1px rgb(0 0 0/0.1)",
+    "md": "0 4px 6px -1px rgb(0 0 0/0.1),0 2px 4px -2px rgb(0 0 0/0.1)",
+    "lg": "0 10px 15px -3px rgb(0 0 0/0.1),0 4px 6px -4px rgb(0 0 0/0.1)",
+    "xl": "0 20px 25px -5px rgb(0 0 0/0.1),0 8px 10px -6px rgb(0 0 0/0.1)",
+}
+
+FONT_SIZES = {
+    "xs": ("0.75rem", "1rem"), "sm": ("0.875rem", "1.25rem"), "base": ("1rem", "1.5rem"),
+    "lg": ("1.125rem", "1.75rem"), "xl": ("1.25rem", "1.75rem"), "2xl": ("1.5rem", "2rem"),
+    "3xl": ("1.875rem", "2.25rem"),
+}
+
+MAX_WIDTHS = {"md": "28rem", "lg": "32rem", "xl": "36rem", "7xl": "80rem", "none": "none"}
+
+TRANSITION_PROPERTIES = {
+    "": "color,background-color,border-color,text-decoration-color,fill,stroke,opacity,box-shadow,transform,filter,backdrop-filter",
+    "-all": "all",
+    "-colors": "color,background-color,border-color,text-decoration-color,fill,stroke",
+    "-opacity": "opacity",
+}
+
+STATIC: Dict[str, str] = {
+    "sr-only": "position:absolute;width:1px;height:1px;padding:0;margin:-1px;overflow:hidden;"
+               "clip:rect(0,0,0,0);white-space:nowrap;border-width:0",
+    "pointer-events-none": "pointer-events:none",
+    "fixed": "position:fixed", "absolute": "position:absolute", "relative": "position:relative",
+    "inset-0": "inset:0px",
+    "z-0": "z-index:0", "z-10": "z-index:10", "z-50": "z-index:50",
+    "mx-auto": "margin-left:auto;margin-right:auto",
+    "block": "display:block", "inline-block": "display:inline-block", "inline": "display:inline",
+    "flex": "display:flex", "inline-flex": "display:inline-flex", "grid": "display:grid",
+    "hidden": "display:none",
+    "h-full": "height:100%", "min-h-full": "min-height:100%", "min-h-screen": "min-height:100vh",
+    "w-full": "width:100%", "w-auto": "width:auto", "min-w-0": "min-width:0px", "min-w-full": "min-width:100%",
+    "flex-1": "flex:1 1 0%", "flex-shrink-0": "flex-shrink:0", "flex-grow": "flex-grow:1",
+    "transform": "transform:translate(0,0)",
+    "cursor-pointer": "cursor:pointer", "cursor-not-allowed": "cursor:not-allowed",
+    "select-all": "user-select:all",
+    "appearance-none": "appearance:none",
+    "list-inside": "list-style-position:inside", "list-disc": "list-style-type:disc",
+    "flex-row-reverse": "flex-direction:row-reverse", "flex-col": "flex-direction:column",
+    "flex-wrap": "flex-wrap:wrap",
+    "items-start": "align-items:flex-start", "items-center": "align-items:center",
+    "justify-end": "justify-content:flex-end", "justify-center": "justify-content:center",
+    "justify-between": "justify-content:space-between",
+    "overflow-hidden": "overflow:hidden", "overflow-x-auto": "overflow-x:auto", "overflow-y-auto": "overflow-y:auto",
+    "truncate": "overflow:hidden;text-overflow:ellipsis;white-space:nowrap",
+    "whitespace-nowrap": "white-space:nowrap", "break-all": "word-break:break-all",
+    "rounded": "border-radius:0.25rem", "rounded-md": "border-radius:0.375rem",
+    "rounded-lg": "border-radius:0.5rem", "rounded-full": "border-radius:9999px",
+    "rounded-l-md": "border-top-left-radius:0.375rem;border-bottom-left-radius:0.375rem",
+    "rounded-r-md": "border-top-right-radius:0.375rem;border-bottom-right-radius:0.375rem",
+    "border": "border-width:1px", "border-2": "border-width:2px",
+    "border-t": "border-top-width:1px", "border-b": "border-bottom-width:1px",
+    "text-left": "text-align:left", "text-center": "text-align:center", "text-right": "text-align:right",
+    "align-middle": "vertical-align:middle", "align-bottom": "vertical-align:bottom",
+    "font-mono": f"font-family:{FONT_MONO}",
+    "font-medium": "font-weight:500", "font-semibold": "font-weight:600",
+    "font-bold": "font-weight:700", "font-extrabold": "font-weight:800",
+    "uppercase": "text-transform:uppercase",
+    "leading-6": "line-height:1.5rem", "tracking-wider": "letter-spacing:0.05em",
+    "underline": "text-decoration-line:underline",
+    "opacity-50": "opacity:0.5", "opacity-75": "opacity:0.75",
+    "bg-opacity-50": "--tw-bg-opacity:0.5",
+    "outline-none": "outline:2px solid transparent;outline-offset:2px",
+    "ring-opacity-5": "--tw-ring-opacity:0.05",
+    "duration-200": "transition-duration:200ms",
+    "ease-in": "transition-timing-function:cubic-bezier(0.4,0,1,1)",
+}
+
+# (prefix, handler, selector suffix) in Tailwind's output order; later rules
+# win over earlier ones with the same variants (px-6 over p-4, and so on).
+DYNAMIC: List[Tuple[str, Callable[[str], Optional[str]], str]] = [
+    ("-m", box(("margin",), negative=True), ""),
+    ("m-", box(("margin",)), ""),
+    ("mx-", box(("margin-left", "margin-right")), ""),
+    ("my-", box(("margin-top", "margin-bottom")), ""),
+    ("mt-", box(("margin-top",)), ""),
+    ("mr-", box(("margin-right",)), ""),
+    ("mb-", box(("margin-bottom",)), ""),
+    ("ml-", box(("margin-left",)), ""),
+    ("-ml-", box(("margin-left",), negative=True), ""),
+    ("h-", box(("height",)), ""),
+    ("w-", box(("width",)), ""),
+    ("max-w-", lambda v: f"max-width:{MAX_WIDTHS[v]}" if v in MAX_WIDTHS else None, ""),
+    ("grid-cols-", lambda v: f"grid-template-columns:repeat({v},minmax(0,1fr))" if v.isdigit() else None, ""),
+    ("gap-", box(("gap",)), ""),
+    ("space-x-", child_spacing("margin-left"), ">:not([hidden])~:not([hidden])"),
+    ("-space-x-", child_spacing("margin-left", negative=True), ">:not([hidden])~:not([hidden])"),
+    ("space-y-", child_spacing("margin-top"), ">:not([hidden])~:not([hidden])"),
+    ("divide-y", lambda v: "border-top-width:1px;border-bottom-width:0px" if v == "" else None,
+     ">:not([hidden])~:not([hidden])"),
+    ("divide-", color_rule("border-color", "--tw-divide-opacity"), ">:not([hidden])~:not([hidden])"),
+    ("border-", color_rule("border-color", "--tw-border-opacity"), ""),
+    ("bg-", color_rule("background-color", "--tw-bg-opacity"), ""),
+    ("p-", box(("padding",)), ""),
+    ("px-", box(("padding-left", "padding-right")), ""),
+    ("py-", box(("padding-top", "padding-bottom")), ""),
+    ("pt-", box(("padding-top",)), ""),
+    ("pb-", box(("padding-bottom",)), ""),
+    ("text-", lambda v: "font-size:{0};line-height:{1}".format(*FONT_SIZES[v]) if v in FONT_SIZES else None, ""),
+    ("text-", color_rule("color", "--tw-text-opacity"), ""),
+    ("placeholder-", color_rule("color", "--tw-placeholder-opacity"), "::placeholder"),
+    ("shadow", lambda v: (
+        f"--tw-shadow:{SHADOWS[v.lstrip('-')]};box-shadow:var(--tw-ring-offset-shadow,0 0 #0000),"
+        "var(--tw-ring-shadow,0 0 #0000),var(--tw-shadow)"
+    ) if v == "" or (v.startswith("-") and v[1:] in SHADOWS) else None, ""),
+    ("ring-", lambda v: (
+        "--tw-ring-offset-shadow:var(--tw-ring-inset) 0 0 0 var(--tw-ring-offset-width) var(--tw-ring-offset-color);"
+        f"--tw-ring-shadow:var(--tw-ring-inset) 0 0 0 calc({v}px + var(--tw-ring-offset-width)) var(--tw-ring-color);"
+        "box-shadow:var(--tw-ring-offset-shadow),var(--tw-ring-shadow),var(--tw-shadow,0 0 #0000)"
+    ) if v.isdigit() else None, ""),
+    ("ring-", lambda v: (
+        "--tw-ring-opacity:1;--tw-ring-color:rgb({0}/var(--tw-ring-opacity))".format(color(v)[0])
+        if color(v) and "/" not in v else None
+    ), ""),
+    ("ring-offset-", lambda v: f"--tw-ring-offset-width:{v}px" if v.isdigit() else None, ""),
+    ("ring-offset-", lambda v: f"--tw-ring-offset-color:#{''.join(f'{int(c):02x}' for c in color(v)[0].split())}"
+     if color(v) else None, ""),
+    ("transition", lambda v: (
+        f"transition-property:{TRANSITION_PROPERTIES[v]};"
+        "transition-timing-function:cubic-bezier(0.4,0,0.2,1);transition-duration:150ms"
+    ) if v in TRANSITION_PROPERTIES else None, ""),
+]
+
+def escape_class(name: str) -> str:
+    return re.sub(r"([:/.\[\]])", r"\\\1", name)
+
+def utility(name: str) -> Optional[Tuple[int, str, str]]:
+    """Return (order, declarations, selector suffix) for a bare utility."""
+    if name in STATIC:
+        return list(STATIC).index(name), STATIC[name], ""
+    for index, (prefix, handler, suffix) in enumerate(DYNAMIC):
+        if name.startswith(prefix):
+            declarations = handler(name[len(prefix):])
+            if declarations:
+                return len(STATIC) + index, declarations, suffix
+    return None
+
+class Rule:
+    """One generated CSS rule, sortable in Tailwind's cascade order."""
+
+    def __init__(self, candidate: str, order: Tuple[int, int, int], css: str):
+        self.candidate = candidate
+        self.order = order
+        self.css = css
+
+def generate_rule(candidate: str) -> Optional[Rule]:
+    """CSS for one class name such as ``dark:hover:bg-gray-600``, or None."""
+    *variants, name = candidate.split(":")
+    found = utility(name)
+    if not found:
+        return None
+    position, declarations, suffix = found
+
+    screen = None
+    dark = False
+    pseudo = ""
+    variant_rank = 0
+    for variant in variants:
+        if variant in SCREENS and screen is None:
+            screen = variant
+        elif variant == "dark" and not dark:
+            dark = True
+            variant_rank += 10
+        elif variant in PSEUDO_VARIANTS:
+            pseudo += PSEUDO_VARIANTS[variant]
+            variant_rank += list(PSEUDO_VARIANTS).index(variant) + 1
+        else:
+            return None
+
+    selector = f".{escape_class(candidate)}{pseudo}{suffix}"
+    if dark:
+        selector = f".dark {selector}"
+    css = f"{selector}{{{declarations}}}"
+    screen_rank = list(SCREENS).index(screen) + 1 if screen else 0
+    if screen:
+        css = f"@media (min-width:{SCREENS[screen]}){{{css}}}"
+    return Rule(candidate, (screen_rank, variant_rank, position), css)
+
+def generate_css(candidates) -> Tuple[str, List[str]]:
+    """Build the stylesheet for every recognised candidate class.
+
+    Returns the CSS and the sorted list of classes that were generated.
+    """
+    rules = [rule for rule in map(generate_rule, set(candidates)) if rule]
+    rules.sort(key=lambda rule: (rule.order, rule.candidate))
+    return PREFLIGHT + "".join(rule.css for rule in rules), [rule.candidate for rule in rules]
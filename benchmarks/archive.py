@@ -0,0 +1,187 @@
+"""Archive pages served by a local stub server.
+
+Starts ``--hosts`` tiny HTTP servers on localhost (each port counts as a
+separate host), seeds bookmarks pointing at them, runs
+``services.archive_service`` and reports pages per minute, how many pages
+were stored once for several bookmarks, the compression ratio, peak memory,
+and whether every stored page decompresses to what the stub sent. Byte
+ranges read back through mmap are checked against the whole file.
+
+Each URL's path picks the stub's behaviour:
+
+- ``/same/N``: one of ``--distinct`` shared pages, so most are duplicates
+- ``/page/N``: a page of its own
+- ``/huge/N``: larger than the size limit
+- ``/gone/N``: 404
+
+Usage:
+    python -m benchmarks.archive --bookmarks 5000 --hosts 20 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KINDS = ("same", "same", "page", "page", "huge", "gone")
+
+def page_body(kind: str, number: int, distinct: int, page_kb: int) -> bytes:
+    """What the stub sends for a path; deterministic so results can be checked."""
+    seed = number % distinct if kind == "same" else number
+    rng = random.Random(f"{kind}-{seed}")
+    words = rng.choices(("bookmark", "archive", "page", "link", "tag", "snapshot", "http"), k=page_kb * 150)
+    return f"<html><head><title>{kind} {seed}</title></head><body><p>{' '.join(words)}</p></body></html>".encode()
+
+class StubServers:
+    """Minimal keep-alive HTTP/1.1 servers on a background event loop."""
+
+    def __init__(self, hosts: int, latency: float, distinct: int, page_kb: int, huge_bytes: int):
+        self.latency = latency
+        self.distinct = distinct
+        self.page_kb = page_kb
+        self.huge_bytes = huge_bytes
+        self.ports: List[int] = []
+        self.requests = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._hosts = hosts
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        for _ in range(self._hosts):
+            server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+            self.ports.append(server.sockets[0].getsockname()[1])
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                path = head.split(b" ", 2)[1].decode()
+                kind, _, number = path.strip("/").partition("/")
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+
+                status = "200 OK"
+                if kind == "gone":
+                    status, body = "404 Not Found", b"gone"
+                elif kind == "huge":
+                    body = b"x" * self.huge_bytes
+                else:
+                    body = page_body(kind, int(number), self.distinct, self.page_kb)
+                if kind == "huge":
+                    # No Content-Length, so the size limit has to catch it while streaming
+                    writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/html\r\nConnection: close\r\n\r\n".encode() + body)
+                    await writer.drain()
+                    break
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/html; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-archive-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from models.database import SessionLocal, init_db
+    from models.models import Bookmark, PageSnapshot, User
+    from services.archive_service import PageArchiver
+
+    max_bytes = args.max_kb * 1024
+    stubs = StubServers(args.hosts, args.latency_ms / 1000, args.distinct, args.page_kb, max_bytes * 2)
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="benchmark", password_hash="!")
+    db.add(user)
+    db.commit()
+    rng = random.Random(args.seed)
+    rows = []
+    for i in range(args.bookmarks):
+        rows.append({"url": f"http://127.0.0.1:{rng.choice(stubs.ports)}/{rng.choice(KINDS)}/{i}", "title": f"Stub {i}", "user_id": user.id})
+    db.execute(Bookmark.__table__.insert(), rows)
+    db.commit()
+
+    archiver = PageArchiver(
+        archive_dir=os.path.join(workdir, "archive"), workers=args.workers, per_host=args.per_host,
+        queue_max=args.queue_max, max_bytes=max_bytes, timeout=5
+    )
+    print(f"Archiving {args.bookmarks} pages on {args.hosts} hosts...", file=sys.stderr)
+    first = archiver.capture_pending()
+    second = archiver.capture_pending()
+    summary = archiver.summary(db, user.id)
+
+    mismatches = []
+    range_errors = 0
+    for bookmark, snapshot in db.query(Bookmark, PageSnapshot).outerjoin(PageSnapshot, PageSnapshot.bookmark_id == Bookmark.id):
+        kind, number = bookmark.url.rsplit("/", 2)[-2:]
+        want_stored = kind in ("same", "page")
+        got_stored = snapshot is not None and snapshot.content_hash is not None
+        if want_stored != got_stored:
+            mismatches.append({"url": bookmark.url, "stored": got_stored, "error": snapshot and snapshot.error})
+            continue
+        if not got_stored:
+            continue
+        path = archiver.blob_path(snapshot.content_hash)
+        with open(path, "rb") as f:
+            stored = f.read()
+        if gzip.decompress(stored) != page_body(kind, int(number), args.distinct, args.page_kb):
+            mismatches.append({"url": bookmark.url, "stored": True, "error": "content differs"})
+        cut = rng.randrange(len(stored))
+        ranged = b"".join(archiver.read_range(path, 0, cut)) + b"".join(archiver.read_range(path, cut + 1, len(stored) - 1))
+        range_errors += ranged != stored
+    db.close()
+
+    return {
+        "bookmarks": args.bookmarks,
+        "hosts": args.hosts,
+        "latency_ms": args.latency_ms,
+        "first_run": first,
+        "second_run": second,
+        "summary": {key: value for key, value in summary.items() if key != "last_captured"},
+        "compression_ratio": round(summary["original_bytes"] / summary["stored_bytes"], 2) if summary["stored_bytes"] else None,
+        "stub_requests": stubs.requests,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "mismatches": len(mismatches),
+        "mismatch_examples": mismatches[:5],
+        "range_errors": range_errors,
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Archive pages served by local stub servers.")
+    parser.add_argument("--bookmarks", type=int, default=5000, help="bookmarks to archive")
+    parser.add_argument("--hosts", type=int, default=20, help="stub servers (one host each)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="delay before each stub response")
+    parser.add_argument("--distinct", type=int, default=50, help="different pages behind /same/ URLs")
+    parser.add_argument("--page-kb", type=int, default=40, help="approximate page size")
+    parser.add_argument("--max-kb", type=int, default=512, help="size limit (huge pages are twice this)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--queue-max", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    print(json.dumps(run(parse_args(argv)), indent=2))
+
+if __name__ == "__main__":
+    main()
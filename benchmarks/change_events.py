@@ -0,0 +1,148 @@
+"""Memory and fan-out latency of idle change-event streams.
+
+Starts ``uvicorn main:app`` on a local port, opens many ``/api/events``
+streams from one asyncio client and reports the server's resident memory
+before and after (Linux only, from ``/proc``), then adds bookmarks through
+the API and measures how long each event takes to reach every stream.
+Delivery times include the client reading thousands of sockets on the same
+machine, so they are an upper bound.
+
+Usage:
+    python -m benchmarks.change_events --streams 2000 --events 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import CorpusConfig
+from benchmarks.run import REPO_ROOT
+from benchmarks.workers import free_port, prepare_database, wait_until_up
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+class Stream:
+    """One raw HTTP connection to ``/api/events``, recording when each event arrives."""
+
+    def __init__(self):
+        self.received: List[float] = []
+        self.ready = asyncio.Event()
+
+    async def run(self, port: int, api_key: str):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            f"GET /api/events HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {api_key}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode()
+        )
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"retry:"):
+                    self.ready.set()
+                elif line.startswith(b"event: bookmark.created"):
+                    self.received.append(time.perf_counter())
+        finally:
+            writer.close()
+
+async def drive(args: argparse.Namespace, port: int, pid: int, api_key: str) -> Dict[str, Any]:
+    import httpx
+
+    base_rss = rss_kib(pid)
+    streams = [Stream() for _ in range(args.streams)]
+    tasks = []
+    started = time.perf_counter()
+    for start in range(0, args.streams, 200):
+        batch = streams[start:start + 200]
+        tasks += [asyncio.create_task(stream.run(port, api_key)) for stream in batch]
+        await asyncio.gather(*(stream.ready.wait() for stream in batch))
+    connect_s = time.perf_counter() - started
+    await asyncio.sleep(1)
+    idle_rss = rss_kib(pid)
+
+    delivered_all, per_stream = [], []
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", headers={"Authorization": f"Bearer {api_key}"}) as client:
+        for i in range(args.events):
+            sent = time.perf_counter()
+            response = await client.post("/api/bookmarks", json={"url": f"https://example.com/events/{i}", "title": f"Event {i}"})
+            response.raise_for_status()
+            while any(len(stream.received) <= i for stream in streams):
+                await asyncio.sleep(0.001)
+            times = [stream.received[i] - sent for stream in streams]
+            delivered_all.append(max(times))
+            per_stream.extend(times)
+    per_stream.sort()
+    after_rss = rss_kib(pid)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "streams": args.streams,
+        "connect_seconds": round(connect_s, 2),
+        "server_rss_mib": {
+            "before": round(base_rss / 1024, 1),
+            "idle_streams": round(idle_rss / 1024, 1),
+            "after_events": round(after_rss / 1024, 1),
+        },
+        "kib_per_idle_stream": round((idle_rss - base_rss) / args.streams, 2),
+        "events": args.events,
+        "delivery_ms": {
+            "all_streams_median": round(statistics.median(delivered_all) * 1000, 1),
+            "all_streams_max": round(max(delivered_all) * 1000, 1),
+            "per_stream_p50": round(per_stream[len(per_stream) // 2] * 1000, 1),
+            "per_stream_p99": round(per_stream[int(len(per_stream) * 0.99)] * 1000, 1),
+        },
+    }
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="stupidbookmarks-events-"), "bench.db")
+    api_key, _ = prepare_database(db_path, CorpusConfig(bookmarks=args.bookmarks, seed=args.seed))
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        LOG_LEVEL="WARNING",
+        API_RATE_LIMIT="0",
+        BACKUP_INTERVAL_HOURS="0",
+        LINK_CHECK_INTERVAL_HOURS="0",
+        ARCHIVE_INTERVAL_HOURS="0",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT, env=env,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}", process)
+        return asyncio.run(drive(args, port, process.pid, api_key))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure memory and fan-out latency of idle change-event streams.")
+    parser.add_argument("--streams", type=int, default=2000, help="event streams held open at once")
+    parser.add_argument("--events", type=int, default=20, help="bookmarks added while the streams are open")
+    parser.add_argument("--bookmarks", type=int, default=1000, help="bookmarks seeded before starting")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    print(json.dumps(run(parse_args(argv)), indent=2))
+
+if __name__ == "__main__":
+    main()
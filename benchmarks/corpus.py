@@ -0,0 +1,146 @@
+"""Synthetic bookmark corpora for benchmarking StupidBookmarks."""
+
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from html import escape
+from itertools import accumulate
+from typing import Dict, List, Optional
+
+WORDS = (
+    "python rust linux docker kubernetes postgres sqlite fastapi async design "
+    "recipe travel music video article paper tutorial guide reference news "
+    "security privacy math science history climate finance startup career "
+    "javascript css html web api database cache performance testing devops "
+    "photography books games hardware keyboard network cloud mobile android"
+).split()
+
+DOMAINS = (
+    "github.com", "news.ycombinator.com", "en.wikipedia.org", "medium.com",
+    "stackoverflow.com", "youtube.com", "arxiv.org", "dev.to", "reddit.com",
+    "docs.python.org", "blog.example.com", "lwn.net",
+)
+
+@dataclass
+class CorpusConfig:
+    """Shape of a synthetic bookmark collection."""
+    bookmarks: int = 10000
+    tags: int = 500
+    tags_per_bookmark: int = 3
+    zipf_s: float = 1.1
+    days: int = 5 * 365
+    seed: int = 42
+
+@dataclass
+class SyntheticBookmark:
+    url: str
+    title: str
+    description: str
+    tags: List[str]
+    created_at: datetime
+
+@dataclass
+class FolderNode:
+    name: str
+    bookmarks: List[SyntheticBookmark] = field(default_factory=list)
+    children: List["FolderNode"] = field(default_factory=list)
+
+class ZipfSampler:
+    """Draw items so that the k-th most popular is picked ~ 1/k^s as often."""
+
+    def __init__(self, items: List[str], s: float, rng: random.Random):
+        self.items = items
+        self.rng = rng
+        self.cum_weights = list(accumulate(1.0 / (rank ** s) for rank in range(1, len(items) + 1)))
+
+    def sample(self, k: int) -> List[str]:
+        """Sample up to ``k`` distinct items."""
+        k = min(k, len(self.items))
+        picked: Dict[str, None] = {}
+        while len(picked) < k:
+            picked[self.rng.choices(self.items, cum_weights=self.cum_weights)[0]] = None
+        return list(picked)
+
+def tag_vocabulary(size: int) -> List[str]:
+    """Return ``size`` distinct tag names, most "popular" first."""
+    names = list(WORDS)
+    i = 0
+    while len(names) < size:
+        names.append(f"{WORDS[i % len(WORDS)]}-{i // len(WORDS) + 1}")
+        i += 1
+    return names[:size]
+
+def generate_bookmarks(config: CorpusConfig) -> List[SyntheticBookmark]:
+    """Generate bookmarks with a Zipf-distributed tag assignment."""
+    rng = random.Random(config.seed)
+    sampler = ZipfSampler(tag_vocabulary(config.tags), config.zipf_s, rng)
+    now = datetime.now()
+
+    bookmarks = []
+    for i in range(config.bookmarks):
+        words = rng.sample(WORDS, 4)
+        tag_count = rng.randint(0, config.tags_per_bookmark * 2)
+        bookmarks.append(SyntheticBookmark(
+            url=f"https://{rng.choice(DOMAINS)}/{'/'.join(words[:2])}/{i}",
+            title=" ".join(word.capitalize() for word in words),
+            description=" ".join(rng.choices(WORDS, k=rng.randint(0, 20))),
+            tags=sampler.sample(tag_count),
+            created_at=now - timedelta(seconds=rng.randint(0, config.days * 86400)),
+        ))
+    return bookmarks
+
+def build_folder_tree(
+    bookmarks: List[SyntheticBookmark],
+    depth: int = 3,
+    fanout: int = 4,
+    seed: int = 42
+) -> FolderNode:
+    """Spread bookmarks over a nested folder tree like a browser export."""
+    rng = random.Random(seed)
+    root = FolderNode("Bookmarks Bar")
+    folders = [root]
+
+    def grow(node: FolderNode, level: int):
+        if level >= depth:
+            return
+        for _ in range(rng.randint(1, fanout)):
+            child = FolderNode(rng.choice(WORDS).capitalize())
+            node.children.append(child)
+            folders.append(child)
+            grow(child, level + 1)
+
+    grow(root, 0)
+    for bookmark in bookmarks:
+        rng.choice(folders).bookmarks.append(bookmark)
+    return root
+
+def render_netscape_html(root: FolderNode, now: Optional[datetime] = None) -> str:
+    """Render a folder tree as a Netscape bookmark file."""
+    stamp = int((now or datetime.now()).timestamp())
+    lines = [
+        "<!DOCTYPE NETSCAPE-Bookmark-file-1>",
+        '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">',
+        "<TITLE>Bookmarks</TITLE>",
+        "<H1>Bookmarks</H1>",
+    ]
+
+    def emit(node: FolderNode, indent: str):
+        lines.append(f'{indent}<DT><H3 ADD_DATE="{stamp}" LAST_MODIFIED="{stamp}">{escape(node.name)}</H3>')
+        lines.append(f"{indent}<DL><p>")
+        for child in node.children:
+            emit(child, indent + "    ")
+        for bookmark in node.bookmarks:
+            added = int(bookmark.created_at.timestamp())
+            tags = f' TAGS="{escape(",".join(bookmark.tags))}"' if bookmark.tags else ""
+            lines.append(
+                f'{indent}    <DT><A HREF="{escape(bookmark.url)}" ADD_DATE="{added}"{tags}>'
+                f"{escape(bookmark.title)}</A>"
+            )
+            if bookmark.description:
+                lines.append(f"{indent}    <DD>{escape(bookmark.description)}")
+        lines.append(f"{indent}</DL><p>")
+
+    lines.append("<DL><p>")
+    emit(root, "    ")
+    lines.append("</DL><p>")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,181 @@
+"""Run the link checker against local stub servers.
+
+Starts ``--hosts`` tiny HTTP servers on localhost (each port counts as a
+separate host) plus one port with nothing listening, seeds bookmarks that
+point at them, runs ``services.link_checker`` and reports URLs per minute,
+the most requests any host saw at once, and any result that differs from
+what the stub was told to return. A second run checks that fresh results
+are not checked again.
+
+Each URL's path picks the stub's behaviour:
+
+- ``/ok/N``: 200
+- ``/moved/N``: 301 to ``/ok/N``
+- ``/gone/N``: 404
+- ``/nohead/N``: 405 to HEAD, 200 to GET
+
+Usage:
+    python -m benchmarks.link_check --bookmarks 5000 --hosts 20 --latency-ms 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KINDS = ("ok", "moved", "gone", "nohead")
+
+class StubServers:
+    """Minimal keep-alive HTTP/1.1 servers on a background event loop."""
+
+    def __init__(self, hosts: int, latency: float):
+        self.latency = latency
+        self.ports: List[int] = []
+        self.in_flight: Counter = Counter()
+        self.max_in_flight: Counter = Counter()
+        self.requests = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._hosts = hosts
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._ready.wait()
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        for _ in range(self._hosts):
+            server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+            self.ports.append(server.sockets[0].getsockname()[1])
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        port = writer.get_extra_info("sockname")[1]
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                method, path = head.split(b" ", 2)[:2]
+                kind, _, number = path.decode().strip("/").partition("/")
+
+                self.requests += 1
+                self.in_flight[port] += 1
+                self.max_in_flight[port] = max(self.max_in_flight[port], self.in_flight[port])
+                try:
+                    await asyncio.sleep(self.latency)
+                finally:
+                    self.in_flight[port] -= 1
+
+                headers = ""
+                if kind == "moved":
+                    status, headers = "301 Moved Permanently", f"Location: /ok/{number}\r\n"
+                elif kind == "gone":
+                    status = "404 Not Found"
+                elif kind == "nohead" and method == b"HEAD":
+                    status = "405 Method Not Allowed"
+                else:
+                    status = "200 OK"
+                body = b"<html><title>stub</title></html>"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n{headers}Content-Type: text/html\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + (b"" if method == b"HEAD" else body)
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def expected(url: str, dead_port: int) -> Dict[str, Any]:
+    if f":{dead_port}/" in url:
+        return {"error": "connection"}
+    kind, number = url.rsplit("/", 2)[-2:]
+    if kind == "moved":
+        return {"status": 200, "final_url": url.replace("/moved/", "/ok/")}
+    return {"status": 404 if kind == "gone" else 200}
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-links-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from datetime import timedelta
+    from models.database import SessionLocal, init_db
+    from models.models import Bookmark, User
+    from services.link_checker import LinkChecker
+
+    stubs = StubServers(args.hosts, args.latency_ms / 1000)
+    dead_port = unused_port()
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="benchmark", password_hash="!")
+    db.add(user)
+    db.commit()
+    rng = random.Random(args.seed)
+    rows = []
+    for i in range(args.bookmarks):
+        # A few links to a host that refuses connections
+        port = dead_port if i % 100 == 0 else rng.choice(stubs.ports)
+        rows.append({"url": f"http://127.0.0.1:{port}/{rng.choice(KINDS)}/{i}", "title": f"Stub {i}", "user_id": user.id})
+    db.execute(Bookmark.__table__.insert(), rows)
+    db.commit()
+
+    checker = LinkChecker(concurrency=args.concurrency, per_host=args.per_host, timeout=5)
+    print(f"Checking {args.bookmarks} links on {args.hosts} hosts...", file=sys.stderr)
+    first = asyncio.run(checker.check_stale(max_age=timedelta(days=1)))
+    second = asyncio.run(checker.check_stale(max_age=timedelta(days=1)))
+
+    mismatches = []
+    skipped = 0
+    for bookmark in db.query(Bookmark).order_by(Bookmark.id):
+        if bookmark.last_checked is None:
+            skipped += 1
+            continue
+        want = expected(bookmark.url, dead_port)
+        got = {"status": bookmark.link_status, "final_url": bookmark.final_url, "error": bookmark.link_error}
+        if any(got[key] != value for key, value in want.items()):
+            mismatches.append({"url": bookmark.url, "expected": want, "got": got})
+    db.close()
+
+    return {
+        "bookmarks": args.bookmarks,
+        "hosts": args.hosts,
+        "latency_ms": args.latency_ms,
+        "first_run": first,
+        "second_run": second,
+        "stub_requests": stubs.requests,
+        "max_in_flight_per_host": max(stubs.max_in_flight.values()),
+        "skipped_unchecked": skipped,
+        "mismatches": len(mismatches),
+        "mismatch_examples": mismatches[:5],
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the link checker against local stub servers.")
+    parser.add_argument("--bookmarks", type=int, default=5000, help="bookmarks to check")
+    parser.add_argument("--hosts", type=int, default=20, help="stub servers (one host each)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="delay before each stub response")
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight overall")
+    parser.add_argument("--per-host", type=int, default=2, help="requests in flight per host")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    print(json.dumps(run(parse_args(argv)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Measure near-duplicate detection against brute-force comparison.
+
+Seeds a synthetic corpus straight into the tables (so nothing is indexed
+yet), indexes it with ``services.duplicate_index``'s batched backfill, then
+adds near-duplicates of random bookmarks through ``BookmarkService``:
+
+- ``tracking``: the same URL over http with tracking parameters and a
+  different title
+- ``mirror``: the same path, title and description on another host
+- ``retitled``: the same page with a site name added to its title and a
+  few description words dropped
+
+Each copy is looked up with the index and by comparing it with every
+bookmark, which also gives the exact answer the index is checked against.
+Reports backfill speed, lookup latency for both, recall of the planted
+copies and of everything above the threshold, the duplicates report, and
+how many copies a bulk import flags.
+
+Usage:
+    python -m benchmarks.near_duplicates --bookmarks 100000 --copies 1000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.corpus import CorpusConfig, generate_bookmarks
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KINDS = ("tracking", "mirror", "retitled")
+
+def near_copy(kind: str, url: str, title: str, description: str, rng: random.Random) -> Dict[str, str]:
+    """A bookmark for the same page as the given one."""
+    if kind == "tracking":
+        return {"url": url.replace("https://", "http://") + "?utm_source=feed&utm_medium=rss", "title": title.upper(), "description": ""}
+    if kind == "mirror":
+        return {"url": "https://mirror.example.org/" + url.split("/", 3)[3], "title": title, "description": description}
+    words = description.split()
+    for _ in range(min(2, len(words))):
+        words.pop(rng.randrange(len(words)))
+    return {"url": url + "/", "title": f"{title} | {url.split('/')[2]}", "description": " ".join(words)}
+
+def median_ms(samples: List[float]) -> float:
+    return round(statistics.median(samples) * 1000, 3)
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-duplicates-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from sqlalchemy import func, select, text
+    from benchmarks.run import seed_database
+    from models.database import SessionLocal, init_db
+    from models.models import Bookmark, DuplicateBand, User
+    from services.bookmark_formats import BookmarkRecord
+    from services.bookmark_service import BookmarkService
+    from services.duplicate_index import DuplicateIndex, comparable, similarity
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="benchmark", password_hash="!")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    print(f"Seeding {args.bookmarks} bookmarks...", file=sys.stderr)
+    seed_database(db, user_id, generate_bookmarks(CorpusConfig(bookmarks=args.bookmarks, seed=args.seed)))
+    pages_before = db.execute(text("PRAGMA page_count")).scalar()
+
+    index = DuplicateIndex(threshold=args.threshold)
+    print("Backfilling...", file=sys.stderr)
+    started = time.perf_counter()
+    backfill = index.backfill()
+    backfill_s = time.perf_counter() - started
+    band_rows = db.execute(select(func.count()).select_from(DuplicateBand)).scalar()
+    pages_after = db.execute(text("PRAGMA page_count")).scalar()
+    page_size = db.execute(text("PRAGMA page_size")).scalar()
+
+    # Plant near-duplicates through the normal add path
+    rng = random.Random(args.seed)
+    originals = db.execute(
+        select(Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description)
+        .where(Bookmark.id.in_(rng.sample(range(1, args.bookmarks + 1), args.copies)))
+    ).all()
+    kinds = [KINDS[i % len(KINDS)] for i in range(len(originals))]
+    service = BookmarkService()
+    copies = [
+        {**near_copy(kind, row.url, row.title, row.description, rng), "user_id": user_id, "tags": ""}
+        for kind, row in zip(kinds, originals)
+    ]
+    started = time.perf_counter()
+    added = service.insert_bookmarks(db, copies)
+    db.commit()
+    add_ms_each = (time.perf_counter() - started) * 1000 / len(copies)
+
+    # Everything in memory for the brute-force comparison
+    started = time.perf_counter()
+    everything = {
+        row.id: comparable(row.url, row.title, row.description)
+        for row in db.execute(select(Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description))
+    }
+    brute_load_s = time.perf_counter() - started
+
+    index_times, brute_times = [], []
+    planted_found = planted_above = exact_total = exact_found = false_matches = 0
+    by_kind = {kind: {"planted": 0, "found": 0} for kind in KINDS}
+    for kind, original, copy in zip(kinds, originals, added):
+        started = time.perf_counter()
+        found = {match["id"] for match in index.similar_to(db, user_id, copy.id, limit=1000)}
+        index_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        mine = everything[copy.id]
+        exact = {
+            bookmark_id for bookmark_id, other in everything.items()
+            if bookmark_id != copy.id and similarity(mine, other) >= args.threshold
+        }
+        brute_times.append(time.perf_counter() - started)
+
+        by_kind[kind]["planted"] += 1
+        if original.id in exact:
+            planted_above += 1
+        if original.id in found:
+            planted_found += 1
+            by_kind[kind]["found"] += 1
+        exact_total += len(exact)
+        exact_found += len(exact & found)
+        false_matches += len(found - exact)
+
+    started = time.perf_counter()
+    report = index.report(db, user_id, limit=args.copies * 2)
+    report_ms = (time.perf_counter() - started) * 1000
+    grouped = {}
+    for number, group in enumerate(report["groups"]):
+        for member in group:
+            grouped[member["id"]] = number
+    planted_grouped = sum(
+        1 for original, copy in zip(originals, added)
+        if original.id in grouped and grouped[original.id] == grouped.get(copy.id)
+    )
+
+    # A bulk import of further copies, with its possible-duplicate count
+    records = [
+        BookmarkRecord(**near_copy(kind, row.url, row.title, row.description, rng), tags=[])
+        for kind, row in zip(kinds, originals)
+    ]
+    started = time.perf_counter()
+    imported = service.bulk_import(db, user_id, records)
+    import_s = time.perf_counter() - started
+    db.close()
+
+    return {
+        "bookmarks": args.bookmarks,
+        "copies": len(added),
+        "threshold": args.threshold,
+        "backfill": {
+            "indexed": backfill["indexed"],
+            "seconds": round(backfill_s, 2),
+            "per_second": round(backfill["indexed"] / backfill_s),
+            "band_rows": band_rows,
+            "added_mb": round((pages_after - pages_before) * page_size / 1024 / 1024, 1),
+        },
+        "add_ms_each_incl_indexing": round(add_ms_each, 3),
+        "lookup": {
+            "index_ms": median_ms(index_times),
+            "index_p99_ms": round(sorted(index_times)[int(len(index_times) * 0.99)] * 1000, 3),
+            "brute_force_ms": median_ms(brute_times),
+            "brute_force_load_s": round(brute_load_s, 2),
+        },
+        "planted_above_threshold": planted_above,
+        "planted_found": planted_found,
+        "planted_by_kind": by_kind,
+        "recall_vs_brute_force": round(exact_found / exact_total, 4) if exact_total else None,
+        "matches_above_threshold": exact_total,
+        "false_matches": false_matches,
+        "report": {
+            "ms": round(report_ms, 1),
+            "groups": report["total_groups"],
+            "planted_pairs_grouped": planted_grouped,
+        },
+        "import": {
+            "imported": imported["imported"],
+            "possible_duplicates": imported["possible_duplicates"],
+            "seconds": round(import_s, 2),
+        },
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure near-duplicate detection against brute-force comparison.")
+    parser.add_argument("--bookmarks", type=int, default=100000, help="bookmarks in the corpus")
+    parser.add_argument("--copies", type=int, default=1000, help="near-duplicates planted (and imported again)")
+    parser.add_argument("--threshold", type=float, default=0.7, help="similarity reported as a duplicate")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    print(json.dumps(run(parse_args(argv)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Compare the ORM and Core read paths for bookmark listings and exports.
+
+Seeds a synthetic corpus, then reads it three ways and reports CPU time and
+peak Python memory (tracemalloc) per pass:
+
+- ``orm_lazy``: ``Bookmark`` instances with tags loaded per bookmark, the
+  way listings used to work
+- ``orm_selectin``: ``Bookmark`` instances with tags batch-loaded
+- ``core``: ``BookmarkRow`` records from ``services.bookmark_reader``
+
+Usage:
+    python -m benchmarks.read_path --bookmarks 20000 --page 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.corpus import CorpusConfig, generate_bookmarks
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(fn: Callable[[], int], runs: int) -> Dict[str, Any]:
+    """Median CPU/wall time over ``runs`` passes, then one traced pass for peak memory."""
+    cpu, wall = [], []
+    for _ in range(runs):
+        c0, w0 = time.process_time(), time.perf_counter()
+        rows = fn()
+        cpu.append(time.process_time() - c0)
+        wall.append(time.perf_counter() - w0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "rows": rows,
+        "cpu_ms": round(statistics.median(cpu) * 1000, 2),
+        "wall_ms": round(statistics.median(wall) * 1000, 2),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-read-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from sqlalchemy import desc
+    from sqlalchemy.orm import selectinload
+    from benchmarks.run import seed_database
+    from models.database import SessionLocal, init_db
+    from models.models import Bookmark, User
+    from services.bookmark_reader import bookmark_reader
+    from services.bookmark_service import BookmarkService
+
+    init_db()
+    service = BookmarkService()
+    db = SessionLocal()
+    user = User(username="benchmark", password_hash="!")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    print(f"Seeding {args.bookmarks} bookmarks...", file=sys.stderr)
+    seed_database(db, user_id, generate_bookmarks(CorpusConfig(
+        bookmarks=args.bookmarks, tags=args.tags, tags_per_bookmark=args.tags_per_bookmark, seed=args.seed
+    )))
+    db.close()
+
+    def with_session(fn: Callable[[Any], List[Any]]) -> Callable[[], int]:
+        def call() -> int:
+            session = SessionLocal()
+            try:
+                return len(fn(session))
+            finally:
+                session.close()
+        return call
+
+    def orm_page(options) -> Callable[[Any], List[Dict[str, Any]]]:
+        def read(session):
+            query = session.query(Bookmark).filter(Bookmark.user_id == user_id)
+            if options is not None:
+                query = query.options(options)
+            bookmarks = query.order_by(desc(Bookmark.created_at)).limit(args.page).all()
+            return [service.bookmark_to_dict(bookmark) for bookmark in bookmarks]
+        return read
+
+    def orm_export(options) -> Callable[[Any], List[Any]]:
+        def read(session):
+            query = session.query(Bookmark).filter(Bookmark.user_id == user_id)
+            if options is not None:
+                query = query.options(options)
+            return [(b.url, b.title, [tag.name for tag in b.tags]) for b in query.order_by(Bookmark.id)]
+        return read
+
+    scenarios = {
+        f"page of {args.page} as API dicts": {
+            "orm_lazy": orm_page(None),
+            "orm_selectin": orm_page(selectinload(Bookmark.tags)),
+            "core": lambda session: [
+                row.to_dict() for row in bookmark_reader.list_bookmarks(session, user_id, limit=args.page)
+            ],
+        },
+        f"export of all {args.bookmarks}": {
+            "orm_lazy": orm_export(None),
+            "orm_selectin": orm_export(selectinload(Bookmark.tags)),
+            "core": lambda session: [
+                (row.url, row.title, row.tags) for row in bookmark_reader.iter_bookmarks(session, user_id)
+            ],
+        },
+    }
+
+    report: Dict[str, Any] = {"bookmarks": args.bookmarks, "scenarios": {}}
+    for name, paths in scenarios.items():
+        results = {}
+        for path, fn in paths.items():
+            if path == "orm_lazy" and args.skip_lazy:
+                continue
+            print(f"Measuring {name} ({path})...", file=sys.stderr)
+            results[path] = measure(with_session(fn), args.runs)
+        core = results["core"]
+        for path, result in results.items():
+            if path != "core":
+                result["core_cpu_speedup"] = round(result["cpu_ms"] / core["cpu_ms"], 2) if core["cpu_ms"] else None
+                result["core_memory_ratio"] = round(core["peak_kib"] / result["peak_kib"], 2) if result["peak_kib"] else None
+        report["scenarios"][name] = results
+    return report
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare the ORM and Core bookmark read paths.")
+    parser.add_argument("--bookmarks", type=int, default=20000, help="bookmarks in the corpus")
+    parser.add_argument("--tags", type=int, default=500, help="size of the tag vocabulary")
+    parser.add_argument("--tags-per-bookmark", type=int, default=3, help="mean tags per bookmark")
+    parser.add_argument("--page", type=int, default=500, help="bookmarks per listing page")
+    parser.add_argument("--runs", type=int, default=5, help="timed passes per path; medians are reported")
+    parser.add_argument("--skip-lazy", action="store_true", help="skip the (slow) per-bookmark tag loading path")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    print(json.dumps(run(parse_args(argv)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Measure the related-tags index against an on-demand self-join.
+
+Seeds a synthetic corpus, builds the per-user co-occurrence matrix from
+``services.tag_related`` and reports build time and peak memory, then top-k
+latency for tags of different popularity, answered by the index and by the
+``bookmark_tags`` self-join a tag page would otherwise run per request.
+Results are compared tag by tag, and after adding and deleting bookmarks
+through ``BookmarkService`` the incrementally updated matrix is compared
+with a fresh build.
+
+Usage:
+    python -m benchmarks.related_tags --bookmarks 100000 --tags 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.corpus import CorpusConfig, generate_bookmarks
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def timed(fn: Callable[[], Any], runs: int) -> float:
+    """Median wall time of ``fn`` in microseconds."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1e6, 1)
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-related-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from sqlalchemy import func, select
+    from sqlalchemy.orm import aliased
+    from benchmarks.run import seed_database
+    from models.database import SessionLocal, init_db
+    from models.models import Tag, User, user_tags
+    from services.bookmark_service import BookmarkService
+    from services.tag_related import RelatedTagIndex, related_tags
+
+    init_db()
+    db = SessionLocal()
+    user = User(username="benchmark", password_hash="!")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    print(f"Seeding {args.bookmarks} bookmarks...", file=sys.stderr)
+    seed_database(db, user_id, generate_bookmarks(CorpusConfig(
+        bookmarks=args.bookmarks, tags=args.tags, tags_per_bookmark=args.tags_per_bookmark, seed=args.seed
+    )))
+
+    def self_join(name: str) -> List[Dict[str, int]]:
+        this, other = user_tags.alias("this"), user_tags.alias("other")
+        this_tag, other_tag = aliased(Tag), aliased(Tag)
+        rows = db.execute(
+            select(other_tag.name, func.count().label("count"))
+            .select_from(this)
+            .join(this_tag, this_tag.id == this.c.tag_id)
+            .join(other, (other.c.bookmark_id == this.c.bookmark_id) & (other.c.tag_id != this.c.tag_id))
+            .join(other_tag, other_tag.id == other.c.tag_id)
+            .where(this_tag.user_id == user_id, this_tag.name == name)
+            .group_by(other_tag.name)
+            .order_by(func.count().desc(), other_tag.name)
+            .limit(args.k)
+        )
+        return [{"name": row.name, "count": row.count} for row in rows]
+
+    # The shared index, since commits publish incremental updates to it
+    index = related_tags
+    index.invalidate()
+    tracemalloc.start()
+    started = time.perf_counter()
+    index.related(db, user_id, "", args.k)
+    build_ms = round((time.perf_counter() - started) * 1000, 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    matrix = index._indexes[user_id]
+
+    by_popularity = [
+        name for name, _ in db.execute(
+            select(Tag.name, func.count(user_tags.c.bookmark_id))
+            .join(user_tags, user_tags.c.tag_id == Tag.id)
+            .where(Tag.user_id == user_id)
+            .group_by(Tag.id)
+            .order_by(func.count(user_tags.c.bookmark_id).desc())
+        )
+    ]
+    probes = {
+        "most used tag": by_popularity[0],
+        "median tag": by_popularity[len(by_popularity) // 2],
+        "rarest tag": by_popularity[-1],
+    }
+    queries = {}
+    for label, name in probes.items():
+        index.related(db, user_id, name, args.k)  # first call ranks the row
+        queries[label] = {
+            "tag": name,
+            "bookmarks": matrix.rows[name][name],
+            "index_us": timed(lambda: index.related(db, user_id, name, args.k), args.runs * 100),
+            "self_join_us": timed(lambda: self_join(name), args.runs),
+        }
+
+    rng = random.Random(args.seed)
+    sample = rng.sample(by_popularity, min(args.check, len(by_popularity)))
+    wrong = [name for name in sample if index.related(db, user_id, name, args.k) != self_join(name)]
+
+    # Incremental updates: add and delete bookmarks, then compare with a rebuild
+    service = BookmarkService()
+    vocabulary = by_popularity[:200]
+    added = service.insert_bookmarks(db, [
+        {
+            "user_id": user_id, "url": f"https://example.com/new/{i}", "title": f"New {i}", "description": "",
+            "tags": " ".join(rng.sample(vocabulary, rng.randint(0, 5))),
+        }
+        for i in range(args.updates)
+    ])
+    db.commit()
+    for row in added[: args.updates // 2]:
+        service.delete_bookmark(db, row.id, user_id)
+    rebuilt = RelatedTagIndex()
+    rebuilt.related(db, user_id, "", args.k)
+    incremental_matches = {
+        name: dict(row) for name, row in matrix.rows.items()
+    } == {
+        name: dict(row) for name, row in rebuilt._indexes[user_id].rows.items()
+    }
+    db.close()
+
+    return {
+        "bookmarks": args.bookmarks,
+        "tags": len(by_popularity),
+        "k": args.k,
+        "build_ms": build_ms,
+        "build_peak_kib": round(peak / 1024, 1),
+        "stored_pairs": sum(len(row) for row in matrix.rows.values()),
+        "queries": queries,
+        "checked_tags": len(sample),
+        "mismatched_tags": wrong[:5],
+        "incremental_updates": args.updates + args.updates // 2,
+        "incremental_matches_rebuild": incremental_matches,
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the related-tags index against an on-demand self-join.")
+    parser.add_argument("--bookmarks", type=int, default=100000, help="bookmarks in the corpus")
+    parser.add_argument("--tags", type=int, default=2000, help="size of the tag vocabulary")
+    parser.add_argument("--tags-per-bookmark", type=int, default=3, help="mean tags per bookmark")
+    parser.add_argument("-k", type=int, default=10, help="related tags per query")
+    parser.add_argument("--runs", type=int, default=5, help="timed self-join passes; medians are reported")
+    parser.add_argument("--check", type=int, default=200, help="tags whose results are compared with the self-join")
+    parser.add_argument("--updates", type=int, default=1000, help="bookmarks added (half then deleted) incrementally")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    print(json.dumps(run(parse_args(argv)), indent=2))
+
+if __name__ == "__main__":
+    main()
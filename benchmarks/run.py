@@ -0,0 +1,291 @@
+"""Benchmark harness for StupidBookmarks.
+
+Seeds a throwaway SQLite database with a synthetic corpus, drives the FastAPI
+app in-process and prints a JSON report with throughput and latency
+percentiles per endpoint plus Netscape import speed.
+
+Usage:
+    python -m benchmarks.run --bookmarks 100000 --output bench.json
+    python -m benchmarks.run --compare bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.corpus import (
+    CorpusConfig, build_folder_tree, generate_bookmarks, render_netscape_html
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def summarize(durations: List[float], elapsed: float) -> Dict[str, Any]:
+    """Turn raw per-call durations (seconds) into a report entry."""
+    ordered = sorted(durations)
+    ms = lambda value: round(value * 1000, 3)
+    return {
+        "requests": len(durations),
+        "throughput_rps": round(len(durations) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        "p50_ms": ms(percentile(ordered, 50)),
+        "p90_ms": ms(percentile(ordered, 90)),
+        "p99_ms": ms(percentile(ordered, 99)),
+        "max_ms": ms(ordered[-1]) if ordered else 0.0,
+    }
+
+def measure(fn: Callable[[], Any], requests: int, warmup: int) -> Dict[str, Any]:
+    """Call ``fn`` repeatedly and summarize its latency."""
+    for _ in range(warmup):
+        fn()
+
+    durations = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - t0)
+    return summarize(durations, time.perf_counter() - started)
+
+def seed_database(db, user_id: int, bookmarks) -> None:
+    """Bulk-load a synthetic corpus straight into the tables."""
+    from models.models import Bookmark, Tag, user_tags
+
+    tag_names = sorted({name for bookmark in bookmarks for name in bookmark.tags})
+    if tag_names:
+        db.execute(Tag.__table__.insert(), [{"name": name, "user_id": user_id} for name in tag_names])
+    tag_ids = dict(db.query(Tag.name, Tag.id).filter(Tag.user_id == user_id).all())
+
+    next_id = (db.query(Bookmark.id).order_by(Bookmark.id.desc()).limit(1).scalar() or 0) + 1
+    chunk_size = 5000
+    for start in range(0, len(bookmarks), chunk_size):
+        chunk = bookmarks[start:start + chunk_size]
+        rows, links = [], []
+        for offset, bookmark in enumerate(chunk):
+            bookmark_id = next_id + start + offset
+            rows.append({
+                "id": bookmark_id,
+                "url": bookmark.url,
+                "title": bookmark.title,
+                "description": bookmark.description,
+                "created_at": bookmark.created_at,
+                "user_id": user_id,
+            })
+            links.extend({"bookmark_id": bookmark_id, "tag_id": tag_ids[name]} for name in bookmark.tags)
+        db.execute(Bookmark.__table__.insert(), rows)
+        if links:
+            db.execute(user_tags.insert(), links)
+    db.commit()
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Seed, benchmark and return the report."""
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-bench-")
+    db_path = args.db or os.path.join(workdir, "bench.db")
+    if os.path.exists(db_path):
+        raise SystemExit(f"Refusing to benchmark against existing database {db_path}")
+
+    # The app reads DATABASE_URL at import time and resolves templates/static
+    # relative to the working directory.
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    # Measure the app, not the API rate limiter or a backup or link check kicking in mid-run
+    os.environ["API_RATE_LIMIT"] = "0"
+    os.environ["BACKUP_INTERVAL_HOURS"] = "0"
+    os.environ["LINK_CHECK_INTERVAL_HOURS"] = "0"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from fastapi.testclient import TestClient
+    import main as app_module
+    import version
+    from models.database import SessionLocal
+    from models.models import User
+
+    config = CorpusConfig(
+        bookmarks=args.bookmarks,
+        tags=args.tags,
+        tags_per_bookmark=args.tags_per_bookmark,
+        zipf_s=args.zipf,
+        seed=args.seed,
+    )
+    bookmarks = generate_bookmarks(config)
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "version": version.__version__,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "corpus": vars(config),
+            "requests_per_endpoint": args.requests,
+        },
+        "endpoints": {},
+    }
+
+    with TestClient(app_module.app) as client:
+        db = SessionLocal()
+        try:
+            user = db.query(User).first()
+            t0 = time.perf_counter()
+            seed_database(db, user.id, bookmarks)
+            report["meta"]["seed_seconds"] = round(time.perf_counter() - t0, 3)
+            api_key = app_module.api_service.create_api_key(db, user.id, "benchmark").raw_key
+            user_id = user.id
+        finally:
+            db.close()
+
+        response = client.post("/login", data={"password": args.password}, follow_redirects=False)
+        if response.status_code != 302:
+            raise SystemExit("Login failed; pass --password if DEFAULT_ADMIN_PASSWORD is set")
+        client.cookies = response.cookies
+        headers = {"Authorization": f"Bearer {api_key}"}
+
+        tag_counts = Counter(name for bookmark in bookmarks for name in bookmark.tags)
+        top_tag = tag_counts.most_common(1)[0][0] if tag_counts else "python"
+        middle_page = max(1, args.bookmarks // 20 // 2)
+        dates = sorted(bookmark.created_at for bookmark in bookmarks)
+        middle_month = dates[len(dates) // 2].strftime("%Y-%m") if dates else "2024-01"
+
+        def get(path: str, **kwargs) -> Callable[[], None]:
+            def call():
+                response = client.get(path, **kwargs)
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {path} returned {response.status_code}")
+            return call
+
+        def tag_cloud():
+            db = SessionLocal()
+            try:
+                app_module.bookmark_service.get_tag_cloud(db, user_id)
+            finally:
+                db.close()
+
+        cases = {
+            "GET /": get("/"),
+            "GET /?page={middle}": get(f"/?page={middle_page}"),
+            "GET /tags/{tag}": get(f"/tags/{top_tag}"),
+            "GET /api/bookmarks": get("/api/bookmarks", headers=headers),
+            "GET /api/bookmarks?tag={tag}": get(f"/api/bookmarks?tag={top_tag}", headers=headers),
+            "GET /api/bookmarks?sort=title": get("/api/bookmarks?sort=title", headers=headers),
+            "GET /api/bookmarks?sort=domain": get("/api/bookmarks?sort=domain", headers=headers),
+            "GET /api/bookmarks?since={month}&sort=title": get(
+                f"/api/bookmarks?since={middle_month}-01&until={middle_month}-28&sort=title", headers=headers
+            ),
+            "GET /api/bookmarks/histogram": get("/api/bookmarks/histogram", headers=headers),
+            "GET /api/tags": get("/api/tags", headers=headers),
+            "get_tag_cloud": tag_cloud,
+        }
+        for name, fn in cases.items():
+            print(f"Benchmarking {name}...", file=sys.stderr)
+            report["endpoints"][name] = measure(fn, args.requests, args.warmup)
+
+        # Netscape import into a separate user so it doesn't skew the listings
+        import_bookmarks = generate_bookmarks(CorpusConfig(
+            bookmarks=args.import_links, tags=args.tags,
+            tags_per_bookmark=args.tags_per_bookmark, zipf_s=args.zipf, seed=args.seed + 1
+        ))
+        html = render_netscape_html(build_folder_tree(
+            import_bookmarks, depth=args.folder_depth, fanout=args.folder_fanout, seed=args.seed
+        ))
+        db = SessionLocal()
+        try:
+            importer = User(username="benchmark-import", password_hash="!")
+            db.add(importer)
+            db.commit()
+            print(f"Benchmarking import of {len(import_bookmarks)} links...", file=sys.stderr)
+            t0 = time.perf_counter()
+            result = app_module.get_export_service().import_netscape_html(db, importer.id, html)
+            elapsed = time.perf_counter() - t0
+        finally:
+            db.close()
+        report["import"] = {
+            "links": len(import_bookmarks),
+            "bytes": len(html.encode()),
+            "imported": result["imported"],
+            "skipped": result["skipped"],
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(result["imported"] / elapsed, 2) if elapsed else 0.0,
+        }
+
+    return report
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    """Human-readable p50/throughput deltas against an earlier report."""
+    lines = [f"Compared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):"]
+    for name, stats in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before["p50_ms"]:
+            continue
+        change = (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+        lines.append(f"  {name:40s} p50 {before['p50_ms']:>9.2f} -> {stats['p50_ms']:>9.2f} ms ({change:+.1f}%)")
+    if "import" in current and "import" in baseline:
+        lines.append(
+            f"  {'import rows/s':40s}     {baseline['import']['rows_per_second']:>9.1f} -> "
+            f"{current['import']['rows_per_second']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark StupidBookmarks against a synthetic corpus.")
+    parser.add_argument("--bookmarks", type=int, default=10000, help="bookmarks in the listing corpus")
+    parser.add_argument("--tags", type=int, default=500, help="size of the tag vocabulary")
+    parser.add_argument("--tags-per-bookmark", type=int, default=3, help="mean tags per bookmark")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of tag popularity")
+    parser.add_argument("--import-links", type=int, default=2000, help="links in the Netscape import file")
+    parser.add_argument("--folder-depth", type=int, default=3, help="nesting depth of import folders")
+    parser.add_argument("--folder-fanout", type=int, default=4, help="max subfolders per import folder")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per endpoint")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default=os.getenv("DEFAULT_ADMIN_PASSWORD", "admin"))
+    parser.add_argument("--db", help="SQLite file to create (default: a temp directory)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Keep the app's own console chatter out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+
+    payload = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Write throughput of shared vs per-user storage as tenants are added.
+
+For each storage mode and tenant count, creates a fresh data directory
+with that many users, then runs one process per tenant adding that
+user's bookmarks one transaction at a time (what a lone API add costs)
+for a fixed duration. With shared storage every commit queues on the one
+database's write lock; with ``STORAGE_MODE=per_user`` each tenant commits
+to a file of its own.
+
+Usage:
+    python -m benchmarks.sharding --tenants 1 2 4 8 --duration 10
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import REPO_ROOT, git_commit, summarize
+
+def storage_env(data_dir: str, mode: str) -> Dict[str, str]:
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'stupidbookmarks.db')}",
+        "STORAGE_MODE": mode,
+        "SHARD_DIR": os.path.join(data_dir, "users"),
+        "LOG_LEVEL": "WARNING",
+    }
+
+def _use_env(env: Dict[str, str]):
+    # Storage settings are read on import, so this runs in a fresh (spawned) process
+    os.environ.update(env)
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+def create_tenants(env: Dict[str, str], tenants: int) -> List[int]:
+    _use_env(env)
+    from models.database import SessionLocal, init_db
+    from services.auth_service import AuthService
+
+    init_db()
+    auth = AuthService()
+    db = SessionLocal()
+    try:
+        return [auth.create_user(db, f"tenant{i}", "benchmark", is_admin=i == 0).id for i in range(tenants)]
+    finally:
+        db.close()
+
+def tenant_process(env: Dict[str, str], user_id: int, duration: float, start_at: float) -> List[float]:
+    """Add bookmarks for ``user_id`` one commit at a time; returns commit latencies."""
+    _use_env(env)
+    from models.database import SessionLocal, user_session
+    from services.bookmark_service import BookmarkService
+
+    service = BookmarkService()
+    db = user_session(SessionLocal, user_id)
+    durations = []
+    try:
+        time.sleep(max(0.0, start_at - time.time()))
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            service.insert_bookmarks(db, [{
+                "user_id": user_id,
+                "url": f"https://tenant{user_id}.example/{len(durations)}",
+                "title": f"Bookmark {len(durations)}",
+                "description": "",
+                "tags": "benchmark",
+            }])
+            db.commit()
+            durations.append(time.perf_counter() - t0)
+    finally:
+        db.close()
+    return durations
+
+def measure(mode: str, tenants: int, duration: float) -> Dict[str, Any]:
+    env = storage_env(tempfile.mkdtemp(prefix=f"stupidbookmarks-{mode}-"), mode)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        user_ids = pool.submit(create_tenants, env, tenants).result()
+
+    # Imports take a while; everyone starts writing at the same moment
+    start_at = time.time() + 3
+    with ProcessPoolExecutor(tenants, mp_context=context) as pool:
+        futures = [pool.submit(tenant_process, env, user_id, duration, start_at) for user_id in user_ids]
+        results = [future.result() for future in futures]
+
+    commits = [d for durations in results for d in durations]
+    entry = {"mode": mode, "tenants": tenants}
+    entry.update(summarize(commits, duration))
+    entry["per_tenant_rps"] = [round(len(durations) / duration, 1) for durations in results]
+    return entry
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare write throughput of shared and per-user storage.")
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 2, 4, 8], help="tenant processes writing at once")
+    parser.add_argument("--modes", nargs="+", default=["shared", "per_user"], choices=["shared", "per_user"])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of writes per run")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "duration_seconds": args.duration,
+        },
+        "runs": [],
+    }
+    for tenants in args.tenants:
+        for mode in args.modes:
+            print(f"Benchmarking {mode} storage with {tenants} tenant(s)...", file=sys.stderr)
+            report["runs"].append(measure(mode, tenants, args.duration))
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+if __name__ == "__main__":
+    main()
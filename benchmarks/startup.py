@@ -0,0 +1,134 @@
+"""Startup profile: import-time budget and time to first request.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter,
+checks that modules meant to load lazily stay out of startup, and times
+how long a freshly spawned uvicorn takes to answer its first request.
+
+Usage:
+    python -m benchmarks.startup                  # report only
+    python -m benchmarks.startup --check          # exit 1 if over budget
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+from benchmarks.run import REPO_ROOT, git_commit
+
+# Modules that must only be imported on first use, not when the app starts
+LAZY_MODULES = ("bs4", "requests", "passlib", "services.export_service", "uvicorn")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+def app_env(workdir: str) -> Dict[str, str]:
+    return dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        LOG_LEVEL="WARNING",
+    )
+
+def profile_imports(workdir: str) -> Dict[str, Any]:
+    """Import ``main`` under ``-X importtime`` and summarize the output."""
+    probe = "import sys, main; print(','.join(m for m in sys.argv[1:] if m in sys.modules))"
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe, *LAZY_MODULES],
+        cwd=REPO_ROOT, env=app_env(workdir), capture_output=True, text=True, check=True,
+    )
+
+    total_us = 0
+    by_package: Dict[str, int] = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = int(match[1]), int(match[2]), match[3], match[4]
+        package = module.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+        if module == "main" and not indent:
+            total_us = cumulative_us
+
+    eager = [name for name in completed.stdout.strip().split(",") if name]
+    heaviest = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:15]
+    return {
+        "import_main_ms": round(total_us / 1000, 1),
+        "heaviest_packages_ms": {name: round(us / 1000, 1) for name, us in heaviest},
+        "eagerly_imported_lazy_modules": eager,
+    }
+
+def time_to_first_request(workdir: str) -> float:
+    """Seconds from spawning uvicorn until ``/login`` answers."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=REPO_ROOT, env=app_env(workdir),
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+            if time.perf_counter() - started > 60:
+                raise RuntimeError("uvicorn did not answer within 60 seconds")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Profile StupidBookmarks startup.")
+    parser.add_argument("--runs", type=int, default=3, help="repetitions; medians are reported")
+    parser.add_argument("--budget-ms", type=float, default=600.0, help="max time to import main")
+    parser.add_argument("--check", action="store_true", help="exit 1 if the budget or lazy imports are violated")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="stupidbookmarks-startup-")
+
+    # The first run creates the database; time warm starts like a container restart
+    time_to_first_request(workdir)
+    profiles = [profile_imports(workdir) for _ in range(args.runs)]
+    first_request = [time_to_first_request(workdir) for _ in range(args.runs)]
+
+    report = {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "import_main_ms": statistics.median(p["import_main_ms"] for p in profiles),
+        "time_to_first_request_ms": round(statistics.median(first_request) * 1000, 1),
+        "budget_ms": args.budget_ms,
+        "heaviest_packages_ms": profiles[-1]["heaviest_packages_ms"],
+        "eagerly_imported_lazy_modules": profiles[-1]["eagerly_imported_lazy_modules"],
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.check:
+        problems = []
+        if report["import_main_ms"] > args.budget_ms:
+            problems.append(f"import main took {report['import_main_ms']} ms (budget {args.budget_ms} ms)")
+        if report["eagerly_imported_lazy_modules"]:
+            problems.append(f"imported at startup: {', '.join(report['eagerly_imported_lazy_modules'])}")
+        if problems:
+            print("Startup check failed: " + "; ".join(problems), file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
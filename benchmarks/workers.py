@@ -0,0 +1,205 @@
+"""Throughput of a real uvicorn deployment at different worker counts.
+
+Seeds one SQLite database, then for each worker count starts
+``uvicorn main:app --workers N`` on a local port and drives it with
+concurrent HTTP clients (a mix of page views, API reads and API writes)
+for a fixed duration.
+
+Usage:
+    python -m benchmarks.workers --workers 1 2 4 8 --output workers.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks.corpus import CorpusConfig, generate_bookmarks
+from benchmarks.run import REPO_ROOT, git_commit, summarize
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def prepare_database(db_path: str, config: CorpusConfig) -> Tuple[str, str]:
+    """Create and seed the database; return (API key, most used tag)."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    from benchmarks.run import seed_database
+    from models.database import SessionLocal, init_db
+    from services.api_service import APIService
+    from services.auth_service import AuthService
+
+    init_db()
+    bookmarks = generate_bookmarks(config)
+    db = SessionLocal()
+    try:
+        user = AuthService().create_default_user(db, password="admin")
+        seed_database(db, user.id, bookmarks)
+        api_key = APIService().create_api_key(db, user.id, "benchmark").raw_key
+    finally:
+        db.close()
+
+    counts: Dict[str, int] = {}
+    for bookmark in bookmarks:
+        for name in bookmark.tags:
+            counts[name] = counts.get(name, 0) + 1
+    return api_key, max(counts, key=counts.get) if counts else "python"
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 60.0):
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/login", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("uvicorn did not come up in time")
+
+def client_process(
+    base_url: str, api_key: str, tag: str, threads: int, duration: float, write_ratio: float, seed: int
+) -> Tuple[List[float], int]:
+    """Run ``threads`` closed-loop clients; return latencies and error count."""
+    import requests
+
+    def worker(worker_seed: int) -> Tuple[List[float], int]:
+        rng = random.Random(worker_seed)
+        session = requests.Session()
+        # Sign in once for the page views (session cookies are signed)
+        session.post(base_url + "/login", data={"password": "admin"}, allow_redirects=False, timeout=60)
+        headers = {"Authorization": f"Bearer {api_key}"}
+        reads = [
+            ("GET", "/", {}),
+            ("GET", f"/tags/{tag}", {}),
+            ("GET", "/api/bookmarks", {"headers": headers}),
+            ("GET", "/api/tags", {"headers": headers}),
+        ]
+        durations, errors = [], 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if rng.random() < write_ratio:
+                method, path = "POST", "/api/bookmarks"
+                kwargs = {"headers": headers, "json": {
+                    "url": f"https://bench.example/{worker_seed}/{rng.random()}",
+                    "title": "Benchmark bookmark",
+                    "tags": "benchmark load",
+                }}
+            else:
+                method, path, kwargs = rng.choice(reads)
+            t0 = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, timeout=60, **kwargs)
+                if response.status_code >= 400:
+                    errors += 1
+            except requests.RequestException:
+                errors += 1
+            durations.append(time.perf_counter() - t0)
+        return durations, errors
+
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(worker, range(seed, seed + threads)))
+    return [d for durations, _ in results for d in durations], sum(errors for _, errors in results)
+
+def measure_workers(args: argparse.Namespace, workers: int, db_path: str, api_key: str, tag: str) -> Dict[str, Any]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        WEB_CONCURRENCY=str(workers),
+        LOG_LEVEL="WARNING",
+        API_RATE_LIMIT="0",
+        BACKUP_INTERVAL_HOURS="0",
+        LINK_CHECK_INTERVAL_HOURS="0",
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT, env=env,
+    )
+    try:
+        wait_until_up(base_url, process)
+        threads = max(1, args.concurrency // args.client_processes)
+        started = time.perf_counter()
+        with ProcessPoolExecutor(args.client_processes) as pool:
+            futures = [
+                pool.submit(client_process, base_url, api_key, tag, threads,
+                            args.duration, args.write_ratio, i * 1000)
+                for i in range(args.client_processes)
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    durations = [d for chunk, _ in results for d in chunk]
+    entry = {"workers": workers, "errors": sum(errors for _, errors in results)}
+    entry.update(summarize(durations, elapsed))
+    return entry
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark throughput across uvicorn worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--bookmarks", type=int, default=10000)
+    parser.add_argument("--tags", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent client connections")
+    parser.add_argument("--client-processes", type=int, default=4, help="processes generating load")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load per worker count")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of requests that create bookmarks")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.output) if args.output else None
+    db_path = os.path.join(tempfile.mkdtemp(prefix="stupidbookmarks-workers-"), "bench.db")
+
+    config = CorpusConfig(bookmarks=args.bookmarks, tags=args.tags, seed=args.seed)
+    api_key, tag = prepare_database(db_path, config)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "corpus": vars(config),
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "write_ratio": args.write_ratio,
+        },
+        "runs": [],
+    }
+    for workers in args.workers:
+        print(f"Benchmarking {workers} worker(s)...", file=sys.stderr)
+        report["runs"].append(measure_workers(args, workers, db_path, api_key, tag))
+
+    payload = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Logging setup for StupidBookmarks.
+
+Log records are handed to a queue and written by a background thread, so
+request and import code never blocks on stdout. Configured through
+environment variables:
+
+- ``LOG_LEVEL``: root level (default ``INFO``)
+- ``LOG_LEVELS``: per-module overrides, e.g.
+  ``services.export_service=DEBUG,sqlalchemy.engine=INFO``
+- ``LOG_FORMAT``: ``json`` (default) or ``text``
+- ``LOG_SAMPLE_EVERY``: keep one in N per-item debug records (default 100)
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any ``extra=`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key != "sampled":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Let through one in ``every`` records logged with ``extra={"sampled": True}``.
+
+    Meant for per-item debug logs in loops (one per imported link, one per
+    fetch attempt) so turning on DEBUG doesn't flood the log pipeline.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False):
+            return True
+        return next(self._counter) % self.every == 0
+
+def setup_logging():
+    """Route all logging through a queue to a single stdout writer thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JSONFormatter()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(int(os.getenv("LOG_SAMPLE_EVERY", "100"))))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    for override in os.getenv("LOG_LEVELS", "").split(","):
+        if "=" in override:
+            name, level = override.split("=", 1)
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
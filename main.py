@@ -1,17 +1,3 @@
-#!/usr/bimport os
-from fastapi import FastAPI, Request, Depends, HTTPException, Form, status, File, UploadFile
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-import uvicorn
-from typing import Optional, List, Dict, Any
-import secrets
-import hashlib
-from datetime import datetime
-import io
-from pydantic import BaseModel, Field, HttpUrl, field_validator
 """
 StupidBookmarks - A fast, minimalistic bookmark manager built with FastAPI and Tailwind CSS.
 
@@ -19,46 +5,106 @@ Vibe Coding Project Notice:
 This project is developed in a freeform, improvisational, and experimental style.
 """
 
+import asyncio
 import os
+import logging
+import secrets
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Optional, List
+from urllib.parse import quote, urlencode
 from fastapi import FastAPI, Request, Depends, HTTPException, Form, status, UploadFile, File
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-import uvicorn
-from typing import Optional, List, Dict, Any
-import secrets
-import hashlib
-from datetime import datetime
-from pydantic import BaseModel, Field, HttpUrl, validator
+from pydantic import BaseModel, Field, field_validator
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from models.database import get_db, init_db
-from models.models import User, Bookmark, Tag, APIKey, user_tags
+from logging_config import setup_logging
+setup_logging()
+logger = logging.getLogger("stupidbookmarks")
+
+from models.database import (
+    ReadSessionLocal, SessionLocal, get_db, get_read_db, init_db, engine, read_engine, shard_router, startup_lock, user_session, WORKERS
+)
 from services.bookmark_service import BookmarkService
 from services.auth_service import AuthService
 from services.api_service import APIService
-from services.export_service import BookmarkExportService
+from services.tag_service import TagService, parse_tag_names
+from services.tag_suggest import tag_suggestions
+from services.tag_related import related_tags
+from services.bookmark_formats import MEDIA_TYPES
+from services.bookmark_reader import HISTOGRAM_INTERVALS, SORT_ORDERS, BookmarkRow
+from services.backup_service import BACKUP_INTERVAL_HOURS, BackupError, backup_service
+from services.rate_limit import API_MAX_LIMIT, Overloaded, RateLimitMiddleware, expensive_operations
+from services.write_coalescer import write_coalescer
+from services.link_checker import LINK_CHECK_INTERVAL_HOURS, link_checker
+from services.archive_service import ARCHIVE_INTERVAL_HOURS, SNAPSHOT_HEADERS, page_archiver, parse_range
+from services.duplicate_index import duplicate_index
+from services.change_events import EventStreamResponse, change_events
+from services.instrumentation import InstrumentationMiddleware, instrument_engine, metrics
+from services.profiling import (
+    PROFILING_ENABLED, ProfilerBusy, ProfilingMiddleware, list_profiles, profile_path, profile_report,
+    profiled_iterator, run_in_threadpool, stack_sampler
+)
+from assets.build import ensure_built, load_manifest
 import version
-from contextlib import asynccontextmanager
+
+# Logical asset name -> content-hashed file under /static/css
+asset_manifest = load_manifest()
+
+def bootstrap():
+    """Create the schema and default user exactly once, even with many workers."""
+    with startup_lock():
+        # RESTORE_FROM: rebuild a missing database from a snapshot before anything opens it
+        backup_service.restore_if_missing()
+        init_db()
+        # Rebuild the stylesheet when templates changed since the last build
+        ensure_built()
+        asset_manifest.update(load_manifest())
+        db = next(get_db())
+        try:
+            if not auth_service.get_user(db):
+                auth_service.create_default_user(db)
+            auth_service.ensure_admin(db)
+        finally:
+            db.close()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan manager for the application."""
     # Startup
-    init_db()
-    db = next(get_db())
-    try:
-        if not auth_service.get_user(db):
-            auth_service.create_default_user(db)
-    finally:
-        db.close()
+    bootstrap()
+    write_coalescer.start()
+    background_tasks = []
+    if backup_service.supported and BACKUP_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(backup_service.run_schedule()))
+    if LINK_CHECK_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(link_checker.run_schedule()))
+    if ARCHIVE_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(page_archiver.run_schedule()))
+    change_events.start()
+    # Index bookmarks added before near-duplicate detection existed, and give them domains to sort by
+    background_tasks.append(asyncio.create_task(run_in_threadpool(duplicate_index.run_backfill)))
+    background_tasks.append(asyncio.create_task(run_in_threadpool(bookmark_service.run_domain_backfill)))
     yield
-    # Shutdown - nothing to do here for now
+    # Shutdown: commit queued bookmark adds before exiting
+    for task in background_tasks:
+        task.cancel()
+    change_events.close()
+    link_checker.stop()
+    duplicate_index.stop()
+    await run_in_threadpool(page_archiver.stop)
+    await run_in_threadpool(write_coalescer.stop)
+    if shard_router is not None:
+        shard_router.close_all()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -75,11 +121,63 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+def is_admin_request(scope) -> bool:
+    """Whether a request carries the admin's API key or browser session."""
+    request = Request(scope)
+    db = ReadSessionLocal()
+    try:
+        scheme, _, key = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and key.strip():
+            user = api_service.authenticate_api_key(db, key.strip())
+        else:
+            user = auth_service.get_current_user(request, db)
+        return bool(user and user.is_admin)
+    finally:
+        db.close()
+
+# Profile requests sent with an X-Profile header by the admin (innermost, so only the app is measured)
+app.add_middleware(ProfilingMiddleware, authorize=is_admin_request)
+
+# Per-API-key rate limit (inside instrumentation, so 429s are counted too)
+app.add_middleware(RateLimitMiddleware)
+
+# Request timing, query counting and /metrics
+instrument_engine(engine)
+if read_engine is not engine:
+    instrument_engine(read_engine)
+if shard_router is not None:
+    shard_router.on_create.append(instrument_engine)
+app.add_middleware(InstrumentationMiddleware)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail},
+        headers={"Retry-After": exc.retry_after_header}
+    )
+
+class CachedStaticFiles(StaticFiles):
+    """Static files with long-lived caching for content-hashed assets."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if os.path.basename(full_path) in asset_manifest.values():
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
 # Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
+
+def asset_url(name: str) -> str:
+    """URL of a built asset, e.g. ``asset_url("app.css")``."""
+    return f"/static/css/{asset_manifest.get(name, name)}"
 
 # Templates
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset_url"] = asset_url
 
 # API Models
 class BookmarkCreateRequest(BaseModel):
@@ -120,6 +218,130 @@ class TagResponse(BaseModel):
             }
         }
 
+class TagSuggestionResponse(BaseModel):
+    name: str
+    count: int
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "python",
+                "count": 5
+            }
+        }
+
+class RelatedTagResponse(BaseModel):
+    name: str
+    count: int = Field(..., description="Bookmarks tagged with both tags")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "django",
+                "count": 12
+            }
+        }
+
+class TagRenameRequest(BaseModel):
+    name: str = Field(..., description="Current tag name")
+    new_name: str = Field(..., description="New tag name; if it already exists the tags are merged")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "js",
+                "new_name": "javascript"
+            }
+        }
+
+class TagMergeRequest(BaseModel):
+    sources: List[str] = Field(..., description="Tags to merge; they are deleted afterwards")
+    target: str = Field(..., description="Tag that receives all of their bookmarks (created if missing)")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "sources": ["js", "javscript"],
+                "target": "javascript"
+            }
+        }
+
+class BulkRetagRequest(BaseModel):
+    add: List[str] = Field([], description="Tags to add to every matching bookmark")
+    remove: List[str] = Field([], description="Tags to remove from every matching bookmark")
+    tag: Optional[str] = Field(None, description="Only bookmarks with this tag")
+    bookmark_ids: Optional[List[int]] = Field(None, description="Only these bookmarks")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "add": ["reading-list"],
+                "remove": ["imported"],
+                "tag": "imported"
+            }
+        }
+
+class TagChangeResponse(BaseModel):
+    added: int = Field(..., description="Bookmark-tag links created")
+    removed: int = Field(..., description="Bookmark-tag links removed")
+
+class BrokenLinkResponse(BaseModel):
+    id: int
+    url: str
+    title: str
+    status: Optional[int] = Field(None, description="HTTP status of the final response")
+    error: Optional[str] = Field(None, description="timeout, connection or request when no response came back")
+    final_url: Optional[str] = Field(None, description="Where redirects ended up")
+    last_checked: Optional[str] = None
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 1,
+                "url": "https://example.com/old-page",
+                "title": "Example Website",
+                "status": 404,
+                "error": None,
+                "final_url": "https://example.com/new-home",
+                "last_checked": "2025-07-03T12:34:56.789Z"
+            }
+        }
+
+class DuplicateMatch(BaseModel):
+    id: int
+    url: str
+    title: str
+    created_at: Optional[str] = None
+    similarity: float = Field(..., description="Share of URL, title and description words in common; 1.0 for the same normalized URL")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": 7,
+                "url": "https://example.com/article",
+                "title": "Example Article",
+                "created_at": "2025-07-03T12:34:56.789Z",
+                "similarity": 0.82
+            }
+        }
+
+class DuplicateReportResponse(BaseModel):
+    groups: List[List[DuplicateMatch]] = Field(..., description="Bookmarks that look alike, oldest first; similarity is to the oldest")
+    total_groups: int
+    unindexed: int = Field(..., description="Bookmarks not indexed yet, so not in the report")
+
+class HistogramBucket(BaseModel):
+    period: str = Field(..., description="YYYY, YYYY-MM or YYYY-MM-DD (UTC)")
+    count: int
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "period": "2024-03",
+                "count": 42
+            }
+        }
+
 class BookmarkResponse(BaseModel):
     id: int
     url: str
@@ -142,54 +364,211 @@ class BookmarkResponse(BaseModel):
             }
         }
 
+class BookmarkCreateResponse(BookmarkResponse):
+    possible_duplicates: List[DuplicateMatch] = Field([], description="Existing bookmarks that look like the same page")
+
 # Initialize services
 bookmark_service = BookmarkService()
 auth_service = AuthService()
 api_service = APIService()
-export_service = BookmarkExportService()
+tag_service = TagService()
+_export_service = None
+
+def get_export_service():
+    """Import/export service, created on first use (it pulls in BeautifulSoup)."""
+    global _export_service
+    if _export_service is None:
+        from services.export_service import BookmarkExportService
+        _export_service = BookmarkExportService()
+    return _export_service
 
 # Security
 security = HTTPBearer(auto_error=False)
 
+def export_response(user_id: int, export_format: str) -> StreamingResponse:
+    """Stream an export; it gets its own session because it outlives the request's."""
+    if export_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown export format: {export_format}")
+    
+    # Held until the stream ends; the background task covers clients that disconnect early
+    slot = expensive_operations.acquire()
+    
+    def generate():
+        db = user_session(ReadSessionLocal, user_id)
+        try:
+            yield from get_export_service().export_records(db, user_id, export_format)
+        finally:
+            db.close()
+            slot.release()
+    
+    media_type, extension = MEDIA_TYPES[export_format]
+    filename = f"bookmarks_{datetime.now().strftime('%Y%m%d')}.{extension}"
+    return StreamingResponse(profiled_iterator(generate()), media_type=media_type, headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    }, background=BackgroundTask(slot.release))
+
+def snapshot_response(request: Request, snapshot) -> Response:
+    """Serve an archived page from its gzip file, honouring byte ranges."""
+    path = page_archiver.blob_path(snapshot.content_hash)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    
+    media_type = snapshot.content_type or "application/octet-stream"
+    headers = {**SNAPSHOT_HEADERS, "Vary": "Accept-Encoding", "Cache-Control": "private, max-age=3600"}
+    if "gzip" not in request.headers.get("accept-encoding", ""):
+        headers["ETag"] = f'"{snapshot.content_hash}"'
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        return StreamingResponse(page_archiver.read_decompressed(path), media_type=media_type, headers=headers)
+    
+    # Ranges apply to the gzip bytes, which is what is sent
+    length = os.path.getsize(path)
+    headers.update({"ETag": f'"{snapshot.content_hash}.gz"', "Content-Encoding": "gzip", "Accept-Ranges": "bytes"})
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        byte_range = parse_range(request.headers.get("range"), length)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+    if byte_range and request.headers.get("if-range", headers["ETag"]) != headers["ETag"]:
+        byte_range = None
+    
+    start, end = byte_range or (0, length - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    return StreamingResponse(
+        page_archiver.read_range(path, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=headers
+    )
+
+
+def _resolve_title_committed(url: str, title: Optional[str]) -> str:
+    """Resolve a bookmark title, committing the page metadata cache row it writes."""
+    # Own session: the request's is closed uncommitted before the coalesced add
+    with SessionLocal() as db:
+        title = bookmark_service.resolve_title(db, url, title)
+        db.commit()
+    return title
+
+
+async def add_bookmark_coalesced(
+    db: Session, user_id: int, url: str, title: Optional[str], description: Optional[str], tags: Optional[str]
+) -> BookmarkRow:
+    """Add one bookmark through the write coalescer, fetching its title first if needed."""
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    if not title or not title.strip():
+        # Fetching the title can take seconds; keep it off the event loop and capped
+        with expensive_operations.slot():
+            title = await run_in_threadpool(_resolve_title_committed, url, title)
+    # Give the request's connection back to the pool while waiting: the writer
+    # needs one to commit, and a burst of waiting requests could hold them all
+    db.close()
+    return await write_coalescer.add({
+        "user_id": user_id, "url": url, "title": title, "description": description or "", "tags": tags or "",
+    })
+
+
+# Number of bookmarks per page in the HTML views - adjust this if you want more bookmarks per page
+PAGE_SIZE = 20
+# "Often used with" tags listed on a tag page
+RELATED_TAGS_SHOWN = 8
+# Groups listed on the possible duplicates page
+DUPLICATE_GROUPS_SHOWN = 100
+# How the list views name each sort order
+SORT_LABELS = {"newest": "Newest first", "oldest": "Oldest first", "title": "By title", "domain": "By domain"}
+
+def parse_day(value: Optional[str]) -> Optional[date]:
+    """A ``YYYY-MM-DD`` query parameter from a list view's form; empty or malformed means no limit."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def bookmark_page(
+    db: Session,
+    user_id: int,
+    tag: Optional[str],
+    page: int,
+    sort: str = "newest",
+    since: Optional[str] = None,
+    until: Optional[str] = None
+) -> dict:
+    """One page of bookmarks plus the pagination and list options the list templates need."""
+    sort = sort if sort in SORT_ORDERS else SORT_ORDERS[0]
+    since_day, until_day = parse_day(since), parse_day(until)
+    offset = (page - 1) * PAGE_SIZE if page > 0 else 0
+    bookmarks = bookmark_service.get_bookmarks(
+        db, user_id, tag_filter=tag, limit=PAGE_SIZE, offset=offset, sort=sort, since=since_day, until=until_day
+    )
+    total_bookmarks = bookmark_service.count_bookmarks(db, user_id, tag_filter=tag, since=since_day, until=until_day)
+    total_pages = (total_bookmarks + PAGE_SIZE - 1) // PAGE_SIZE  # Ceiling division
+    options = {"sort": sort, "since": since_day.isoformat() if since_day else "", "until": until_day.isoformat() if until_day else ""}
+    return {
+        "bookmarks": bookmarks,
+        "list_options": options,
+        "sort_orders": SORT_LABELS,
+        "pagination": {
+            "current_page": page,
+            "total_pages": total_pages,
+            "total_bookmarks": total_bookmarks,
+            # Appended to page links so they keep the sort order and date range
+            "query": "".join("&" + urlencode({name: value}) for name, value in options.items() if value and value != SORT_ORDERS[0])
+        }
+    }
+
 @app.get("/", response_class=HTMLResponse)
 async def index(
     request: Request, 
     tag: Optional[str] = None, 
     page: int = 1,
-    db: Session = Depends(get_db)
+    duplicates_of: Optional[int] = None,
+    sort: str = "newest",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    """Main bookmarks page with optional tag filtering and pagination."""
+    """Main bookmarks page with optional tag filtering, sorting, date range and pagination.
+    
+    ``duplicates_of`` (set after adding a bookmark that looks like an existing
+    one) shows that bookmark's possible duplicates above the list.
+    """
     user = auth_service.get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    # Pagination configuration
-    page_size = 20  # Number of bookmarks per page - adjust this if you want more bookmarks per page
-    offset = (page - 1) * page_size if page > 0 else 0
-    
-    # Get bookmarks with pagination
-    bookmarks = bookmark_service.get_bookmarks(
-        db, user.id, tag_filter=tag, limit=page_size, offset=offset
-    )
-    
-    # Get total count for pagination
-    total_bookmarks = bookmark_service.count_bookmarks(db, user.id, tag_filter=tag)
-    total_pages = (total_bookmarks + page_size - 1) // page_size  # Ceiling division
-    
-    # Get tag cloud
-    tags = bookmark_service.get_tag_cloud(db, user.id)
-    
     return templates.TemplateResponse("index.html", {
         "request": request,
-        "bookmarks": bookmarks,
-        "tags": tags,
+        "tags": bookmark_service.get_tag_cloud(db, user.id),
         "current_tag": tag,
+        "possible_duplicates": duplicate_index.similar_to(db, user.id, duplicates_of) if duplicates_of else None,
         "user": user,
-        "pagination": {
-            "current_page": page,
-            "total_pages": total_pages,
-            "total_bookmarks": total_bookmarks
-        }
+        **bookmark_page(db, user.id, tag, page, sort, since, until)
+    })
+
+@app.get("/fragments/", response_class=HTMLResponse, include_in_schema=False)
+async def index_fragment(
+    request: Request,
+    tag: Optional[str] = None,
+    page: int = 1,
+    sort: str = "newest",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Header and bookmark list of the main page, without the layout or tag cloud."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return HTMLResponse("", status_code=401)
+
+    return templates.TemplateResponse("partials/fragment.html", {
+        "request": request,
+        "sections_template": "partials/index_sections.html",
+        "current_tag": tag,
+        **bookmark_page(db, user.id, tag, page, sort, since, until)
     })
 
 @app.get("/login", response_class=HTMLResponse)
@@ -198,63 +577,85 @@ async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
 @app.post("/login")
-async def login(request: Request, password: str = Form(...), db: Session = Depends(get_db)):
-    """Handle login."""
-    user = auth_service.authenticate(db, password)
+async def login(
+    request: Request,
+    password: str = Form(...),
+    username: str = Form(""),
+    db: Session = Depends(get_db)
+):
+    """Handle login; without a username, signs in the admin."""
+    user = auth_service.authenticate(db, password, username.strip() or None)
     if not user:
         return templates.TemplateResponse("login.html", {
             "request": request,
-            "error": "Invalid password"
+            "username": username,
+            "error": "Invalid username or password" if username.strip() else "Invalid password"
         })
     
     response = RedirectResponse(url="/", status_code=302)
-    auth_service.create_session(response, user.id)
+    auth_service.create_session(db, response, user)
     return response
 
 @app.get("/logout")
-async def logout():
-    """Handle logout."""
+async def logout(request: Request, db: Session = Depends(get_db)):
+    """Handle logout; signs the user out on every device."""
+    user = auth_service.get_current_user(request, db)
+    if user:
+        auth_service.revoke_sessions(db, user)
     response = RedirectResponse(url="/login", status_code=302)
     auth_service.clear_session(response)
     return response
 
 @app.get("/tags/{tag_name}", response_class=HTMLResponse)
-async def tag_page(request: Request, tag_name: str, page: int = 1, db: Session = Depends(get_db)):
+async def tag_page(
+    request: Request,
+    tag_name: str,
+    page: int = 1,
+    sort: str = "newest",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
     """Show bookmarks for a specific tag with pagination."""
     user = auth_service.get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    # Pagination configuration
-    page_size = 20  # Number of bookmarks per page - same as main index
-    offset = (page - 1) * page_size if page > 0 else 0
-    
-    # Get bookmarks with pagination
-    bookmarks = bookmark_service.get_bookmarks(
-        db, user.id, tag_filter=tag_name, limit=page_size, offset=offset
-    )
-    
-    # Get total count for pagination
-    total_bookmarks = bookmark_service.count_bookmarks(db, user.id, tag_filter=tag_name)
-    total_pages = (total_bookmarks + page_size - 1) // page_size  # Ceiling division
-    
-    tags = bookmark_service.get_tag_cloud(db, user.id)
-    
     return templates.TemplateResponse("tag.html", {
         "request": request,
-        "bookmarks": bookmarks,
-        "tags": tags,
+        "tags": bookmark_service.get_tag_cloud(db, user.id),
         "tag_name": tag_name,
+        "related_tags": related_tags.related(db, user.id, tag_name, limit=RELATED_TAGS_SHOWN),
         "user": user,
-        "pagination": {
-            "current_page": page,
-            "total_pages": total_pages,
-            "total_bookmarks": total_bookmarks
-        }
+        **bookmark_page(db, user.id, tag_name, page, sort, since, until)
+    })
+
+@app.get("/fragments/tags/{tag_name}", response_class=HTMLResponse, include_in_schema=False)
+async def tag_fragment(
+    request: Request,
+    tag_name: str,
+    page: int = 1,
+    sort: str = "newest",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    """Header and bookmark list of a tag page, without the layout or tag cloud."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return HTMLResponse("", status_code=401)
+
+    return templates.TemplateResponse("partials/fragment.html", {
+        "request": request,
+        "sections_template": "partials/tag_sections.html",
+        "tag_name": tag_name,
+        "current_tag": tag_name,
+        "related_tags": related_tags.related(db, user.id, tag_name, limit=RELATED_TAGS_SHOWN),
+        **bookmark_page(db, user.id, tag_name, page, sort, since, until)
     })
 
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_page(request: Request, db: Session = Depends(get_db)):
+async def admin_page(request: Request, db: Session = Depends(get_read_db)):
     """Admin dashboard."""
     user = auth_service.get_current_user(request, db)
     if not user:
@@ -267,17 +668,139 @@ async def admin_page(request: Request, db: Session = Depends(get_db)):
         "request": request,
         "stats": stats,
         "api_keys": api_keys,
+        "link_health": link_checker.summary(db, user.id),
+        "link_check_running": link_checker.running,
+        "link_check_progress": link_checker.progress,
+        "broken_links": link_checker.broken_links(db, user.id, limit=20),
+        "archive": page_archiver.summary(db, user.id),
+        "archive_running": page_archiver.running,
+        "archive_progress": page_archiver.progress,
+        "backups_supported": backup_service.supported and user.is_admin,
+        "backups": backup_service.list_snapshots() if backup_service.supported and user.is_admin else [],
+        "profiling_enabled": PROFILING_ENABLED and user.is_admin,
+        "profiles": list_profiles()[:10] if PROFILING_ENABLED and user.is_admin else [],
+        "users": auth_service.get_users(db) if user.is_admin else [],
+        "per_user_storage": shard_router is not None,
         "user": user
     })
 
+@app.post("/admin/backups")
+async def create_backup(request: Request, db: Session = Depends(get_db)):
+    """Take a database snapshot now."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only the admin can take backups")
+    
+    try:
+        snapshot = await run_in_threadpool(backup_service.create_snapshot)
+    except (BackupError, OSError) as e:
+        logger.exception("Error creating backup")
+        return RedirectResponse(url=f"/admin?error=backup_failed&message={quote(str(e))}", status_code=302)
+    
+    return RedirectResponse(url=f"/admin?success=backup_created&name={quote(snapshot['name'])}", status_code=302)
+
+@app.get("/admin/backups/{name}")
+async def download_backup(name: str, request: Request, db: Session = Depends(get_read_db)):
+    """Download a snapshot (gzip-compressed SQLite database)."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only the admin can download backups")
+    
+    path = backup_service.snapshot_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    
+    return FileResponse(path, media_type="application/gzip", filename=name)
+
+@app.get("/admin/profiles/{name}")
+async def view_profile(
+    name: str,
+    request: Request,
+    format: str = "text",
+    sort: str = "cumulative",
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """A saved request profile: the pstats table, or the raw file with ``format=pstats``."""
+    if credentials:
+        user = api_service.authenticate_api_key(db, credentials.credentials)
+    else:
+        user = auth_service.get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key" if credentials else "API key required")
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only the admin can view profiles")
+    
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=name)
+    if sort not in ("cumulative", "tottime", "calls"):
+        raise HTTPException(status_code=400, detail="sort must be cumulative, tottime or calls")
+    return PlainTextResponse(await run_in_threadpool(profile_report, path, sort))
+
+@app.get("/admin/profile/sample")
+async def sample_stacks(
+    request: Request,
+    seconds: float = 10,
+    interval_ms: float = 10,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """Sample every thread's stack for ``seconds`` and return them collapsed for a flamegraph."""
+    if credentials:
+        user = api_service.authenticate_api_key(db, credentials.credentials)
+    else:
+        user = auth_service.get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key" if credentials else "API key required")
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only the admin can sample stacks")
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    db.close()  # don't hold a connection while sampling
+    
+    try:
+        stacks = await run_in_threadpool(stack_sampler.capture, seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    filename = f"stacks_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.folded"
+    return PlainTextResponse(stacks, headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.post("/admin/links/check")
+async def check_links(request: Request, db: Session = Depends(get_db)):
+    """Start checking this user's stale links in the background."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    started = link_checker.start(user.id)
+    return RedirectResponse(url=f"/admin?success=link_check_{'started' if started else 'running'}", status_code=302)
+
+@app.post("/admin/archive/capture")
+async def capture_pages(request: Request, db: Session = Depends(get_db)):
+    """Start archiving this user's pages in the background."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    started = page_archiver.start(user.id)
+    return RedirectResponse(url=f"/admin?success=archive_{'started' if started else 'running'}", status_code=302)
+
 @app.get("/admin/export/netscape", response_class=HTMLResponse)
-async def export_bookmarks_netscape(request: Request, db: Session = Depends(get_db)):
+async def export_bookmarks_netscape(request: Request, db: Session = Depends(get_read_db)):
     """Export bookmarks in Netscape HTML format."""
     user = auth_service.get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    html_content = export_service.export_netscape_html(db, user.id)
+    with expensive_operations.slot():
+        html_content = await run_in_threadpool(get_export_service().export_netscape_html, db, user.id)
     
     headers = {
         "Content-Disposition": f"attachment; filename=bookmarks_{datetime.now().strftime('%Y%m%d')}.html"
@@ -293,49 +816,83 @@ async def import_bookmarks_netscape(
 ):
     """Import bookmarks from Netscape HTML format."""
     try:
-        print(f"Received file upload: {bookmark_file.filename}, content type: {bookmark_file.content_type}")
-        
         user = auth_service.get_current_user(request, db)
         if not user:
             raise HTTPException(status_code=401, detail="Not authenticated")
         
         content = await bookmark_file.read()
-        print(f"Read {len(content)} bytes from uploaded file")
         
         # Try to detect encoding, fallback to utf-8
         try:
             html_content = content.decode("utf-8")
         except UnicodeDecodeError:
-            print("UTF-8 decoding failed, trying with ISO-8859-1")
+            logger.info("UTF-8 decoding failed, trying with ISO-8859-1", extra={"upload": bookmark_file.filename})
             html_content = content.decode("ISO-8859-1")
         
-        print(f"Decoded HTML content, length: {len(html_content)}")
+        with expensive_operations.slot():
+            result = await run_in_threadpool(get_export_service().import_netscape_html, db, user.id, html_content)
         
-        # Print first 100 chars to verify content
-        print(f"Content preview: {html_content[:100]}...")
+        return RedirectResponse(
+            url=f"/admin?success=bookmarks_imported&imported={result['imported']}&skipped={result['skipped']}"
+                f"&duplicates={result['possible_duplicates']}",
+            status_code=302
+        )
+    except Exception as e:
+        logger.exception("Error in import endpoint")
         
-        result = export_service.import_netscape_html(db, user.id, html_content)
+        return RedirectResponse(
+            url=f"/admin?error=import_failed&message={str(e)}",
+            status_code=302
+        )
+
+@app.get("/admin/export/{export_format}")
+async def export_bookmarks(export_format: str, request: Request, db: Session = Depends(get_read_db)):
+    """Export bookmarks as NDJSON, CSV or Pinboard JSON."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    return export_response(user.id, export_format)
+
+@app.post("/admin/import")
+async def import_bookmarks(
+    request: Request,
+    import_format: str = Form("netscape"),
+    bookmark_file: UploadFile = File(...),
+    db: Session = Depends(get_db)
+):
+    """Import bookmarks from Netscape HTML, NDJSON, CSV or Pinboard JSON."""
+    if import_format == "netscape":
+        return await import_bookmarks_netscape(request, bookmark_file, db)
+    
+    try:
+        user = auth_service.get_current_user(request, db)
+        if not user:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        if import_format not in MEDIA_TYPES:
+            raise ValueError(f"Unknown import format: {import_format}")
         
-        # Log the result
-        print(f"Import result: {result}")
+        with expensive_operations.slot():
+            result = await run_in_threadpool(
+                get_export_service().import_records, db, user.id, import_format, bookmark_file.file
+            )
         
         return RedirectResponse(
-            url=f"/admin?success=bookmarks_imported&imported={result['imported']}&skipped={result['skipped']}",
+            url=f"/admin?success=bookmarks_imported&imported={result['imported']}&skipped={result['skipped']}"
+                f"&duplicates={result['possible_duplicates']}",
             status_code=302
         )
     except Exception as e:
-        print(f"Error in import endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in import endpoint")
         
         return RedirectResponse(
-            url=f"/admin?error=import_failed&message={str(e)}",
+            url=f"/admin?error=import_failed&message={quote(str(e))}",
             status_code=302
         )
 
 # Human-friendly API documentation
 @app.get("/api/docs/help", response_class=HTMLResponse)
-async def api_docs_page(request: Request, db: Session = Depends(get_db)):
+async def api_docs_page(request: Request, db: Session = Depends(get_read_db)):
     """Human-friendly API documentation page."""
     user = auth_service.get_current_user(request, db)
     if not user:
@@ -363,24 +920,56 @@ async def add_bookmark(
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    bookmark_service.add_bookmark(db, user.id, url, title, description, tags)
+    bookmark = await add_bookmark_coalesced(db, user.id, url, title, description, tags)
+    if duplicate_index.similar_to(db, user.id, bookmark.id, limit=1):
+        return RedirectResponse(url=f"/?duplicates_of={bookmark.id}", status_code=302)
     return RedirectResponse(url="/", status_code=302)
 
 @app.post("/bookmarks/{bookmark_id}/delete")
-async def delete_bookmark(bookmark_id: int, request: Request, db: Session = Depends(get_db)):
-    """Delete a bookmark."""
+async def delete_bookmark(bookmark_id: int, request: Request, next: str = Form("/"), db: Session = Depends(get_db)):
+    """Delete a bookmark, then go back to ``next`` (a path on this site)."""
     user = auth_service.get_current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
     bookmark_service.delete_bookmark(db, bookmark_id, user.id)
-    return RedirectResponse(url="/", status_code=302)
+    if not next.startswith("/") or next.startswith("//"):
+        next = "/"
+    return RedirectResponse(url=next, status_code=302)
 
-# Admin functions
-@app.post("/admin/change-password")
-async def change_password(
-    request: Request,
-    current_password: str = Form(...),
+@app.get("/duplicates", response_class=HTMLResponse)
+async def duplicates_page(request: Request, db: Session = Depends(get_read_db)):
+    """Possible duplicates report."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    with expensive_operations.slot():
+        report = await run_in_threadpool(duplicate_index.report, db, user.id, DUPLICATE_GROUPS_SHOWN)
+    return templates.TemplateResponse("duplicates.html", {
+        "request": request,
+        "threshold": duplicate_index.threshold,
+        "user": user,
+        **report
+    })
+
+@app.get("/bookmarks/{bookmark_id}/snapshot")
+async def view_snapshot(bookmark_id: int, request: Request, db: Session = Depends(get_read_db)):
+    """View the archived copy of a bookmarked page."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    snapshot = page_archiver.get_snapshot(db, bookmark_id, user.id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return snapshot_response(request, snapshot)
+
+# Admin functions
+@app.post("/admin/change-password")
+async def change_password(
+    request: Request,
+    current_password: str = Form(...),
     new_password: str = Form(...),
     db: Session = Depends(get_db)
 ):
@@ -393,7 +982,44 @@ async def change_password(
         return RedirectResponse(url="/admin?error=invalid_password", status_code=302)
     
     auth_service.change_password(db, user.id, new_password)
-    return RedirectResponse(url="/admin?success=password_changed", status_code=302)
+    # Other sessions are signed out; this one gets a new cookie
+    response = RedirectResponse(url="/admin?success=password_changed", status_code=302)
+    auth_service.create_session(db, response, user)
+    return response
+
+@app.post("/admin/users")
+async def create_user(
+    request: Request,
+    username: str = Form(...),
+    password: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Add a user (admin only)."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only the admin can add users")
+    
+    username = username.strip()
+    if not username or len(username) > 50:
+        return RedirectResponse(url="/admin?error=invalid_username", status_code=302)
+    if auth_service.create_user(db, username, password) is None:
+        return RedirectResponse(url="/admin?error=user_exists", status_code=302)
+    return RedirectResponse(url=f"/admin?success=user_created&name={quote(username)}", status_code=302)
+
+@app.post("/admin/users/{user_id}/delete")
+async def delete_user(user_id: int, request: Request, db: Session = Depends(get_db)):
+    """Delete a user and all their bookmarks (admin only; the admin can't be deleted)."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Only the admin can delete users")
+    
+    if not await run_in_threadpool(auth_service.delete_user, db, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    return RedirectResponse(url="/admin?success=user_deleted", status_code=302)
 
 @app.post("/admin/api-keys/generate")
 async def generate_api_key(
@@ -447,31 +1073,86 @@ async def delete_all_bookmarks(
         status_code=302
     )
 
+@app.post("/admin/tags/merge")
+async def admin_merge_tags(
+    request: Request,
+    sources: str = Form(...),
+    target: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Rename one tag, or merge several into a target tag."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    try:
+        source_names = parse_tag_names(sources)
+        if len(source_names) == 1:
+            result = tag_service.rename_tag(db, user.id, source_names[0], target)
+        else:
+            result = tag_service.merge_tags(db, user.id, source_names, target)
+    except (LookupError, ValueError) as e:
+        return RedirectResponse(url=f"/admin?error=tags_failed&message={quote(str(e))}", status_code=302)
+    
+    return RedirectResponse(
+        url=f"/admin?success=tags_updated&added={result['added']}&removed={result['removed']}",
+        status_code=302
+    )
+
+@app.post("/admin/tags/bulk")
+async def admin_bulk_retag(
+    request: Request,
+    tag_filter: str = Form(""),
+    add: str = Form(""),
+    remove: str = Form(""),
+    db: Session = Depends(get_db)
+):
+    """Add and remove tags on every bookmark with a given tag (or all bookmarks)."""
+    user = auth_service.get_current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    try:
+        result = tag_service.bulk_retag(db, user.id, add=[add], remove=[remove], tag_filter=tag_filter or None)
+    except (LookupError, ValueError) as e:
+        return RedirectResponse(url=f"/admin?error=tags_failed&message={quote(str(e))}", status_code=302)
+    
+    return RedirectResponse(
+        url=f"/admin?success=tags_updated&added={result['added']}&removed={result['removed']}",
+        status_code=302
+    )
+
 # API routes
 @app.get(
     "/api/bookmarks", 
     response_model=List[BookmarkResponse],
     summary="Get all bookmarks",
-    description="Retrieve a list of bookmarks with optional filtering by tag",
+    description="Retrieve a list of bookmarks with optional filtering by tag and date, in a chosen order",
     tags=["bookmarks"],
     responses={
         200: {"description": "List of bookmarks"},
-        401: {"description": "Authentication failed - Invalid or missing API key"}
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        422: {"description": "Unknown sort order or malformed date"}
     }
 )
 async def api_get_bookmarks(
     tag: Optional[str] = None,
     limit: int = 50,
     offset: int = 0,
+    sort: str = "newest",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get a list of bookmarks with optional filtering
     
     - **tag**: Filter bookmarks by tag name
-    - **limit**: Maximum number of bookmarks to return (default: 50)
+    - **limit**: Maximum number of bookmarks to return (default: 50, max: 500 unless `API_MAX_LIMIT` says otherwise)
     - **offset**: Number of bookmarks to skip (default: 0)
+    - **sort**: `newest` (default), `oldest`, `title` (A-Z, ignoring case) or `domain` (A-Z, newest first within each)
+    - **since** / **until**: Only bookmarks added on or after / on or before this day (`YYYY-MM-DD`, UTC)
     
     Authentication required: Bearer Token with valid API key
     """
@@ -482,12 +1163,17 @@ async def api_get_bookmarks(
     if not user:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    bookmarks = bookmark_service.get_bookmarks(db, user.id, tag_filter=tag, limit=limit, offset=offset)
-    return [bookmark_service.bookmark_to_dict(bookmark) for bookmark in bookmarks]
+    if sort not in SORT_ORDERS:
+        raise HTTPException(status_code=422, detail=f"Unknown sort order: {sort} (use {', '.join(SORT_ORDERS)})")
+    limit = max(1, min(limit, API_MAX_LIMIT))
+    bookmarks = bookmark_service.get_bookmarks(
+        db, user.id, tag_filter=tag, limit=limit, offset=max(0, offset), sort=sort, since=since, until=until
+    )
+    return [bookmark.to_dict() for bookmark in bookmarks]
 
 @app.post(
     "/api/bookmarks", 
-    response_model=BookmarkResponse,
+    response_model=BookmarkCreateResponse,
     summary="Create a new bookmark",
     description="Add a new bookmark with title, URL and optional tags",
     tags=["bookmarks"],
@@ -511,6 +1197,9 @@ async def api_add_bookmark(
     - **description**: Description of the bookmark (optional)
     - **tags**: Comma or space separated list of tags (optional)
     
+    The bookmark is always added; `possible_duplicates` lists existing
+    bookmarks that look like the same page.
+    
     Authentication required: Bearer Token with valid API key
     """
     if not credentials:
@@ -520,7 +1209,7 @@ async def api_add_bookmark(
     if not user:
         raise HTTPException(status_code=401, detail="Invalid API key")
     
-    bookmark = bookmark_service.add_bookmark(
+    bookmark = await add_bookmark_coalesced(
         db, user.id,
         bookmark_data.url,
         bookmark_data.title,
@@ -528,7 +1217,7 @@ async def api_add_bookmark(
         bookmark_data.tags
     )
     
-    return bookmark_service.bookmark_to_dict(bookmark)
+    return {**bookmark.to_dict(), "possible_duplicates": duplicate_index.similar_to(db, user.id, bookmark.id)}
 
 @app.get(
     "/api/tags", 
@@ -543,7 +1232,7 @@ async def api_add_bookmark(
 )
 async def api_get_tags(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Get tag cloud with usage statistics
@@ -561,6 +1250,405 @@ async def api_get_tags(
     
     return bookmark_service.get_tag_cloud(db, user.id)
 
+@app.get(
+    "/api/tags/suggest",
+    response_model=List[TagSuggestionResponse],
+    summary="Suggest tags",
+    description="Autocomplete tag names by prefix, most used first",
+    tags=["tags"],
+    responses={
+        200: {"description": "Matching tags with usage counts"},
+        401: {"description": "Authentication failed - Invalid or missing API key"}
+    }
+)
+async def api_suggest_tags(
+    request: Request,
+    prefix: str = "",
+    limit: int = 10,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Suggest tags starting with a prefix
+    
+    - **prefix**: Beginning of the tag name (case-insensitive; empty returns the most used tags)
+    - **limit**: Maximum number of suggestions (default: 10, max: 50)
+    
+    Served from an in-memory index, so it is cheap enough to call on every keystroke.
+    
+    Authentication required: Bearer Token with valid API key (or a logged-in browser session)
+    """
+    if credentials:
+        user = api_service.authenticate_api_key(db, credentials.credentials)
+    else:
+        user = auth_service.get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key" if credentials else "API key required")
+    
+    return tag_suggestions.suggest(db, user.id, prefix, limit=max(1, min(limit, 50)))
+
+@app.get(
+    "/api/tags/{tag_name}/related",
+    response_model=List[RelatedTagResponse],
+    summary="Related tags",
+    description="Tags most often used on the same bookmarks as this one",
+    tags=["tags"],
+    responses={
+        200: {"description": "Related tags with the number of bookmarks they share, most shared first"},
+        401: {"description": "Authentication failed - Invalid or missing API key"}
+    }
+)
+async def api_related_tags(
+    tag_name: str,
+    request: Request,
+    limit: int = 10,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Tags often used together with a tag
+    
+    - **tag_name**: The tag (case-insensitive); an unknown tag returns an empty list
+    - **limit**: Maximum number of tags (default: 10, max: 50)
+    
+    Served from an in-memory co-occurrence index.
+    
+    Authentication required: Bearer Token with valid API key (or a logged-in browser session)
+    """
+    if credentials:
+        user = api_service.authenticate_api_key(db, credentials.credentials)
+    else:
+        user = auth_service.get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key" if credentials else "API key required")
+    
+    return related_tags.related(db, user.id, tag_name, limit=max(1, min(limit, 50)))
+
+@app.post(
+    "/api/tags/rename",
+    response_model=TagChangeResponse,
+    summary="Rename a tag",
+    description="Rename a tag on all bookmarks at once, merging into the new name if it already exists",
+    tags=["tags"],
+    responses={
+        200: {"description": "Tag renamed"},
+        400: {"description": "Invalid tag name"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        404: {"description": "Tag not found"}
+    }
+)
+async def api_rename_tag(
+    rename: TagRenameRequest,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """
+    Rename a tag
+    
+    - **name**: Current tag name
+    - **new_name**: New tag name (merged into that tag if it already exists)
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    try:
+        return tag_service.rename_tag(db, user.id, rename.name, rename.new_name)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post(
+    "/api/tags/merge",
+    response_model=TagChangeResponse,
+    summary="Merge tags",
+    description="Move all bookmarks of several tags to one target tag and delete the source tags",
+    tags=["tags"],
+    responses={
+        200: {"description": "Tags merged"},
+        400: {"description": "Invalid tag names or no existing source tags"},
+        401: {"description": "Authentication failed - Invalid or missing API key"}
+    }
+)
+async def api_merge_tags(
+    merge: TagMergeRequest,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """
+    Merge tags into one
+    
+    - **sources**: Tags to merge (deleted afterwards)
+    - **target**: Tag that receives their bookmarks (created if missing)
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    try:
+        return tag_service.merge_tags(db, user.id, merge.sources, merge.target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post(
+    "/api/bookmarks/retag",
+    response_model=TagChangeResponse,
+    summary="Bulk add/remove tags",
+    description="Add and remove tags on every bookmark matching a filter in one transaction",
+    tags=["bookmarks"],
+    responses={
+        200: {"description": "Tags updated"},
+        400: {"description": "Nothing to add or remove, or invalid tag names"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        404: {"description": "Filter tag not found"}
+    }
+)
+async def api_bulk_retag(
+    retag: BulkRetagRequest,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """
+    Add and remove tags on many bookmarks
+    
+    - **add**: Tags to add
+    - **remove**: Tags to remove
+    - **tag**: Only bookmarks with this tag (optional)
+    - **bookmark_ids**: Only these bookmarks (optional; without any filter all bookmarks are changed)
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    try:
+        return tag_service.bulk_retag(
+            db, user.id,
+            add=retag.add,
+            remove=retag.remove,
+            tag_filter=retag.tag,
+            bookmark_ids=retag.bookmark_ids
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get(
+    "/api/bookmarks/export",
+    summary="Export bookmarks",
+    description="Stream all bookmarks as NDJSON, CSV or Pinboard-compatible JSON",
+    tags=["bookmarks"],
+    responses={
+        200: {"description": "The export file, streamed"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        404: {"description": "Unknown format"}
+    }
+)
+async def api_export_bookmarks(
+    format: str = "ndjson",
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Export all bookmarks
+    
+    - **format**: `ndjson` (default, lossless), `csv` or `pinboard`
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    return export_response(user.id, format)
+
+@app.post(
+    "/api/bookmarks/import",
+    summary="Import bookmarks",
+    description="Bulk import an NDJSON, CSV or Pinboard/Linkding JSON file sent as the request body",
+    tags=["bookmarks"],
+    responses={
+        200: {"description": "Import counts"},
+        400: {"description": "Unreadable file"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        404: {"description": "Unknown format"}
+    }
+)
+async def api_import_bookmarks(
+    request: Request,
+    format: str = "ndjson",
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """
+    Import bookmarks from the request body
+    
+    - **format**: `ndjson` (default), `csv` or `pinboard` (also reads Linkding's JSON)
+    
+    Titles are not fetched; tags, descriptions and timestamps are kept as given.
+    Nothing is skipped for looking like an existing bookmark, but such bookmarks
+    are counted in `possible_duplicates` (see `GET /api/bookmarks/duplicates`).
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail=f"Unknown import format: {format}")
+    
+    # Spool the body (to disk when large) so it can be parsed line by line
+    with expensive_operations.slot(), tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        try:
+            result = await run_in_threadpool(get_export_service().import_records, db, user.id, format, body)
+        except ValueError as e:  # includes UnicodeDecodeError and JSON errors
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    return {"imported": result["imported"], "skipped": result["skipped"], "possible_duplicates": result["possible_duplicates"]}
+
+@app.get(
+    "/api/bookmarks/duplicates",
+    response_model=DuplicateReportResponse,
+    summary="Possible duplicates",
+    description="Groups of bookmarks that look like the same page",
+    tags=["bookmarks"],
+    responses={
+        200: {"description": "Largest groups first"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        429: {"description": "Too many expensive requests in progress"}
+    }
+)
+async def api_duplicate_report(
+    limit: int = 50,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Report possible duplicates
+    
+    - **limit**: Maximum number of groups (default 50, max 500)
+    
+    Bookmarks are compared on the words of their normalized URL, title and
+    description, and grouped when at least `DUPLICATE_THRESHOLD` of them are
+    shared, or when their normalized URLs are the same.
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    with expensive_operations.slot():
+        return await run_in_threadpool(duplicate_index.report, db, user.id, max(1, min(limit, 500)))
+
+@app.get(
+    "/api/bookmarks/histogram",
+    response_model=List[HistogramBucket],
+    summary="Bookmarks over time",
+    description="How many bookmarks were added per year, month or day, for a timeline",
+    tags=["bookmarks"],
+    responses={
+        200: {"description": "Oldest period first; periods without bookmarks are left out"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        422: {"description": "Unknown interval or malformed date"}
+    }
+)
+async def api_bookmark_histogram(
+    request: Request,
+    interval: str = "month",
+    tag: Optional[str] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Count bookmarks per period
+    
+    - **interval**: `year`, `month` (default) or `day`
+    - **tag**: Only count bookmarks with this tag
+    - **since** / **until**: Only count bookmarks added in this range of days (`YYYY-MM-DD`, UTC, inclusive)
+    
+    Counted from an index on `user_id` and `created_at` without reading the bookmarks.
+    
+    Authentication required: Bearer Token with valid API key (or a logged-in browser session)
+    """
+    if credentials:
+        user = api_service.authenticate_api_key(db, credentials.credentials)
+    else:
+        user = auth_service.get_current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key" if credentials else "API key required")
+    
+    if interval not in HISTOGRAM_INTERVALS:
+        raise HTTPException(status_code=422, detail=f"Unknown interval: {interval} (use {', '.join(HISTOGRAM_INTERVALS)})")
+    return await run_in_threadpool(bookmark_service.get_histogram, db, user.id, interval, tag, since, until)
+
+@app.get(
+    "/api/bookmarks/{bookmark_id}/duplicates",
+    response_model=List[DuplicateMatch],
+    summary="Possible duplicates of a bookmark",
+    description="Bookmarks that look like the same page as this one",
+    tags=["bookmarks"],
+    responses={
+        200: {"description": "Most similar first"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        404: {"description": "Bookmark not found"}
+    }
+)
+async def api_bookmark_duplicates(
+    bookmark_id: int,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Possible duplicates of one bookmark
+    
+    - **bookmark_id**: ID of the bookmark
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    matches = duplicate_index.similar_to(db, user.id, bookmark_id)
+    if matches is None:
+        raise HTTPException(status_code=404, detail="Bookmark not found")
+    return matches
+
 @app.delete(
     "/api/bookmarks/{bookmark_id}", 
     summary="Delete a bookmark",
@@ -598,6 +1686,206 @@ async def api_delete_bookmark(
     
     return None
 
+@app.get(
+    "/api/links/broken",
+    response_model=List[BrokenLinkResponse],
+    summary="List broken links",
+    description="Bookmarks whose last link check got an error status or no response",
+    tags=["links"],
+    responses={
+        200: {"description": "Broken links, most recently checked first"},
+        401: {"description": "Authentication failed - Invalid or missing API key"}
+    }
+)
+async def api_broken_links(
+    limit: int = 50,
+    offset: int = 0,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    List broken links
+    
+    - **limit**: Maximum number of bookmarks to return (default: 50)
+    - **offset**: Number of bookmarks to skip (default: 0)
+    
+    Links are checked in the background every `LINK_CHECK_INTERVAL_HOURS`; see `POST /api/links/check`.
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    limit = max(1, min(limit, API_MAX_LIMIT))
+    return link_checker.broken_links(db, user.id, limit=limit, offset=max(0, offset))
+
+@app.post(
+    "/api/links/check",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Check links now",
+    description="Start checking stale links in the background",
+    tags=["links"],
+    responses={
+        202: {"description": "Check started, or one is already running"},
+        401: {"description": "Authentication failed - Invalid or missing API key"}
+    }
+)
+async def api_check_links(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """
+    Start a link check
+    
+    Checks links that were never checked or were last checked more than
+    `LINK_CHECK_MAX_AGE_DAYS` ago. Poll `GET /api/links/broken` for results.
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    return {"started": link_checker.start(user.id)}
+
+@app.get(
+    "/api/bookmarks/{bookmark_id}/snapshot",
+    summary="Get a page snapshot",
+    description="The archived copy of a bookmarked page",
+    tags=["archive"],
+    response_class=Response,
+    responses={
+        200: {"description": "The page as it was captured"},
+        206: {"description": "Part of the page, for a Range request"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        404: {"description": "Bookmark not found or not archived yet"},
+        416: {"description": "Range outside the snapshot"}
+    }
+)
+async def api_get_snapshot(
+    bookmark_id: int,
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Get a page snapshot
+    
+    - **bookmark_id**: ID of the bookmark
+    
+    Clients that accept gzip get the stored file as-is (`Content-Encoding: gzip`),
+    and `Range` requests count bytes of that gzip data. Other clients get the
+    original bytes. Pages are archived by `POST /api/archive/capture`.
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    snapshot = page_archiver.get_snapshot(db, bookmark_id, user.id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return snapshot_response(request, snapshot)
+
+@app.post(
+    "/api/archive/capture",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Archive pages now",
+    description="Start archiving bookmarked pages in the background",
+    tags=["archive"],
+    responses={
+        202: {"description": "Archiving started, or already running"},
+        401: {"description": "Authentication failed - Invalid or missing API key"}
+    }
+)
+async def api_capture_pages(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db)
+):
+    """
+    Start archiving pages
+    
+    Captures bookmarks that have no snapshot yet, and retries failed captures
+    older than `ARCHIVE_RETRY_DAYS`.
+    
+    Authentication required: Bearer Token with valid API key
+    """
+    if not credentials:
+        raise HTTPException(status_code=401, detail="API key required")
+        
+    user = api_service.authenticate_api_key(db, credentials.credentials)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    
+    return {"started": page_archiver.start(user.id)}
+
+@app.get(
+    "/api/events",
+    response_class=EventStreamResponse,
+    summary="Change events",
+    description="Server-sent events for bookmark and tag changes",
+    tags=["events"],
+    responses={
+        200: {"content": {"text/event-stream": {}}, "description": "An endless event stream"},
+        401: {"description": "Authentication failed - Invalid or missing API key"},
+        429: {"description": "Too many open event streams"}
+    }
+)
+async def api_events(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)
+):
+    """
+    Stream change events
+    
+    A `text/event-stream` that stays open and delivers `bookmark.created`,
+    `bookmark.deleted`, `bookmarks.deleted`, `bookmarks.imported`,
+    `tags.renamed`, `tags.merged` and `tags.retagged` events as they are
+    committed, with a comment line as heartbeat while idle. Send the last
+    received id as `Last-Event-ID` (EventSource does this itself) to get the
+    events missed while disconnected; a `reset` event means they are no
+    longer available and the client should reload.
+    
+    Authentication required: Bearer Token with valid API key (or a logged-in browser session)
+    """
+    # Authenticate without a session dependency, which would hold a connection for as long as the stream is open
+    db = ReadSessionLocal()
+    try:
+        if credentials:
+            user = api_service.authenticate_api_key(db, credentials.credentials)
+        else:
+            user = auth_service.get_current_user(request, db)
+        user_id = user.id if user else None
+    finally:
+        db.close()
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid API key" if credentials else "API key required")
+    
+    return EventStreamResponse(
+        change_events.open(user_id, request.headers.get("last-event-id")),
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    """Prometheus metrics. Set METRICS_TOKEN to require it as a Bearer token."""
+    token = os.getenv("METRICS_TOKEN")
+    if token and (not credentials or not secrets.compare_digest(credentials.credentials, token)):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     # Get host and port from environment variables, with fallback values
     host = os.getenv("HOST", "0.0.0.0")
@@ -606,4 +1894,9 @@ if __name__ == "__main__":
     # Development mode with auto-reload
     reload = os.getenv("ENVIRONMENT", "development").lower() != "production"
     
-    uvicorn.run("main:app", host=host, port=port, reload=reload)
+    # Run startup work once before forking so workers find it already done
+    bootstrap()
+    
+    # Multiple workers (WEB_CONCURRENCY) only make sense without reload
+    import uvicorn
+    uvicorn.run("main:app", host=host, port=port, reload=reload, workers=None if reload else WORKERS)
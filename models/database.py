@@ -1,29 +1,267 @@
 """Database configuration and session management."""
 
+import logging
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import quote
+from sqlalchemy import MetaData, create_engine, event, inspect, make_url, select, text, Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql.util import find_tables
+
+logger = logging.getLogger(__name__)
 
 # Database URL - defaults to SQLite
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/stupidbookmarks.db")
+DATA_DIR = "data"
 
 # Ensure data directory exists for SQLite
 if DATABASE_URL.startswith("sqlite"):
-    os.makedirs("data", exist_ok=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+# Number of uvicorn worker processes sharing the database (uvicorn reads the same variable)
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+def _pool_options(url: str = DATABASE_URL, budget: str = "DB_MAX_CONNECTIONS") -> Dict[str, Any]:
+    """Connection pool sizing, split across worker processes.
+
+    ``budget`` (DB_MAX_CONNECTIONS, or DB_READ_MAX_CONNECTIONS for the read
+    engine) is the number of connections for the whole host; each worker gets
+    an equal share unless DB_POOL_SIZE / DB_MAX_OVERFLOW are set explicitly.
+    """
+    if url.startswith("sqlite") and ":memory:" in url:
+        return {}
+    share = max(2, int(os.getenv(budget, os.getenv("DB_MAX_CONNECTIONS", "20"))) // WORKERS)
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", max(1, share // 2))),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", share - share // 2)),
+        "pool_pre_ping": not url.startswith("sqlite"),
+    }
 
 # Create engine
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+    # timeout: wait up to 30s for another process's write lock instead of failing
+    connect_args={"check_same_thread": False, "timeout": 30} if DATABASE_URL.startswith("sqlite") else {},
+    **_pool_options()
 )
 
-# Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers in other workers proceed while one worker writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # fsync on every commit, so a commit that returned survives power loss;
+    # batched adds (services/write_coalescer.py) keep this affordable
+    cursor.execute("PRAGMA synchronous=FULL")
+    cursor.close()
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
+# Read-only traffic (listings, tag pages, exports) uses its own engine and pool.
+# Unset, SQLite reopens the same file with mode=ro (under WAL, readers never wait
+# on the writer) and other backends use a read-only connection to DATABASE_URL;
+# set it to send reads to a replica instead.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", "")
+
+def _create_read_engine():
+    if READ_DATABASE_URL:
+        url = READ_DATABASE_URL
+    elif DATABASE_URL.startswith("sqlite"):
+        database = make_url(DATABASE_URL).database
+        if not database or database == ":memory:":
+            # Every in-memory connection is a separate database
+            return engine
+        url = f"sqlite:///file:{quote(os.path.abspath(database))}?mode=ro&uri=true"
+    else:
+        url = DATABASE_URL
+
+    if url.startswith("sqlite"):
+        connect_args = {"check_same_thread": False, "timeout": 30}
+    elif url.startswith("postgresql"):
+        connect_args = {"options": "-c default_transaction_read_only=on"}
+    else:
+        connect_args = {}
+    return create_engine(url, connect_args=connect_args, **_pool_options(url, "DB_READ_MAX_CONNECTIONS"))
+
+read_engine = _create_read_engine()
+
+# "shared": all users' bookmarks in DATABASE_URL. "per_user" (SQLite only): each
+# user's bookmarks, tags, snapshots and duplicate index in a file of their own
+# under SHARD_DIR, so tenants never wait on each other's writes; users, API keys
+# and the page title cache stay in DATABASE_URL.
+STORAGE_MODE = os.getenv("STORAGE_MODE", "shared")
+SHARD_DIR = os.getenv("SHARD_DIR", os.path.join(DATA_DIR, "users"))
+# Per-user databases kept open per worker, and how long an unused one stays open
+SHARD_MAX_OPEN = max(1, int(os.getenv("SHARD_MAX_OPEN", "64")))
+SHARD_IDLE_SECONDS = float(os.getenv("SHARD_IDLE_SECONDS", "300"))
+
+# Tables that stay in DATABASE_URL with per-user storage
+DIRECTORY_TABLES = frozenset({"users", "api_keys", "page_metadata"})
+
+if STORAGE_MODE not in ("shared", "per_user"):
+    logger.warning("Unknown STORAGE_MODE %r; using shared storage", STORAGE_MODE)
+    STORAGE_MODE = "shared"
+elif STORAGE_MODE == "per_user" and engine.dialect.name != "sqlite":
+    logger.warning("STORAGE_MODE=per_user needs a SQLite DATABASE_URL; using shared storage")
+    STORAGE_MODE = "shared"
+
+class ShardRouter:
+    """Opens, caches and closes the per-user databases of ``STORAGE_MODE=per_user``.
+
+    A user's file is created, with the shard tables, the first time it is
+    used. At most ``max_open`` engines stay open in a worker: the least
+    recently used is closed to make room, and engines unused for
+    ``idle_seconds`` are closed on the next lookup. Closing only drops
+    pooled connections, so a session still using one is unaffected.
+    """
+
+    def __init__(self, directory: str = SHARD_DIR, max_open: int = SHARD_MAX_OPEN, idle_seconds: float = SHARD_IDLE_SECONDS):
+        self.directory = directory
+        self.max_open = max_open
+        self.idle_seconds = idle_seconds
+        # Called with each engine as it is opened (e.g. to instrument it)
+        self.on_create: List[Callable[[Engine], None]] = []
+        self._lock = threading.Lock()
+        # user id -> (engine, last used), least recently used first
+        self._engines: "OrderedDict[int, list]" = OrderedDict()
+
+    def path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"{int(user_id)}.db")
+
+    def engine(self, user_id: int) -> Engine:
+        """The open engine for ``user_id``'s database, opening (and creating) it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._engines.get(user_id)
+            if entry is not None:
+                entry[1] = now
+                self._engines.move_to_end(user_id)
+                return entry[0]
+            shard = self._open(user_id)
+            self._engines[user_id] = [shard, now]
+            self._evict(now)
+            return shard
+
+    def user_ids(self) -> List[int]:
+        """Users that have a database file."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-3]) for name in os.listdir(self.directory) if name.endswith(".db") and name[:-3].isdigit())
+
+    def open_count(self) -> int:
+        return len(self._engines)
+
+    def close(self, user_id: int):
+        with self._lock:
+            entry = self._engines.pop(user_id, None)
+        if entry is not None:
+            entry[0].dispose()
+
+    def close_all(self):
+        with self._lock:
+            entries, self._engines = list(self._engines.values()), OrderedDict()
+        for shard, _ in entries:
+            shard.dispose()
+
+    def remove(self, user_id: int):
+        """Close and delete ``user_id``'s database."""
+        self.close(user_id)
+        path = self.path(user_id)
+        for leftover in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    def _open(self, user_id: int) -> Engine:
+        os.makedirs(self.directory, exist_ok=True)
+        url = f"sqlite:///{self.path(user_id)}"
+        # Same limits as the main engine; connections are only opened as requests need them
+        shard = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30}, **_pool_options(url))
+        event.listen(shard, "connect", _set_sqlite_pragmas)
+        # Another worker may be creating the same file
+        with file_lock(os.path.join(self.directory, ".schema.lock")):
+            tables = shard_tables()
+            Base.metadata.create_all(bind=shard, tables=tables)
+            _add_missing_columns(shard, tables)
+            _create_missing_indexes(shard, tables)
+        for hook in self.on_create:
+            hook(shard)
+        return shard
+
+    def _evict(self, now: float):
+        closing = []
+        while len(self._engines) > self.max_open:
+            closing.append(self._engines.popitem(last=False)[1][0])
+        for user_id, (shard, last_used) in list(self._engines.items()):
+            if now - last_used < self.idle_seconds:
+                break
+            closing.append(self._engines.pop(user_id)[0])
+        for shard in closing:
+            shard.dispose()
+
+shard_router = ShardRouter() if STORAGE_MODE == "per_user" else None
+
+class RoutingSession(Session):
+    """Session for per-user storage: statements on the directory tables go to
+    the session's own engine, everything else to the database of the user set
+    with ``route_to_user``."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if mapper is not None:
+            tables = mapper.tables
+        elif clause is not None:
+            tables = find_tables(clause, include_crud=True)
+        else:
+            tables = ()
+        if all(table.name in DIRECTORY_TABLES for table in tables):
+            return super().get_bind(mapper, clause=clause, **kw)
+        user_id = self.info.get("user_id")
+        if user_id is None:
+            raise RuntimeError("Per-user storage: route the session to a user before querying their data")
+        return shard_router.engine(user_id)
+
+def route_to_user(db: Session, user_id: Optional[int]):
+    """Send ``db``'s bookmark queries to ``user_id``'s database (a no-op with shared storage)."""
+    db.info["user_id"] = user_id
+
+def user_session(factory: Callable[[], Session], user_id: Optional[int]) -> Session:
+    """A new session from ``factory`` routed to ``user_id``."""
+    db = factory()
+    route_to_user(db, user_id)
+    return db
+
+def user_scopes(user_id: Optional[int] = None) -> List[Optional[int]]:
+    """What a background job covering ``user_id`` (None: everyone) has to visit.
+
+    With shared storage that is one pass over the shared database; with
+    per-user storage, each user's database in turn.
+    """
+    if user_id is not None or shard_router is None:
+        return [user_id]
+    from .models import User
+    with SessionLocal() as db:
+        return list(db.scalars(select(User.id).order_by(User.id)))
+
+# Session factories: SessionLocal for anything that writes, ReadSessionLocal for reads
+_session_class = RoutingSession if shard_router is not None else Session
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=_session_class)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, class_=_session_class)
 
 # Base class for models
 Base = declarative_base()
 
+def shard_tables() -> List[Table]:
+    """Tables kept in each user's database with per-user storage."""
+    from . import models  # Import here to avoid circular imports
+    return [table for table in Base.metadata.sorted_tables if table.name not in DIRECTORY_TABLES]
+
 def get_db():
     """Get database session."""
     db = SessionLocal()
@@ -32,7 +270,187 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """Get a read-only database session, for routes that never write."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def init_db():
     """Initialize database tables."""
     from . import models  # Import here to avoid circular imports
-    Base.metadata.create_all(bind=engine)
+    tables = Base.metadata.sorted_tables
+    if shard_router is not None:
+        # Users' own tables are created in their databases on first use
+        tables = [table for table in tables if table.name in DIRECTORY_TABLES]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    _add_missing_columns(engine, tables)
+    _add_sqlite_autoincrement(engine, tables)
+    _create_missing_indexes(engine, tables)
+
+# Arbitrary constant identifying the startup lock among PostgreSQL advisory locks
+STARTUP_LOCK_KEY = 7041950
+
+@contextmanager
+def startup_lock():
+    """Serialize one-time startup work (schema, default user) across workers.
+
+    Uses a PostgreSQL advisory lock when available, otherwise an exclusive
+    ``flock`` on a file in the data directory.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+        return
+
+    with file_lock(os.getenv("STARTUP_LOCK_FILE", os.path.join(DATA_DIR, ".startup.lock"))):
+        yield
+
+@contextmanager
+def file_lock(lock_path: str, blocking: bool = True):
+    """Hold an exclusive ``flock`` on ``lock_path``, yielding whether it was acquired.
+
+    With ``blocking=False`` this yields False right away if another process
+    holds the lock. Locking is skipped on Windows (single-process deployments
+    only), where this always yields True.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _add_missing_columns(bind: Engine = engine, tables: Optional[List[Table]] = None):
+    """Add nullable columns declared on the models that older databases lack.
+
+    Like indexes, ``create_all`` never alters existing tables. Columns that are
+    NOT NULL without a server default can't be added this way and are skipped.
+    """
+    inspector = inspect(bind)
+    for table in tables or Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning("Cannot add NOT NULL column %s.%s to an existing table", table.name, column.name)
+                continue
+            column_type = column.type.compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info("Added column %s.%s", table.name, column.name)
+
+def _add_sqlite_autoincrement(bind: Engine = engine, tables: Optional[List[Table]] = None):
+    """Rebuild SQLite tables declared ``sqlite_autoincrement`` that were created without it.
+
+    Without AUTOINCREMENT, SQLite reuses the highest id once its row is
+    deleted. ALTER TABLE can't add it, so the rows are copied into a new
+    table that replaces the old one; ``_create_missing_indexes`` then puts
+    the indexes back.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+    for table in tables or Base.metadata.sorted_tables:
+        if not table.dialect_options["sqlite"]["autoincrement"]:
+            continue
+        with bind.connect() as conn:
+            schema = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+            ).scalar()
+        if schema is None or "AUTOINCREMENT" in schema.upper():
+            continue
+        rebuilt = table.to_metadata(MetaData(), name=f"_{table.name}_rebuild")
+        columns = ", ".join(f'"{column.name}"' for column in table.columns)
+        with bind.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {rebuilt.name}"))
+            conn.execute(CreateTable(rebuilt))
+            conn.execute(text(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+        logger.info("Rebuilt table %s with AUTOINCREMENT ids", table.name)
+
+def _create_missing_indexes(bind: Engine = engine, tables: Optional[List[Table]] = None):
+    """Create indexes declared on the models that older databases are missing.
+
+    ``create_all`` only creates indexes together with their table, so databases
+    created by an earlier version never pick up new ones on their own.
+    """
+    for table in tables or Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                # IF NOT EXISTS rather than checkfirst: reflection can't see
+                # expression indexes such as ix_bookmarks_user_title
+                with bind.begin() as conn:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+            except Exception as e:
+                # e.g. existing duplicate rows preventing a unique index
+                logger.warning("Could not create index %s: %s", index.name, e)
+
+def insert_ignore(db: Session, table: Table, rows: List[Dict[str, Any]]):
+    """Insert rows in one statement, skipping rows that hit a unique constraint.
+
+    Uses ``INSERT ... ON CONFLICT DO NOTHING`` on SQLite and PostgreSQL and
+    falls back to one savepoint per row on other backends.
+    """
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(table.insert(), row)
+            except IntegrityError:
+                pass
+        return
+
+    db.execute(insert(table).on_conflict_do_nothing(), rows)
+
+def upsert(db: Session, table: Table, row: Dict[str, Any], key_columns: List[str]):
+    """Insert ``row``, or update the existing row with the same key columns."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        key = {column: row[column] for column in key_columns}
+        updated = db.execute(
+            table.update()
+            .where(*(table.c[column] == value for column, value in key.items()))
+            .values(**row)
+        ).rowcount
+        if not updated:
+            db.execute(table.insert(), row)
+        return
+
+    stmt = insert(table).values(**row)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=key_columns,
+        set_={column: stmt.excluded[column] for column in row if column not in key_columns}
+    ))
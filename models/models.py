@@ -1,10 +1,26 @@
 """Database models for StupidBookmarks."""
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table, Boolean
+from typing import Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, ForeignKey, Table, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
 
+def url_domain(url: Optional[str]) -> Optional[str]:
+    """Host of a URL, lowercased and without ``www.``; what listings sort by domain on."""
+    try:
+        host = urlsplit(url or "").hostname
+    except ValueError:
+        return None
+    if host and host.startswith("www."):
+        host = host[4:]
+    return host or None
+
+def _domain_default(context) -> Optional[str]:
+    return url_domain(context.get_current_parameters().get("url"))
+
 # Association table for many-to-many relationship between bookmarks and tags
 user_tags = Table(
     'bookmark_tags',
@@ -14,12 +30,16 @@ user_tags = Table(
 )
 
 class User(Base):
-    """User model - single user system."""
+    """User model; the first user is the admin, who can add the others."""
     __tablename__ = "users"
+    # Never hand a deleted user's id out again: it names their sessions and database
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, default="admin")
     password_hash = Column(String(255), nullable=False)
+    is_admin = Column(Boolean, default=False)  # NULL for users created before there were several
+    session_nonce = Column(String(64))  # signed into session cookies; replaced to sign them all out
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -30,6 +50,12 @@ class User(Base):
 class Bookmark(Base):
     """Bookmark model."""
     __tablename__ = "bookmarks"
+    __table_args__ = (
+        # One per listing sort order (see services/bookmark_reader.py), so each
+        # order and created_at range is read as an index range scan. The
+        # trailing columns break ties and let date filters skip rows in the index.
+        Index("ix_bookmarks_user_created", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     url = Column(Text, nullable=False)
@@ -37,6 +63,13 @@ class Bookmark(Base):
     description = Column(Text, default="")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    domain = Column(String(255), default=_domain_default)  # NULL until backfilled on older databases
+    
+    # Link health, filled in by services/link_checker.py; NULL until first checked
+    link_status = Column(Integer)  # HTTP status of the final response
+    link_error = Column(String(50))  # "timeout", "connection" or "request" when no response came back
+    final_url = Column(Text)  # where redirects ended up, if anywhere else
+    last_checked = Column(DateTime(timezone=True), index=True)
     
     # Foreign keys
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -44,10 +77,20 @@ class Bookmark(Base):
     # Relationships
     user = relationship("User", back_populates="bookmarks")
     tags = relationship("Tag", secondary=user_tags, back_populates="bookmarks")
+    snapshot = relationship("PageSnapshot", uselist=False, cascade="all, delete-orphan")
+    duplicate_bands = relationship("DuplicateBand", cascade="all, delete-orphan")
+
+# Orders needing an expression or mixed directions are declared outside the class
+Index("ix_bookmarks_user_title", Bookmark.user_id, func.lower(Bookmark.title), Bookmark.id, Bookmark.created_at)
+Index("ix_bookmarks_user_domain", Bookmark.user_id, Bookmark.domain, Bookmark.created_at.desc(), Bookmark.id.desc())
 
 class Tag(Base):
     """Tag model."""
     __tablename__ = "tags"
+    __table_args__ = (
+        # One tag per name per user; lets tag creation use INSERT ... ON CONFLICT
+        Index("uq_tags_user_name", "user_id", "name", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False, index=True)
@@ -61,6 +104,17 @@ class Tag(Base):
     user = relationship("User")
     bookmarks = relationship("Bookmark", secondary=user_tags, back_populates="tags")
 
+class TagVersion(Base):
+    """Counter bumped whenever one of a user's tags is renamed or deleted.
+
+    Workers cache tag name -> id mappings along with the version they were
+    read at (see services/tag_cache.py) and drop them once it moves on.
+    """
+    __tablename__ = "tag_versions"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
 class APIKey(Base):
     """API Key model for external access."""
     __tablename__ = "api_keys"
@@ -78,3 +132,52 @@ class APIKey(Base):
     
     # Relationships
     user = relationship("User", back_populates="api_keys")
+
+class PageMetadata(Base):
+    """Cached outcome of fetching a page's title, keyed by normalized URL.
+
+    Failed fetches are cached too (``title`` is NULL) so they are not retried
+    until ``expires_at``.
+    """
+    __tablename__ = "page_metadata"
+    
+    url_key = Column(Text, primary_key=True)
+    title = Column(String(500))
+    http_status = Column(Integer)
+    error = Column(String(50))
+    failure_count = Column(Integer, default=0, nullable=False)
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class PageSnapshot(Base):
+    """Latest archived copy of a bookmark's page (see services/archive_service.py).
+
+    The gzip-compressed content is stored once per ``content_hash`` in the
+    archive directory, so bookmarks whose pages are identical share a file.
+    A failed capture keeps its row, with ``error`` or a non-200
+    ``http_status``, so it isn't retried until ``ARCHIVE_RETRY_DAYS`` later.
+    """
+    __tablename__ = "page_snapshots"
+    
+    bookmark_id = Column(Integer, ForeignKey("bookmarks.id"), primary_key=True)
+    content_hash = Column(String(64), index=True)  # SHA-256 of the uncompressed content
+    content_type = Column(String(100))
+    size = Column(Integer)  # uncompressed bytes
+    stored_size = Column(Integer)  # compressed bytes on disk
+    http_status = Column(Integer)
+    error = Column(String(50))  # "timeout", "connection", "request" or "too_large"
+    captured_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class DuplicateBand(Base):
+    """One locality-sensitive hash of a bookmark (see services/duplicate_index.py).
+
+    ``band_key`` hashes the user id with one band of the bookmark's MinHash
+    signature (or with its normalized URL), so bookmarks sharing a key are
+    candidates for being the same page. The primary key doubles as the
+    lookup index, hence no rowid on SQLite.
+    """
+    __tablename__ = "duplicate_bands"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    band_key = Column(BigInteger, primary_key=True)
+    bookmark_id = Column(Integer, ForeignKey("bookmarks.id"), primary_key=True, index=True)
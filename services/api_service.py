@@ -3,11 +3,16 @@
 import secrets
 import hashlib
 from typing import Optional, List
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from models.database import SessionLocal, route_to_user
 from models.models import APIKey, User
 
+# last_used is shown to the minute; writing it more often only costs a commit per request
+LAST_USED_RESOLUTION = timedelta(minutes=1)
+
 class APIService:
     """Service for handling API operations."""
     
@@ -64,8 +69,19 @@ class APIService:
         
         if api_key:
             # Update last used timestamp
-            api_key.last_used = datetime.now()
-            db.commit()
+            now = datetime.now()
+            if api_key.last_used is None or now - api_key.last_used.replace(tzinfo=None) >= LAST_USED_RESOLUTION:
+                self._touch(api_key.id, now)
+            route_to_user(db, api_key.user_id)
             return api_key.user
         
         return None
+    
+    def _touch(self, key_id: int, now: datetime):
+        # Own session: read-only routes authenticate on a read-only one
+        db = SessionLocal()
+        try:
+            db.execute(update(APIKey).where(APIKey.id == key_id).values(last_used=now))
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,550 @@
+"""Page snapshot archive for StupidBookmarks.
+
+Bookmarks without a snapshot are read in id order a batch at a time and fed
+through a bounded queue (``ARCHIVE_QUEUE_MAX``) to ``ARCHIVE_WORKERS``
+threads, at most ``ARCHIVE_PER_HOST`` of them fetching from one host. Pages
+are fetched with the same client headers as title lookups and streamed
+straight to disk: each chunk is hashed and gzip-compressed into a temporary
+file, which is then renamed to ``<ARCHIVE_DIR>/<hash[:2]>/<hash>.gz``. If
+that file already exists the page is a duplicate and the temporary copy is
+dropped, so identical pages are stored once.
+
+Snapshots are served from the compressed file as-is (``Content-Encoding:
+gzip``), memory-mapped, with byte-range support.
+
+Usage:
+    python -m services.archive_service [--user USER_ID] [--prune]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import queue
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from models.database import DATA_DIR, ReadSessionLocal, SessionLocal, user_scopes, user_session
+from models.models import Bookmark, PageSnapshot
+from services.bookmark_service import BLOCKED_STATUSES, FETCH_HEADERS
+from services.link_checker import host_key, interleave_hosts
+from services.scheduled_job import ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(DATA_DIR, "archive"))
+# Hours between scheduled runs; 0 (the default) only archives when asked to
+ARCHIVE_INTERVAL_HOURS = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "0"))
+# Days before a failed capture is tried again
+ARCHIVE_RETRY_DAYS = float(os.getenv("ARCHIVE_RETRY_DAYS", "7"))
+# Fetching threads, and how many of them may fetch from one host at once
+ARCHIVE_WORKERS = max(1, int(os.getenv("ARCHIVE_WORKERS", "8")))
+ARCHIVE_PER_HOST = max(1, int(os.getenv("ARCHIVE_PER_HOST", "2")))
+# Bookmarks waiting for a worker; the reader pauses when the queue is full
+ARCHIVE_QUEUE_MAX = max(1, int(os.getenv("ARCHIVE_QUEUE_MAX", "500")))
+# Pages larger than this (uncompressed) are not archived
+ARCHIVE_MAX_BYTES = int(float(os.getenv("ARCHIVE_MAX_MB", "10")) * 1024 * 1024)
+ARCHIVE_TIMEOUT = float(os.getenv("ARCHIVE_TIMEOUT", "15"))
+
+# Bookmarks read, and results written, per transaction
+ARCHIVE_BATCH = 200
+CHUNK_SIZE = 64 * 1024
+# Orphaned files younger than this may belong to a capture not saved yet
+PRUNE_MIN_AGE = 3600
+
+# Archived pages run in a sandbox (a unique origin, no scripts or forms) so
+# they can't act on this app with the viewer's session
+SNAPSHOT_HEADERS = {
+    "Content-Security-Policy": "sandbox; default-src 'none'; img-src * data:; style-src * 'unsafe-inline'; font-src * data:",
+    "X-Content-Type-Options": "nosniff",
+    "Referrer-Policy": "no-referrer",
+}
+
+class PageTooLarge(Exception):
+    """Page exceeded ``ARCHIVE_MAX_BYTES``."""
+
+class CaptureTimeout(Exception):
+    """Page took too long to download in full."""
+
+@dataclass
+class CaptureResult:
+    """Outcome of archiving one bookmark's page."""
+    bookmark_id: int
+    status: Optional[int] = None
+    content_hash: Optional[str] = None
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+    stored_size: Optional[int] = None
+    # "timeout", "connection", "request" or "too_large" when nothing was stored
+    error: Optional[str] = None
+
+def parse_range(header: Optional[str], length: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``Range: bytes=...`` header into inclusive (start, end).
+
+    Returns None when there is no usable range (the whole file is served,
+    as RFC 9110 allows for multiple or malformed ranges) and raises
+    ValueError when the range lies outside the file.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, sep, end = header[len("bytes="):].strip().partition("-")
+    if not sep or not (start or end) or not (start or "0").isdigit() or not (end or "0").isdigit():
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        if int(end) == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, length - int(end)), length - 1
+    first = int(start)
+    last = int(end) if end else length - 1
+    if first >= length:
+        raise ValueError("Range not satisfiable")
+    if last < first:
+        return None
+    return first, min(last, length - 1)
+
+class PageArchiver(ScheduledJob):
+    """Captures bookmarked pages into a compressed, content-addressed store."""
+
+    lock_name = ".archive.lock"
+    interval_hours = ARCHIVE_INTERVAL_HOURS
+
+    def __init__(
+        self,
+        archive_dir: str = ARCHIVE_DIR,
+        workers: int = ARCHIVE_WORKERS,
+        per_host: int = ARCHIVE_PER_HOST,
+        queue_max: int = ARCHIVE_QUEUE_MAX,
+        max_bytes: int = ARCHIVE_MAX_BYTES,
+        timeout: float = ARCHIVE_TIMEOUT,
+        batch_size: int = ARCHIVE_BATCH,
+        session_factory: Callable[[], Session] = SessionLocal,
+        read_session_factory: Callable[[], Session] = ReadSessionLocal
+    ):
+        super().__init__()
+        self.archive_dir = archive_dir
+        self.workers = workers
+        self.per_host = per_host
+        self.queue_max = queue_max
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, user_id: Optional[int] = None) -> bool:
+        """Start archiving in a background thread unless a run is already going."""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run_logged, args=(user_id,), name="page-archiver", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop a running capture; pages already stored are kept."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(self.timeout * 3 + 5 if timeout is None else timeout)
+
+    def capture_pending(
+        self,
+        user_id: Optional[int] = None,
+        retry_after: timedelta = timedelta(days=ARCHIVE_RETRY_DAYS)
+    ) -> Optional[Dict[str, Any]]:
+        """Archive every bookmark that has no snapshot yet.
+
+        Failed captures older than ``retry_after`` are tried again. Returns
+        counts for the run, or None if another process is already archiving.
+        """
+        with self._process_lock() as acquired:
+            if not acquired:
+                return None
+            result = self._capture_pending(user_id, datetime.now() - retry_after)
+            if user_id is None and not self._stop.is_set():
+                result["pruned"] = self.prune()
+            return result
+
+    def capture(self, bookmark_id: int, url: str, http=None) -> CaptureResult:
+        """Fetch ``url`` and store its content.
+
+        Tries the next client headers only when the response suggests we
+        were blocked, like the title fetch in ``BookmarkService``.
+        """
+        import requests
+        http = http or requests
+
+        for i, headers in enumerate(FETCH_HEADERS):
+            # urllib3 only decodes brotli when the optional package is installed
+            headers = {**headers, "Accept-Encoding": "gzip, deflate"}
+            try:
+                with http.get(url, headers=headers, timeout=self.timeout, stream=True, allow_redirects=True) as response:
+                    if response.status_code in BLOCKED_STATUSES and i < len(FETCH_HEADERS) - 1:
+                        continue
+                    if response.status_code != 200:
+                        return CaptureResult(bookmark_id, status=response.status_code)
+                    declared = response.headers.get("Content-Length", "")
+                    if declared.isdigit() and int(declared) > self.max_bytes:
+                        return CaptureResult(bookmark_id, status=200, error="too_large")
+
+                    deadline = time.monotonic() + self.timeout * 3
+                    content_hash, size, stored_size = self.store(
+                        self._until(response.iter_content(CHUNK_SIZE), deadline)
+                    )
+                    return CaptureResult(
+                        bookmark_id,
+                        status=200,
+                        content_hash=content_hash,
+                        content_type=(response.headers.get("Content-Type") or "")[:100] or None,
+                        size=size,
+                        stored_size=stored_size,
+                    )
+            except PageTooLarge:
+                return CaptureResult(bookmark_id, status=200, error="too_large")
+            except (requests.exceptions.Timeout, CaptureTimeout):
+                return CaptureResult(bookmark_id, error="timeout")
+            except requests.exceptions.ConnectionError:
+                return CaptureResult(bookmark_id, error="connection")
+            except (requests.exceptions.RequestException, ValueError):
+                return CaptureResult(bookmark_id, error="request")
+        return CaptureResult(bookmark_id, error="request")
+
+    def store(self, chunks: Iterable[bytes]) -> Tuple[str, int, int]:
+        """Hash and compress ``chunks`` into the store.
+
+        Returns ``(content_hash, size, stored_size)``. Content already in the
+        store is not written again.
+        """
+        tmp_dir = os.path.join(self.archive_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        # wbits=31 writes a gzip stream, which can be served as Content-Encoding: gzip
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise PageTooLarge()
+                    digest.update(chunk)
+                    out.write(compressor.compress(chunk))
+                out.write(compressor.flush())
+                stored_size = out.tell()
+
+            content_hash = digest.hexdigest()
+            path = self.blob_path(content_hash)
+            try:
+                # Same content compresses to the same size; anything else was cut short by a crash
+                duplicate = os.path.getsize(path) == stored_size
+            except FileNotFoundError:
+                duplicate = False
+            if duplicate:
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return content_hash, size, stored_size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.archive_dir, content_hash[:2], f"{content_hash}.gz")
+
+    def get_snapshot(self, db: Session, bookmark_id: int, user_id: int) -> Optional[PageSnapshot]:
+        """The stored snapshot of one of the user's bookmarks, if there is one."""
+        return db.scalars(
+            select(PageSnapshot)
+            .join(Bookmark, Bookmark.id == PageSnapshot.bookmark_id)
+            .where(
+                PageSnapshot.bookmark_id == bookmark_id,
+                Bookmark.user_id == user_id,
+                PageSnapshot.content_hash.isnot(None)
+            )
+        ).first()
+
+    def read_range(self, path: str, start: int, end: int) -> Iterator[bytes]:
+        """Yield bytes ``start``..``end`` (inclusive) of a stored file via mmap."""
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = start
+            while position <= end:
+                stop = min(position + CHUNK_SIZE, end + 1)
+                yield mapped[position:stop]
+                position = stop
+
+    def read_decompressed(self, path: str) -> Iterator[bytes]:
+        """Yield a stored file's original content, for clients without gzip."""
+        decompressor = zlib.decompressobj(31)
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+
+    def summary(self, db: Session, user_id: int) -> Dict[str, Any]:
+        """Counts of archived, failed and pending pages plus storage used."""
+        total, archived, last_captured = db.execute(
+            select(func.count(Bookmark.id), func.count(PageSnapshot.content_hash), func.max(PageSnapshot.captured_at))
+            .select_from(Bookmark)
+            .outerjoin(PageSnapshot, PageSnapshot.bookmark_id == Bookmark.id)
+            .where(Bookmark.user_id == user_id)
+        ).one()
+        attempted = db.scalar(
+            select(func.count())
+            .select_from(PageSnapshot)
+            .join(Bookmark, Bookmark.id == PageSnapshot.bookmark_id)
+            .where(Bookmark.user_id == user_id)
+        )
+        # Each distinct content hash is one file on disk
+        files = (
+            select(PageSnapshot.content_hash, PageSnapshot.stored_size, PageSnapshot.size)
+            .join(Bookmark, Bookmark.id == PageSnapshot.bookmark_id)
+            .where(Bookmark.user_id == user_id, PageSnapshot.content_hash.isnot(None))
+            .distinct()
+            .subquery()
+        )
+        unique, stored_bytes, original_bytes = db.execute(
+            select(func.count(), func.coalesce(func.sum(files.c.stored_size), 0), func.coalesce(func.sum(files.c.size), 0))
+        ).one()
+        return {
+            "archived": archived,
+            "failed": attempted - archived,
+            "pending": total - attempted,
+            "unique_pages": unique,
+            "stored_bytes": stored_bytes,
+            "original_bytes": original_bytes,
+            "last_captured": last_captured,
+        }
+
+    def prune(self) -> int:
+        """Delete stored files no snapshot points to any more; returns the count."""
+        if not os.path.isdir(self.archive_dir):
+            return 0
+        # Stored files are shared by every user's snapshots
+        referenced = set()
+        for scope in user_scopes():
+            db = user_session(self.read_session_factory, scope)
+            try:
+                referenced.update(db.scalars(select(PageSnapshot.content_hash).where(PageSnapshot.content_hash.isnot(None)).distinct()))
+            finally:
+                db.close()
+
+        removed = 0
+        cutoff = time.time() - PRUNE_MIN_AGE
+        for directory, _, names in os.walk(self.archive_dir):
+            for name in names:
+                path = os.path.join(directory, name)
+                content_hash = name[:-len(".gz")] if name.endswith(".gz") else None
+                if content_hash in referenced:
+                    continue
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info("Pruned unreferenced snapshots", extra={"removed": removed})
+        return removed
+
+    def _run_logged(self, user_id: Optional[int]):
+        try:
+            self.capture_pending(user_id)
+        except Exception:
+            logger.exception("Page archiving failed")
+            self.progress["error"] = True
+
+    def _capture_pending(self, user_id: Optional[int], retry_cutoff: datetime) -> Dict[str, Any]:
+        import requests
+
+        started = time.perf_counter()
+        progress = self._start_progress("captured", "duplicates", "failed", "skipped", "bytes")
+        work: "queue.Queue[Optional[Tuple[int, str, Optional[int]]]]" = queue.Queue(maxsize=self.queue_max)
+        pending: Dict[Optional[int], List[CaptureResult]] = self._pending_results()
+        lock = threading.Lock()
+        host_slots: Dict[str, threading.Semaphore] = defaultdict(lambda: threading.Semaphore(self.per_host))
+        breaker = self._host_breaker()
+        seen_hashes = set()
+
+        def worker():
+            http = requests.Session()
+            try:
+                while (item := work.get()) is not None:
+                    if self._stop.is_set():
+                        continue
+                    bookmark_id, url, scope = item
+                    host = host_key(url)
+                    with lock:
+                        slot = host_slots[host]
+                    with slot:
+                        if not breaker.allow(host):
+                            with lock:
+                                progress["skipped"] += 1
+                            continue
+                        try:
+                            result = self.capture(bookmark_id, url, http)
+                        except Exception:
+                            # Most likely the disk; later pages would fail the same way
+                            logger.exception("Could not archive page", extra={"url": url})
+                            self.progress["error"] = True
+                            self._stop.set()
+                            continue
+                    if result.error in ("timeout", "connection"):
+                        breaker.record_failure(host)
+                    else:
+                        breaker.record_success(host)
+
+                    batch = None
+                    with lock:
+                        if result.content_hash is None:
+                            progress["failed"] += 1
+                        elif result.content_hash in seen_hashes:
+                            progress["duplicates"] += 1
+                        else:
+                            seen_hashes.add(result.content_hash)
+                            progress["captured"] += 1
+                            progress["bytes"] += result.stored_size
+                        pending[scope].append(result)
+                        if len(pending[scope]) >= self.batch_size:
+                            batch = pending.pop(scope)
+                    if batch:
+                        self._save(batch, scope)
+            finally:
+                http.close()
+
+        threads = [threading.Thread(target=worker, name=f"page-archiver-{i}", daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for scope in user_scopes(user_id):
+                after_id = 0
+                while not self._stop.is_set():
+                    batch = self._pending_batch(retry_cutoff, after_id, scope)
+                    if not batch:
+                        break
+                    after_id = batch[-1][0]
+                    for bookmark_id, url in interleave_hosts(batch):
+                        # Blocks while the queue is full, so reading keeps pace with fetching
+                        while not self._stop.is_set():
+                            try:
+                                work.put((bookmark_id, url, scope), timeout=1)
+                                break
+                            except queue.Full:
+                                continue
+        finally:
+            for _ in threads:
+                work.put(None)
+            for thread in threads:
+                thread.join()
+            for scope, batch in pending.items():
+                self._save(batch, scope)
+
+        progress["finished_at"] = datetime.now()
+        elapsed = time.perf_counter() - started
+        done = progress["captured"] + progress["duplicates"] + progress["failed"]
+        logger.info("Archived pages", extra={
+            "captured": progress["captured"], "duplicates": progress["duplicates"],
+            "failed": progress["failed"], "skipped": progress["skipped"],
+            "duration_ms": round(elapsed * 1000, 1),
+        })
+        return {
+            "captured": progress["captured"],
+            "duplicates": progress["duplicates"],
+            "failed": progress["failed"],
+            "skipped": progress["skipped"],
+            "stored_bytes": progress["bytes"],
+            "pages_per_minute": round(done / elapsed * 60) if elapsed else None,
+        }
+
+    def _pending_batch(self, retry_cutoff: datetime, after_id: int, user_id: Optional[int]) -> List[Tuple[int, str]]:
+        db = user_session(self.read_session_factory, user_id)
+        try:
+            stmt = (
+                select(Bookmark.id, Bookmark.url)
+                .outerjoin(PageSnapshot, PageSnapshot.bookmark_id == Bookmark.id)
+                .where(
+                    Bookmark.id > after_id,
+                    or_(
+                        PageSnapshot.bookmark_id.is_(None),
+                        (PageSnapshot.content_hash.is_(None)) & (PageSnapshot.captured_at < retry_cutoff)
+                    )
+                )
+                .order_by(Bookmark.id)
+                .limit(self.batch_size)
+            )
+            if user_id is not None:
+                stmt = stmt.where(Bookmark.user_id == user_id)
+            return [tuple(row) for row in db.execute(stmt)]
+        finally:
+            db.close()
+
+    def _save(self, results: List[CaptureResult], user_id: Optional[int]):
+        table = PageSnapshot.__table__
+        now = datetime.now()
+        ids = [r.bookmark_id for r in results]
+        # One sync for the whole batch instead of an fsync per file, so stored
+        # files are on disk before the rows pointing at them are committed
+        if hasattr(os, "sync"):
+            os.sync()
+        db = user_session(self.session_factory, user_id)
+        try:
+            # Bookmarks deleted while their page was being fetched are dropped
+            existing = set(db.scalars(select(Bookmark.id).where(Bookmark.id.in_(ids))))
+            rows = [
+                {
+                    "bookmark_id": r.bookmark_id, "content_hash": r.content_hash, "content_type": r.content_type,
+                    "size": r.size, "stored_size": r.stored_size, "http_status": r.status,
+                    "error": r.error, "captured_at": now,
+                }
+                for r in results if r.bookmark_id in existing
+            ]
+            db.execute(delete(table).where(table.c.bookmark_id.in_(ids)))
+            if rows:
+                db.execute(insert(table), rows)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _until(chunks: Iterable[bytes], deadline: float) -> Iterator[bytes]:
+        for chunk in chunks:
+            if time.monotonic() > deadline:
+                raise CaptureTimeout()
+            yield chunk
+
+page_archiver = PageArchiver()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive bookmarked pages now.")
+    parser.add_argument("--user", type=int, help="only this user's bookmarks")
+    parser.add_argument("--prune", action="store_true", help="only delete stored pages nothing points to")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.prune:
+        print(json.dumps({"pruned": page_archiver.prune()}))
+    else:
+        print(json.dumps(page_archiver.capture_pending(args.user)))
@@ -1,16 +1,62 @@
 """Authentication service for StupidBookmarks."""
 
 import hashlib
+import hmac
 import secrets
 import os
-from typing import Optional
+import tempfile
+from functools import lru_cache
+from typing import List, Optional
 from fastapi import Request, Response
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 
-from models.models import User
+from models.database import DATA_DIR, route_to_user, shard_router
+from models.models import APIKey, Tag, TagVersion, User, user_tags
+from services.bookmark_service import BookmarkService
+from services.change_events import change_events
+from services.tag_cache import tag_cache
+from services.tag_related import related_tags
+from services.tag_suggest import tag_suggestions
 
-pwd_context = CryptContext(schemes=["bcrypt"])
+# Key signing session cookies; when unset (or left at env.example's placeholder)
+# one is generated once and kept in the data directory
+SECRET_KEY = os.getenv("SECRET_KEY", "")
+if SECRET_KEY == "change_me_in_production":
+    SECRET_KEY = ""
+
+@lru_cache(maxsize=None)
+def get_session_secret() -> bytes:
+    """``SECRET_KEY``, or a random key shared by every worker through a file in ``DATA_DIR``."""
+    if SECRET_KEY:
+        return SECRET_KEY.encode()
+    path = os.path.join(DATA_DIR, ".session_secret")
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        # Written in full under a temporary name, then linked into place, so
+        # other workers never read a half-written file; if one got there
+        # first, the link fails and its key is used
+        fd, temp_path = tempfile.mkstemp(dir=DATA_DIR, prefix=".session_secret.")
+        try:
+            with os.fdopen(fd, "w") as secret_file:
+                secret_file.write(secrets.token_hex(32))
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(temp_path)
+    with open(path) as secret_file:
+        secret = secret_file.read().strip()
+    if not secret:
+        raise RuntimeError(f"{path} is empty; delete it or set SECRET_KEY")
+    return secret.encode()
+
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """Password hashing context; passlib/bcrypt load on first login, not at startup."""
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"])
 
 class AuthService:
     """Service for handling authentication."""
@@ -20,17 +66,21 @@ class AuthService:
     
     def hash_password(self, password: str) -> str:
         """Hash a password."""
-        return pwd_context.hash(password)
+        return get_pwd_context().hash(password)
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash."""
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
     
     def get_user(self, db: Session, user_id: Optional[int] = None) -> Optional[User]:
-        """Get user by ID or get the default admin user."""
+        """Get user by ID or get the admin user."""
         if user_id:
             return db.query(User).filter(User.id == user_id).first()
-        return db.query(User).first()
+        return db.query(User).order_by(User.is_admin.desc(), User.id).first()
+    
+    def get_users(self, db: Session) -> List[User]:
+        """All users, the admin first."""
+        return db.query(User).order_by(User.is_admin.desc(), User.id).all()
     
     def create_default_user(self, db: Session, password: str = None) -> User:
         """Create the default admin user."""
@@ -38,28 +88,73 @@ class AuthService:
             # Use environment variable if available, otherwise fallback to "admin"
             password = os.getenv("DEFAULT_ADMIN_PASSWORD", "admin")
             
-        hashed_password = self.hash_password(password)
-        user = User(username="admin", password_hash=hashed_password)
+        return self.create_user(db, "admin", password, is_admin=True)
+    
+    def ensure_admin(self, db: Session):
+        """Make the first user the admin if nobody is (databases from before there were several users)."""
+        if db.query(User).filter(User.is_admin == True).first() is None:
+            user = db.query(User).order_by(User.id).first()
+            if user is not None:
+                user.is_admin = True
+                db.commit()
+    
+    def create_user(self, db: Session, username: str, password: str, is_admin: bool = False) -> Optional[User]:
+        """Create a user; returns None if the username is taken."""
+        if db.query(User).filter(User.username == username).first():
+            return None
+        user = User(
+            username=username, password_hash=self.hash_password(password), is_admin=is_admin,
+            session_nonce=secrets.token_hex(16)
+        )
         db.add(user)
         db.commit()
         db.refresh(user)
         return user
     
-    def authenticate(self, db: Session, password: str) -> Optional[User]:
-        """Authenticate user with password."""
-        user = self.get_user(db)
+    def delete_user(self, db: Session, user_id: int) -> bool:
+        """Delete a user other than the admin, with their bookmarks, tags and API keys, in one transaction."""
+        user = self.get_user(db, user_id)
+        if user is None or user.is_admin:
+            return False
+        if shard_router is None:
+            BookmarkService().delete_bookmarks_uncommitted(db, user_id)
+            user_tag_ids = select(Tag.id).where(Tag.user_id == user_id)
+            db.execute(delete(user_tags).where(user_tags.c.tag_id.in_(user_tag_ids)))
+            db.execute(delete(Tag).where(Tag.user_id == user_id))
+            db.execute(delete(TagVersion).where(TagVersion.user_id == user_id))
+        db.execute(delete(APIKey).where(APIKey.user_id == user_id))
+        db.execute(delete(User).where(User.id == user_id))
+        db.commit()
+        if shard_router is not None:
+            # Only once the user is gone, so a failed delete leaves their data in place
+            shard_router.remove(user_id)
+        for cache in (tag_cache, tag_suggestions, related_tags):
+            cache.invalidate(user_id)
+        change_events.forget(user_id)
+        return True
+    
+    def authenticate(self, db: Session, password: str, username: Optional[str] = None) -> Optional[User]:
+        """Authenticate a user (the admin when ``username`` is not given) with their password."""
+        if username:
+            user = db.query(User).filter(User.username == username).first()
+        else:
+            user = self.get_user(db)
         if user and self.verify_password(password, user.password_hash):
             return user
         return None
     
-    def create_session(self, response: Response, user_id: int):
+    def create_session(self, db: Session, response: Response, user: User):
         """Create a user session."""
+        if not user.session_nonce:
+            # Users from before session nonces get theirs at their next sign-in
+            user.session_nonce = secrets.token_hex(16)
+            db.commit()
         session_token = secrets.token_urlsafe(32)
-        # In a real app, you'd store this in Redis or database
-        # For simplicity, we'll use a simple cookie-based session
+        # The cookie is signed, so nobody can sign in as another user by editing the id
+        # in it, and signed with the user's nonce, so replacing that revokes it
         response.set_cookie(
             key=self.session_key,
-            value=f"{user_id}:{session_token}",
+            value=f"{user.id}:{session_token}:{self._sign(user, session_token)}",
             httponly=True,
             secure=False,  # Set to True in production with HTTPS
             samesite="lax"
@@ -69,6 +164,11 @@ class AuthService:
         """Clear user session."""
         response.delete_cookie(key=self.session_key)
     
+    def revoke_sessions(self, db: Session, user: User):
+        """Sign the user out everywhere by replacing the nonce their cookies are signed with."""
+        user.session_nonce = secrets.token_hex(16)
+        db.commit()
+    
     def get_current_user(self, request: Request, db: Session) -> Optional[User]:
         """Get current user from session."""
         session_cookie = request.cookies.get(self.session_key)
@@ -76,17 +176,26 @@ class AuthService:
             return None
         
         try:
-            user_id_str, _ = session_cookie.split(":", 1)
+            user_id_str, token, signature = session_cookie.split(":", 2)
             user_id = int(user_id_str)
-            return self.get_user(db, user_id)
-        except (ValueError, AttributeError):
+        except ValueError:
             return None
+        user = self.get_user(db, user_id)
+        if user is None or not user.session_nonce or not hmac.compare_digest(signature, self._sign(user, token)):
+            return None
+        route_to_user(db, user.id)
+        return user
     
     def change_password(self, db: Session, user_id: int, new_password: str) -> bool:
         """Change user password."""
         user = self.get_user(db, user_id)
         if user:
             user.password_hash = self.hash_password(new_password)
-            db.commit()
+            self.revoke_sessions(db, user)
             return True
         return False
+    
+    @staticmethod
+    def _sign(user: User, token: str) -> str:
+        message = f"{user.id}:{user.session_nonce}:{token}".encode()
+        return hmac.new(get_session_secret(), message, hashlib.sha256).hexdigest()
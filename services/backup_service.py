@@ -0,0 +1,304 @@
+"""Online SQLite backups for StupidBookmarks.
+
+Snapshots are taken with SQLite's backup API a few hundred pages at a time,
+so requests keep reading and writing while a backup runs. Each snapshot is
+checked, gzip-compressed and written atomically as
+``stupidbookmarks-<UTC timestamp>.db.gz``; only the newest ``BACKUP_KEEP``
+are kept. With per-user storage each user's database is snapshotted in the
+same run, under the same name in ``users/<user id>/``, and restored with it.
+
+Usage:
+    python -m services.backup_service backup
+    python -m services.backup_service restore [SNAPSHOT]   # app stopped
+"""
+
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from models.database import DATA_DIR, engine, file_lock, read_engine, shard_router
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(DATA_DIR, "backups"))
+# Hours between scheduled snapshots; 0 turns the schedule off
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "24"))
+BACKUP_KEEP = max(1, int(os.getenv("BACKUP_KEEP", "7")))
+# Pages copied per backup step, and the pause between steps that lets writers in
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_MS = int(os.getenv("BACKUP_STEP_SLEEP_MS", "5"))
+# Snapshot path (or "latest") to restore at startup when the database file is missing
+RESTORE_FROM = os.getenv("RESTORE_FROM", "")
+
+SNAPSHOT_PREFIX = "stupidbookmarks-"
+SNAPSHOT_SUFFIX = ".db.gz"
+
+class BackupError(Exception):
+    """A snapshot could not be created or restored."""
+
+class BackupService:
+    """Create, rotate and restore compressed snapshots of the SQLite database."""
+
+    def __init__(self, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP):
+        self.backup_dir = backup_dir
+        self.keep = keep
+        # One snapshot at a time per process; other workers are held off by a file lock
+        self._lock = threading.Lock()
+
+    @property
+    def database_path(self) -> Optional[str]:
+        if engine.dialect.name != "sqlite" or engine.url.database in (None, "", ":memory:"):
+            return None
+        return os.path.abspath(engine.url.database)
+
+    @property
+    def supported(self) -> bool:
+        return self.database_path is not None
+
+    def list_snapshots(self) -> List[Dict]:
+        """Snapshots, newest first, as dicts with name, path, size and created_at."""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.backup_dir, f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}")):
+            stat = os.stat(path)
+            snapshots.append({
+                "name": os.path.basename(path),
+                "path": path,
+                "size": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc).replace(tzinfo=None),
+            })
+        # Names sort by timestamp, which survives copying the files elsewhere
+        return sorted(snapshots, key=lambda snapshot: snapshot["name"], reverse=True)
+
+    def snapshot_path(self, name: str) -> Optional[str]:
+        """Path of the snapshot called ``name``, or None (also for anything that isn't one)."""
+        for snapshot in self.list_snapshots():
+            if snapshot["name"] == name:
+                return snapshot["path"]
+        return None
+
+    def create_snapshot(self, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Back up the live database and rotate old snapshots.
+
+        With ``max_age`` (seconds), nothing is done if the newest snapshot is
+        younger than that or another process is already taking one; returns
+        None in that case.
+        """
+        if not self.supported:
+            raise BackupError("Online backups are only supported for SQLite databases")
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+        with self._lock, file_lock(os.path.join(self.backup_dir, ".backup.lock"), blocking=max_age is None) as acquired:
+            if not acquired:
+                return None
+            if max_age is not None and self._newest_age() < max_age:
+                return None
+
+            started = time.perf_counter()
+            name = f"{SNAPSHOT_PREFIX}{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}{SNAPSHOT_SUFFIX}"
+            # Users' databases first: a snapshot listed at the top is complete
+            shards = self._shard_snapshots(name) if shard_router is not None else 0
+            pages = self._write_snapshot(self.database_path, os.path.join(self.backup_dir, name))
+
+            removed = self._rotate()
+            snapshot = next(s for s in self.list_snapshots() if s["name"] == name)
+            logger.info("Created database snapshot", extra={
+                "snapshot": name, "pages": pages, "bytes": snapshot["size"], "rotated": removed, "user_databases": shards,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+            return snapshot
+
+    def restore_snapshot(self, snapshot: str = "latest"):
+        """Replace the database file with a snapshot.
+
+        Only safe while nothing has the database open: at startup, before the
+        first connection, or from the command line with the app stopped.
+        """
+        database_path = self.database_path
+        if database_path is None:
+            raise BackupError("Restore is only supported for SQLite databases")
+        source = self._resolve(snapshot)
+
+        started = time.perf_counter()
+        self._restore_file(source, database_path, before_replace=lambda: (engine.dispose(), read_engine.dispose()))
+        if shard_router is not None:
+            restored = set()
+            for path in glob.glob(os.path.join(self.backup_dir, "users", "*", os.path.basename(source))):
+                user_id = int(os.path.basename(os.path.dirname(path)))
+                self._restore_file(path, shard_router.path(user_id), before_replace=lambda: shard_router.close(user_id))
+                restored.add(user_id)
+            # Users' files without a copy in this snapshot hold data the restored
+            # database knows nothing about; a reused id must not pick them up
+            self._set_aside_shards([user_id for user_id in shard_router.user_ids() if user_id not in restored], source)
+        logger.info("Restored database snapshot", extra={
+            "snapshot": os.path.basename(source),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    def restore_if_missing(self, snapshot: str = RESTORE_FROM) -> bool:
+        """Restore ``snapshot`` at startup if the database doesn't exist yet."""
+        if not snapshot or not self.supported:
+            return False
+        database_path = self.database_path
+        if os.path.exists(database_path) and os.path.getsize(database_path) > 0:
+            return False
+        try:
+            self.restore_snapshot(snapshot)
+        except BackupError as e:
+            logger.warning("Not restoring database: %s", e)
+            return False
+        return True
+
+    async def run_schedule(self, interval_hours: float = BACKUP_INTERVAL_HOURS):
+        """Take a snapshot whenever the newest one is older than the interval."""
+        interval = interval_hours * 3600
+        while True:
+            try:
+                await asyncio.to_thread(self.create_snapshot, max_age=interval)
+            except Exception:
+                logger.exception("Scheduled backup failed")
+            # Wake up when the newest snapshot (from any worker) comes due
+            await asyncio.sleep(max(60.0, interval - self._newest_age()))
+
+    def _write_snapshot(self, database_path: str, path: str) -> int:
+        """Copy, check and compress one database to ``path``; returns its page count."""
+        raw_path = path + ".tmp"
+        try:
+            pages = self._copy_database(database_path, raw_path)
+            self._check(raw_path)
+            with open(raw_path, "rb") as src, gzip.open(path + ".part", "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.replace(path + ".part", path)
+        finally:
+            for leftover in (raw_path, path + ".part"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return pages
+
+    def _shard_snapshots(self, name: str) -> int:
+        user_ids = shard_router.user_ids()
+        for user_id in user_ids:
+            directory = os.path.join(self.backup_dir, "users", str(user_id))
+            os.makedirs(directory, exist_ok=True)
+            self._write_snapshot(shard_router.path(user_id), os.path.join(directory, name))
+            # Same rotation as the main snapshots
+            names = sorted(
+                (entry for entry in os.listdir(directory) if entry.startswith(SNAPSHOT_PREFIX) and entry.endswith(SNAPSHOT_SUFFIX)),
+                reverse=True
+            )
+            for old in names[self.keep:]:
+                os.remove(os.path.join(directory, old))
+        return len(user_ids)
+
+    def _set_aside_shards(self, user_ids: List[int], source: str):
+        """Move users' databases out of the shard directory, into ``not-restored/<snapshot>/``."""
+        if not user_ids:
+            return
+        snapshot = os.path.basename(source)
+        if snapshot.endswith(SNAPSHOT_SUFFIX):
+            snapshot = snapshot[:-len(SNAPSHOT_SUFFIX)]
+        directory = os.path.join(shard_router.directory, "not-restored", snapshot)
+        os.makedirs(directory, exist_ok=True)
+        for user_id in user_ids:
+            shard_router.close(user_id)
+            path = shard_router.path(user_id)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.replace(path + suffix, os.path.join(directory, os.path.basename(path) + suffix))
+        logger.warning("Set aside user databases missing from the snapshot", extra={
+            "snapshot": os.path.basename(source), "user_ids": user_ids, "directory": directory,
+        })
+
+    def _restore_file(self, source: str, database_path: str, before_replace: Callable[[], Any]):
+        temp_path = database_path + ".restore"
+        os.makedirs(os.path.dirname(database_path), exist_ok=True)
+        try:
+            with gzip.open(source, "rb") as src, open(temp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                dst.flush()
+                os.fsync(dst.fileno())
+            self._check(temp_path)
+            before_replace()
+            for stale in (database_path + "-wal", database_path + "-shm"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            os.replace(temp_path, database_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _copy_database(self, database_path: str, target: str) -> int:
+        source = sqlite3.connect(database_path, timeout=30)
+        destination = sqlite3.connect(target)
+        try:
+            # Each step holds a read lock only while copying its pages. Under
+            # WAL writers are never blocked; otherwise a write between steps
+            # makes SQLite restart the copy from the first page.
+            source.backup(
+                destination,
+                pages=BACKUP_PAGES_PER_STEP,
+                sleep=BACKUP_STEP_SLEEP_MS / 1000,
+            )
+            return destination.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            destination.close()
+            source.close()
+
+    def _check(self, path: str):
+        connection = sqlite3.connect(path)
+        try:
+            result = connection.execute("PRAGMA quick_check").fetchone()[0]
+            # The live database is in WAL mode; a restored copy should start out the same
+            connection.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError as e:
+            raise BackupError(f"{os.path.basename(path)} is not a valid database: {e}")
+        finally:
+            connection.close()
+        if result != "ok":
+            raise BackupError(f"Integrity check failed for {os.path.basename(path)}: {result}")
+
+    def _rotate(self) -> int:
+        removed = 0
+        for snapshot in self.list_snapshots()[self.keep:]:
+            os.remove(snapshot["path"])
+            removed += 1
+        return removed
+
+    def _newest_age(self) -> float:
+        snapshots = self.list_snapshots()
+        if not snapshots:
+            return float("inf")
+        return time.time() - os.path.getmtime(snapshots[0]["path"])
+
+    def _resolve(self, snapshot: str) -> str:
+        if snapshot == "latest":
+            snapshots = self.list_snapshots()
+            if not snapshots:
+                raise BackupError(f"No snapshots in {self.backup_dir}")
+            return snapshots[0]["path"]
+        if os.path.exists(snapshot):
+            return snapshot
+        path = self.snapshot_path(snapshot)
+        if path is None:
+            raise BackupError(f"Snapshot not found: {snapshot}")
+        return path
+
+backup_service = BackupService()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    command = sys.argv[1] if len(sys.argv) > 1 else "backup"
+    if command == "backup":
+        print(backup_service.create_snapshot()["path"])
+    elif command == "restore":
+        backup_service.restore_snapshot(sys.argv[2] if len(sys.argv) > 2 else "latest")
+    else:
+        sys.exit(f"Unknown command: {command} (expected backup or restore)")
@@ -0,0 +1,218 @@
+"""Record-at-a-time readers and writers for bookmark exchange formats.
+
+Supported formats:
+
+- ``ndjson``: one JSON object per line (url, title, description, tags,
+  created_at, updated_at); the lossless format for moving between instances
+- ``csv``: the same fields with a header row, tags space-separated
+- ``pinboard``: a JSON array in Pinboard's export format (href, description,
+  extended, tags, time); the reader also accepts Linkding's API fields (url,
+  title, description, tag_names, date_added, date_modified)
+
+Readers take an iterable of text lines or chunks and yield
+``BookmarkRecord`` objects one at a time (``None`` for an entry that can't
+be used, so the caller can count it as skipped); writers take records and
+yield text chunks, so neither side ever holds a whole file in memory.
+"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from services.tag_service import parse_tag_names
+
+@dataclass
+class BookmarkRecord:
+    """A bookmark as exchanged between instances, independent of the database."""
+    url: str
+    title: str = ""
+    description: str = ""
+    tags: List[str] = field(default_factory=list)
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+CSV_FIELDS = ["url", "title", "description", "tags", "created_at", "updated_at"]
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """ISO 8601 string or Unix seconds -> naive UTC datetime (as the database stores it)."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        return datetime.fromtimestamp(int(value), tz=timezone.utc).replace(tzinfo=None)
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def format_timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+def split_tags(value: Any) -> List[str]:
+    """Tag names from a string or a list, split and normalized like tags typed in the UI."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return parse_tag_names(value)
+    return parse_tag_names(str(tag) for tag in value)
+
+# NDJSON
+
+def write_ndjson(records: Iterable[BookmarkRecord]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps({
+            "url": record.url,
+            "title": record.title,
+            "description": record.description,
+            "tags": record.tags,
+            "created_at": format_timestamp(record.created_at),
+            "updated_at": format_timestamp(record.updated_at),
+        }, ensure_ascii=False) + "\n"
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[Optional[BookmarkRecord]]:
+    for line in lines:
+        if line.strip():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield None
+                continue
+            yield _record_from_dict(item)
+
+# CSV
+
+def write_csv(records: Iterable[BookmarkRecord]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    for record in records:
+        writer.writerow([
+            record.url,
+            record.title,
+            record.description,
+            " ".join(record.tags),
+            format_timestamp(record.created_at) or "",
+            format_timestamp(record.updated_at) or "",
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def read_csv(lines: Iterable[str]) -> Iterator[Optional[BookmarkRecord]]:
+    for row in csv.DictReader(lines):
+        yield _record_from_dict(row)
+
+# Pinboard / Linkding JSON
+
+def write_pinboard(records: Iterable[BookmarkRecord]) -> Iterator[str]:
+    yield "["
+    separator = "\n"
+    for record in records:
+        created = record.created_at.replace(tzinfo=timezone.utc) if record.created_at else None
+        yield separator + json.dumps({
+            "href": record.url,
+            "description": record.title,
+            "extended": record.description,
+            "meta": "",
+            "hash": "",
+            "time": created.strftime("%Y-%m-%dT%H:%M:%SZ") if created else None,
+            "shared": "no",
+            "toread": "no",
+            "tags": " ".join(record.tags),
+        }, ensure_ascii=False)
+        separator = ",\n"
+    yield "\n]\n"
+
+def read_pinboard(chunks: Iterable[str]) -> Iterator[Optional[BookmarkRecord]]:
+    """Parse a top-level JSON array incrementally, one object at a time.
+
+    A Linkding API page (``{"results": [...]}``) is read as a whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    chunks = iter(chunks)
+
+    for chunk in chunks:
+        buffer = buffer[position:] + chunk
+        position = 0
+        if not started:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            if stripped[0] == "{":
+                document = json.loads(buffer + "".join(chunks))
+                for item in document.get("results", []):
+                    yield _record_from_dict(item)
+                return
+            if stripped[0] != "[":
+                raise ValueError("Expected a JSON array of bookmarks")
+            position = buffer.index("[") + 1
+            started = True
+
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer) or buffer[position] == "]":
+                break
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # object continues in the next chunk
+            position = end
+            yield _record_from_dict(item)
+
+    if buffer[position:].strip() not in ("]", ""):
+        raise ValueError("Truncated or malformed JSON bookmark array")
+
+def _record_from_dict(item: Any) -> Optional[BookmarkRecord]:
+    """Build a record from NDJSON/CSV, Pinboard or Linkding field names."""
+    if not isinstance(item, dict):
+        return None
+    if "href" in item:  # Pinboard: description is the title, extended the notes
+        url, title, description = item["href"], item.get("description"), item.get("extended")
+        tags = split_tags(item.get("tags"))
+        created_at, updated_at = item.get("time"), None
+    else:
+        url, title, description = item.get("url"), item.get("title"), item.get("description")
+        tags = split_tags(item.get("tags") if "tags" in item else item.get("tag_names"))
+        created_at = item.get("created_at", item.get("date_added"))
+        updated_at = item.get("updated_at", item.get("date_modified"))
+
+    if not url or not str(url).strip():
+        return None
+    try:
+        created_at, updated_at = parse_timestamp(created_at), parse_timestamp(updated_at)
+    except (TypeError, ValueError, OverflowError):
+        created_at = updated_at = None
+    return BookmarkRecord(
+        url=str(url).strip(),
+        title=(title or "").strip(),
+        description=description or "",
+        tags=tags,
+        created_at=created_at,
+        updated_at=updated_at,
+    )
+
+READERS: Dict[str, Callable[[Iterable[str]], Iterator[Optional[BookmarkRecord]]]] = {
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+    "pinboard": read_pinboard,
+}
+
+WRITERS: Dict[str, Callable[[Iterable[BookmarkRecord]], Iterator[str]]] = {
+    "ndjson": write_ndjson,
+    "csv": write_csv,
+    "pinboard": write_pinboard,
+}
+
+MEDIA_TYPES = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "pinboard": ("application/json", "json"),
+}
@@ -0,0 +1,203 @@
+"""Read-only bookmark queries that skip ORM object construction.
+
+Listings and exports only read bookmarks, so they don't need identity-map
+tracking or lazily loaded relationships. These queries select plain columns,
+aggregate each bookmark's tag names in SQL (``group_concat`` on SQLite,
+``string_agg`` on PostgreSQL) and return compact ``BookmarkRow`` records.
+
+Listings can be sorted by any of ``SORT_ORDERS`` and limited to a range of
+days, and each order has a matching index on ``bookmarks`` (see
+``models/models.py``), so a page is an index range scan whatever the order.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import desc, func, literal, select
+from sqlalchemy.orm import Session
+
+from models.models import Bookmark, Tag, user_tags
+
+# Tag names never contain commas (they are split on commas and whitespace)
+TAG_SEPARATOR = ","
+# Listing orders; the first is the default
+SORT_ORDERS = ("newest", "oldest", "title", "domain")
+# Histogram buckets: length of the timestamp prefix naming each, and the
+# PostgreSQL format giving the same text
+HISTOGRAM_INTERVALS = {"year": (4, "YYYY"), "month": (7, "YYYY-MM"), "day": (10, "YYYY-MM-DD")}
+
+class BookmarkRow:
+    """A bookmark as read for display or export; ``tags`` are sorted names."""
+
+    __slots__ = ("id", "url", "title", "description", "created_at", "updated_at", "tags")
+
+    def __init__(
+        self,
+        id: int,
+        url: str,
+        title: str,
+        description: Optional[str],
+        created_at: Optional[datetime],
+        updated_at: Optional[datetime],
+        tags: Optional[str]
+    ):
+        self.id = id
+        self.url = url
+        self.title = title
+        self.description = description or ""
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.tags = sorted(tags.split(TAG_SEPARATOR)) if tags else []
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same shape as ``BookmarkService.bookmark_to_dict``."""
+        return {
+            "id": self.id,
+            "url": self.url,
+            "title": self.title,
+            "description": self.description,
+            "tags": self.tags,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class BookmarkReader:
+    """Listing and export queries returning ``BookmarkRow`` records."""
+
+    def list_bookmarks(
+        self,
+        db: Session,
+        user_id: int,
+        tag_filter: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        sort: str = "newest",
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> List[BookmarkRow]:
+        """One page of bookmarks in ``sort`` order, created between ``since`` and ``until`` (inclusive, UTC days)."""
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {sort}")
+        stmt = self._bookmarks(user_id, tag_filter)
+        if sort == "domain":
+            stmt = stmt.add_columns(Bookmark.domain)
+        stmt = self._created_between(db, stmt, since, until)
+        page = stmt.order_by(*self._sort_keys(sort, Bookmark)).limit(limit).offset(offset).subquery()
+        stmt = self._with_tags(db, page).order_by(*self._sort_keys(sort, page.c))
+        return [BookmarkRow(*row) for row in db.execute(stmt)]
+
+    def count_bookmarks(
+        self,
+        db: Session,
+        user_id: int,
+        tag_filter: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> int:
+        """How many bookmarks ``list_bookmarks`` pages through with the same filters."""
+        stmt = self._created_between(db, self._filtered(select(func.count()), user_id, tag_filter), since, until)
+        return db.execute(stmt).scalar() or 0
+
+    def histogram(
+        self,
+        db: Session,
+        user_id: int,
+        interval: str = "month",
+        tag_filter: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """Bookmarks added per year, month or day, oldest first, skipping empty periods.
+
+        Periods are prefixes of the stored timestamp, so the count reads only
+        an index with ``user_id`` and ``created_at``, never the bookmarks themselves.
+        """
+        if interval not in HISTOGRAM_INTERVALS:
+            raise ValueError(f"Unknown interval: {interval}")
+        length, pg_format = HISTOGRAM_INTERVALS[interval]
+        if db.get_bind().dialect.name == "postgresql":
+            period = func.to_char(Bookmark.created_at, pg_format).label("period")
+        else:
+            period = func.substr(Bookmark.created_at, 1, length).label("period")
+        stmt = self._filtered(select(period, func.count().label("count")), user_id, tag_filter)
+        stmt = self._created_between(db, stmt, since, until).group_by(period).order_by(period)
+        return [{"period": row.period, "count": row.count} for row in db.execute(stmt)]
+
+    def iter_bookmarks(self, db: Session, user_id: int, batch_size: int = 1000) -> Iterator[BookmarkRow]:
+        """All of a user's bookmarks, oldest first, one keyset-paginated batch at a time."""
+        last_id = 0
+        while True:
+            batch = self._bookmarks(user_id).where(Bookmark.id > last_id).order_by(Bookmark.id).limit(batch_size).subquery()
+            rows = db.execute(self._with_tags(db, batch).order_by(batch.c.id)).all()
+            if not rows:
+                return
+            for row in rows:
+                yield BookmarkRow(*row)
+            last_id = rows[-1][0]
+
+    def _bookmarks(self, user_id: int, tag_filter: Optional[str] = None):
+        return self._filtered(select(
+            Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description,
+            Bookmark.created_at, Bookmark.updated_at
+        ), user_id, tag_filter)
+
+    def _filtered(self, stmt, user_id: int, tag_filter: Optional[str] = None):
+        stmt = stmt.select_from(Bookmark).where(Bookmark.user_id == user_id)
+        if tag_filter:
+            tagged = (
+                select(user_tags.c.bookmark_id)
+                .join(Tag, Tag.id == user_tags.c.tag_id)
+                .where(Tag.user_id == user_id, Tag.name == tag_filter)
+            )
+            stmt = stmt.where(Bookmark.id.in_(tagged))
+        return stmt
+
+    def _created_between(self, db: Session, stmt, since: Optional[date], until: Optional[date]):
+        if since:
+            stmt = stmt.where(Bookmark.created_at >= self._day_start(db, since))
+        if until:
+            stmt = stmt.where(Bookmark.created_at < self._day_start(db, until + timedelta(days=1)))
+        return stmt
+
+    @staticmethod
+    def _day_start(db: Session, day: date):
+        # SQLite stores database-default timestamps without fractions of a second,
+        # which sort before the ".000000" a bound datetime gets; the bare date
+        # sorts before both
+        if db.get_bind().dialect.name == "sqlite":
+            return literal(day.isoformat())
+        return datetime.combine(day, time.min)
+
+    @staticmethod
+    def _sort_keys(sort: str, columns) -> list:
+        """ORDER BY for ``sort`` over the bookmark columns or a page subquery's; matches the indexes."""
+        if sort == "oldest":
+            return [columns.created_at, columns.id]
+        if sort == "title":
+            return [func.lower(columns.title), columns.id]
+        if sort == "domain":
+            return [columns.domain, desc(columns.created_at), desc(columns.id)]
+        return [desc(columns.created_at), desc(columns.id)]
+
+    def _with_tags(self, db: Session, bookmarks):
+        """Add each bookmark's tag names as one column.
+
+        A correlated subquery per row keeps the page's order and avoids
+        grouping (and sorting) the page by all of its columns.
+        """
+        if db.get_bind().dialect.name == "postgresql":
+            tag_names = func.string_agg(Tag.name, TAG_SEPARATOR)
+        else:
+            tag_names = func.group_concat(Tag.name, TAG_SEPARATOR)
+        tags = (
+            select(tag_names)
+            .select_from(user_tags)
+            .join(Tag, Tag.id == user_tags.c.tag_id)
+            .where(user_tags.c.bookmark_id == bookmarks.c.id)
+            .scalar_subquery()
+        )
+        # Only the row's columns; a page may carry extra ones to sort on
+        row_columns = [bookmarks.c[name] for name in BookmarkRow.__slots__[:-1]]
+        return select(*row_columns, tags).select_from(bookmarks)
+
+bookmark_reader = BookmarkReader()
@@ -1,14 +1,60 @@
 """Bookmark management service for StupidBookmarks."""
 
-import re
-from typing import List, Optional, Dict, Any
+import logging
+from datetime import date
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from urllib.parse import urlparse
-import requests
-from bs4 import BeautifulSoup
+from sqlalchemy import bindparam, delete, func, desc, insert, select, update
 
-from models.models import Bookmark, Tag, user_tags
+from models.database import SessionLocal, insert_ignore, user_scopes, user_session
+from models.models import Bookmark, DuplicateBand, PageSnapshot, Tag, url_domain, user_tags
+from services.bookmark_formats import BookmarkRecord
+from services.bookmark_reader import TAG_SEPARATOR, BookmarkRow, bookmark_reader
+from services.change_events import change_events
+from services.duplicate_index import duplicate_index
+from services.metadata_service import FetchResult, page_metadata_cache
+from services.tag_cache import tag_cache
+from services.tag_related import related_tags
+from services.tag_service import parse_tag_names
+from services.tag_suggest import tag_suggestions
+
+logger = logging.getLogger(__name__)
+
+# Bookmarks written per INSERT batch (and per commit) by bulk_import
+IMPORT_BATCH_SIZE = 1000
+
+# Statuses that may just mean our User-Agent was rejected, worth another strategy
+BLOCKED_STATUSES = (403, 406, 429, 503)
+
+# Client headers tried in order when fetching a page
+FETCH_HEADERS = [
+    # Chrome on macOS
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    },
+    # Firefox on macOS
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:120.0) Gecko/20100101 Firefox/120.0',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    },
+    # Simple bot-friendly headers
+    {
+        'User-Agent': 'StupidBookmarks/1.0 (+https://github.com/dannycab/stupidbookmarks)',
+        'Accept': 'text/html,application/xhtml+xml',
+    }
+]
 
 class BookmarkService:
     """Service for handling bookmark operations."""
@@ -19,15 +65,15 @@ class BookmarkService:
         user_id: int, 
         tag_filter: Optional[str] = None,
         limit: int = 50,
-        offset: int = 0
-    ) -> List[Bookmark]:
-        """Get bookmarks with optional tag filtering."""
-        query = db.query(Bookmark).filter(Bookmark.user_id == user_id)
-        
-        if tag_filter:
-            query = query.join(Bookmark.tags).filter(Tag.name == tag_filter)
-        
-        return query.order_by(desc(Bookmark.created_at)).offset(offset).limit(limit).all()
+        offset: int = 0,
+        sort: str = "newest",
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> List[BookmarkRow]:
+        """Get bookmarks with optional tag and date filtering, in ``sort`` order, as read-only rows."""
+        return bookmark_reader.list_bookmarks(
+            db, user_id, tag_filter=tag_filter, limit=limit, offset=offset, sort=sort, since=since, until=until
+        )
     
     def add_bookmark(
         self, 
@@ -43,12 +89,7 @@ class BookmarkService:
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
         
-        # Auto-fetch title if not provided or title is just whitespace
-        if not title or not title.strip():
-            print(f"Auto-fetching title for URL: {url}")  # Debug log
-            fetched_title = self._fetch_page_title(url)
-            title = fetched_title or "Untitled"
-            print(f"Fetched title: {title}")  # Debug log
+        title = self.resolve_title(db, url, title)
         
         # Create bookmark
         bookmark = Bookmark(
@@ -60,15 +101,86 @@ class BookmarkService:
         
         db.add(bookmark)
         db.flush()  # Get the bookmark ID
+        duplicate_index.index_bookmarks(db, user_id, [(bookmark.id, bookmark.url, bookmark.title, bookmark.description)])
         
         # Process tags
-        if tags.strip():
-            self._add_tags_to_bookmark(db, bookmark, tags, user_id)
+        tag_names = parse_tag_names(tags) if tags.strip() else []
+        if tag_names:
+            self._add_tags_to_bookmark(db, bookmark, tag_names, user_id)
+        change_events.record(db, user_id, "bookmark.created", {
+            "id": bookmark.id, "url": bookmark.url, "title": bookmark.title,
+            "description": bookmark.description, "tags": tag_names,
+        })
         
         db.commit()
         db.refresh(bookmark)
         return bookmark
     
+    def resolve_title(self, db: Session, url: str, title: Optional[str]) -> str:
+        """Return ``title``, or the page's (cached) title when it is empty."""
+        # Auto-fetch title if not provided or title is just whitespace
+        if not title or not title.strip():
+            logger.debug("Auto-fetching title", extra={"url": url})
+            fetched_title = page_metadata_cache.get_title(db, url, self._fetch_page)
+            title = fetched_title or "Untitled"
+            logger.debug("Fetched title", extra={"url": url, "title": title})
+        return title
+    
+    def insert_bookmarks(self, db: Session, items: List[Dict[str, Any]]) -> List[BookmarkRow]:
+        """Insert several bookmarks (possibly for different users) without committing.
+        
+        Each item has ``user_id``, ``url``, ``title``, ``description`` and
+        ``tags`` (a comma or space separated string), with the title already
+        resolved. Used by the write coalescer to add many bookmarks per commit.
+        """
+        rows = []
+        for item in items:
+            url = item["url"] if item["url"].startswith(('http://', 'https://')) else 'https://' + item["url"]
+            rows.append({
+                "url": url,
+                "title": item["title"].strip(),
+                "description": (item["description"] or "").strip(),
+                "user_id": item["user_id"],
+            })
+        table = Bookmark.__table__
+        inserted = db.execute(
+            insert(table).returning(table.c.id, table.c.created_at, sort_by_parameter_order=True),
+            rows
+        ).all()
+        for user_id in {row["user_id"] for row in rows}:
+            duplicate_index.index_bookmarks(db, user_id, [
+                (bookmark_id, row["url"], row["title"], row["description"])
+                for (bookmark_id, _), row in zip(inserted, rows)
+                if row["user_id"] == user_id
+            ])
+        
+        tag_names = [parse_tag_names(item["tags"]) if item["tags"] else [] for item in items]
+        by_user: Dict[int, List[str]] = {}
+        tag_sets: Dict[int, List[List[str]]] = {}
+        for item, names in zip(items, tag_names):
+            by_user.setdefault(item["user_id"], []).extend(names)
+            tag_sets.setdefault(item["user_id"], []).append(names)
+        tag_ids = {user_id: tag_cache.resolve(db, user_id, names) for user_id, names in by_user.items()}
+        insert_ignore(db, user_tags, [
+            {"bookmark_id": bookmark_id, "tag_id": tag_ids[item["user_id"]][name]}
+            for (bookmark_id, _), item, names in zip(inserted, items, tag_names)
+            for name in names
+        ])
+        for user_id, names in by_user.items():
+            if names:
+                tag_suggestions.record_usage(db, user_id, names)
+                related_tags.record_bookmarks(db, user_id, tag_sets[user_id])
+        for (bookmark_id, _), row, names in zip(inserted, rows, tag_names):
+            change_events.record(db, row["user_id"], "bookmark.created", {
+                "id": bookmark_id, "url": row["url"], "title": row["title"],
+                "description": row["description"], "tags": names,
+            })
+        
+        return [
+            BookmarkRow(bookmark_id, row["url"], row["title"], row["description"], created_at, None, TAG_SEPARATOR.join(names))
+            for (bookmark_id, created_at), row, names in zip(inserted, rows, tag_names)
+        ]
+    
     def delete_bookmark(self, db: Session, bookmark_id: int, user_id: int) -> bool:
         """Delete a bookmark."""
         bookmark = db.query(Bookmark).filter(
@@ -77,8 +189,11 @@ class BookmarkService:
         ).first()
         
         if bookmark:
+            related_tags.record_bookmarks(db, user_id, [[tag.name for tag in bookmark.tags]], delta=-1)
             db.delete(bookmark)
+            change_events.record(db, user_id, "bookmark.deleted", {"id": bookmark_id})
             db.commit()
+            tag_suggestions.invalidate(user_id)
             return True
         return False
     
@@ -88,13 +203,25 @@ class BookmarkService:
         Returns:
             int: Number of bookmarks deleted
         """
+        bookmark_count = self.delete_bookmarks_uncommitted(db, user_id)
+        db.commit()
+        tag_suggestions.invalidate(user_id)
+        related_tags.invalidate(user_id)
+        
+        return bookmark_count
+    
+    def delete_bookmarks_uncommitted(self, db: Session, user_id: int) -> int:
+        """Delete all of a user's bookmarks in the current transaction, leaving the commit to the caller."""
         # Get the count before deletion for return value
         bookmark_count = db.query(Bookmark).filter(Bookmark.user_id == user_id).count()
         
-        # Delete all bookmarks for the user
-        db.query(Bookmark).filter(Bookmark.user_id == user_id).delete()
-        db.commit()
-        
+        # Delete all bookmarks for the user (a bulk delete skips ORM cascades)
+        user_bookmarks = select(Bookmark.id).where(Bookmark.user_id == user_id)
+        db.query(PageSnapshot).filter(PageSnapshot.bookmark_id.in_(user_bookmarks)).delete(synchronize_session=False)
+        db.query(DuplicateBand).filter(DuplicateBand.bookmark_id.in_(user_bookmarks)).delete(synchronize_session=False)
+        db.execute(delete(user_tags).where(user_tags.c.bookmark_id.in_(user_bookmarks)))
+        db.query(Bookmark).filter(Bookmark.user_id == user_id).delete(synchronize_session=False)
+        change_events.record(db, user_id, "bookmarks.deleted", {"count": bookmark_count})
         return bookmark_count
     
     def get_tag_cloud(self, db: Session, user_id: int) -> List[Dict[str, Any]]:
@@ -175,48 +302,181 @@ class BookmarkService:
             "updated_at": bookmark.updated_at.isoformat() if bookmark.updated_at else None
         }
     
-    def count_bookmarks(self, db: Session, user_id: int, tag_filter: Optional[str] = None) -> int:
-        """Count bookmarks with optional tag filtering."""
-        query = db.query(func.count(Bookmark.id)).filter(Bookmark.user_id == user_id)
+    def count_bookmarks(
+        self,
+        db: Session,
+        user_id: int,
+        tag_filter: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> int:
+        """Count bookmarks with optional tag and date filtering."""
+        return bookmark_reader.count_bookmarks(db, user_id, tag_filter=tag_filter, since=since, until=until)
+    
+    def get_histogram(
+        self,
+        db: Session,
+        user_id: int,
+        interval: str = "month",
+        tag_filter: Optional[str] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """Bookmarks added per year, month or day, for a timeline."""
+        return bookmark_reader.histogram(db, user_id, interval, tag_filter=tag_filter, since=since, until=until)
+    
+    def backfill_domains(self, batch_size: int = IMPORT_BATCH_SIZE) -> int:
+        """Fill in ``domain`` on bookmarks saved before it existed, one committed batch at a time."""
+        filled = 0
+        for scope in user_scopes():
+            db = user_session(SessionLocal, scope)
+            try:
+                last_id = 0
+                while True:
+                    rows = db.execute(
+                        select(Bookmark.id, Bookmark.url)
+                        .where(Bookmark.id > last_id, Bookmark.domain.is_(None))
+                        .order_by(Bookmark.id)
+                        .limit(batch_size)
+                    ).all()
+                    if not rows:
+                        break
+                    db.execute(
+                        update(Bookmark.__table__)
+                        .where(Bookmark.__table__.c.id == bindparam("bookmark_id"))
+                        .values(domain=bindparam("bookmark_domain")),
+                        [{"bookmark_id": row.id, "bookmark_domain": url_domain(row.url)} for row in rows]
+                    )
+                    db.commit()
+                    filled += len(rows)
+                    last_id = rows[-1].id
+            finally:
+                db.close()
+        if filled:
+            logger.info("Bookmark domains backfilled", extra={"bookmarks": filled})
+        return filled
+    
+    def run_domain_backfill(self):
+        """``backfill_domains`` for a background task: errors are logged, not raised."""
+        try:
+            self.backfill_domains()
+        except Exception:
+            logger.exception("Bookmark domain backfill failed")
+    
+    def iter_records(self, db: Session, user_id: int, batch_size: int = 1000) -> Iterator[BookmarkRecord]:
+        """Yield all of a user's bookmarks as records, oldest first, loading one batch at a time."""
+        for row in bookmark_reader.iter_bookmarks(db, user_id, batch_size):
+            yield BookmarkRecord(
+                url=row.url,
+                title=row.title,
+                description=row.description,
+                tags=row.tags,
+                created_at=row.created_at,
+                updated_at=row.updated_at,
+            )
+    
+    def bulk_import(
+        self,
+        db: Session,
+        user_id: int,
+        records: Iterable[Optional[BookmarkRecord]],
+        batch_size: int = IMPORT_BATCH_SIZE
+    ) -> Dict[str, int]:
+        """Insert records in batches: one multi-row INSERT for the bookmarks,
+        one tag resolve and one link INSERT per batch.
         
-        if tag_filter:
-            query = query.join(Bookmark.tags).filter(Tag.name == tag_filter)
+        Titles are never fetched; a record without one gets its URL as title.
+        ``None`` entries (unreadable input rows) are counted as skipped, and
+        imported bookmarks that look like one added before them (already
+        there or earlier in the import) are counted as possible duplicates.
+        """
+        imported = skipped = possible_duplicates = 0
+        records = iter(records)
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+            valid = [record for record in batch if record is not None]
+            skipped += len(batch) - len(valid)
+            if not valid:
+                continue
+            
+            rows = []
+            for record in valid:
+                url = record.url if record.url.startswith(('http://', 'https://')) else 'https://' + record.url
+                row = {
+                    "url": url,
+                    "title": (record.title or url)[:500],
+                    "description": record.description or "",
+                    "user_id": user_id,
+                }
+                # Leave timestamps to the database defaults unless the record has them
+                if record.created_at:
+                    row["created_at"] = record.created_at
+                if record.updated_at:
+                    row["updated_at"] = record.updated_at
+                rows.append(row)
+            
+            ids = self._insert_bookmark_rows(db, rows)
+            tag_ids = tag_cache.resolve(db, user_id, [name for record in valid for name in record.tags])
+            insert_ignore(db, user_tags, [
+                {"bookmark_id": bookmark_id, "tag_id": tag_ids[name]}
+                for bookmark_id, record in zip(ids, valid)
+                for name in dict.fromkeys(record.tags)
+            ])
+            duplicate_index.index_bookmarks(db, user_id, [
+                (bookmark_id, row["url"], row["title"], row["description"]) for bookmark_id, row in zip(ids, rows)
+            ])
+            possible_duplicates += duplicate_index.count_flagged(db, user_id, ids)
+            # One event per batch; clients reload rather than receive every bookmark
+            change_events.record(db, user_id, "bookmarks.imported", {"count": len(ids)})
+            db.commit()
+            imported += len(valid)
         
-        return query.scalar() or 0
+        tag_suggestions.invalidate(user_id)
+        related_tags.invalidate(user_id)
+        logger.info("Bulk import complete", extra={
+            "user_id": user_id, "imported": imported, "skipped": skipped, "possible_duplicates": possible_duplicates,
+        })
+        return {"imported": imported, "skipped": skipped, "possible_duplicates": possible_duplicates}
+    
+    def _insert_bookmark_rows(self, db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+        """Insert bookmark rows and return their ids in input order."""
+        # Rows with and without timestamps need separate statements to keep the
+        # column list (and so the database defaults) consistent per statement
+        groups: Dict[tuple, List[int]] = {}
+        for index, row in enumerate(rows):
+            groups.setdefault(tuple(sorted(row)), []).append(index)
+        
+        ids: List[int] = [0] * len(rows)
+        table = Bookmark.__table__
+        for indexes in groups.values():
+            result = db.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True),
+                [rows[index] for index in indexes]
+            )
+            for index, (bookmark_id,) in zip(indexes, result):
+                ids[index] = bookmark_id
+        return ids
     
     def _fetch_page_title(self, url: str) -> Optional[str]:
         """Fetch page title from URL with multiple fallback strategies."""
-        headers_list = [
-            # Chrome on macOS
-            {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            },
-            # Firefox on macOS
-            {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:120.0) Gecko/20100101 Firefox/120.0',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            },
-            # Simple bot-friendly headers
-            {
-                'User-Agent': 'StupidBookmarks/1.0 (+https://github.com/dannycab/stupidbookmarks)',
-                'Accept': 'text/html,application/xhtml+xml',
-            }
-        ]
+        return self._fetch_page(url).title
+    
+    def _fetch_page(self, url: str) -> FetchResult:
+        """Fetch a page and extract its title.
+        
+        Falls back to other client headers only when the response suggests
+        we were blocked (403/406/429/503); timeouts, connection errors and
+        other statuses won't improve with a different User-Agent.
+        """
+        # Imported here so app startup doesn't pay for them
+        import requests
+        from bs4 import BeautifulSoup
         
-        for i, headers in enumerate(headers_list):
+        for i, headers in enumerate(FETCH_HEADERS):
             try:
-                print(f"Attempting to fetch title from: {url} (strategy {i+1}/{len(headers_list)})")
+                logger.debug("Fetching title", extra={"url": url, "strategy": i + 1, "sampled": True})
                 
                 # Use different timeouts for different strategies
                 timeout = 15 if i == 0 else (10 if i == 1 else 5)
@@ -228,8 +488,7 @@ class BookmarkService:
                     allow_redirects=True,
                     verify=True
                 )
-                
-                print(f"Response status: {response.status_code}")
+                result = FetchResult(status_code=response.status_code)
                 
                 if response.status_code == 200:
                     # Try different encodings if needed
@@ -249,28 +508,24 @@ class BookmarkService:
                     title_tag = soup.find('title')
                     if title_tag and title_tag.get_text().strip():
                         title = title_tag.get_text().strip()
-                        print(f"Found title in <title> tag: {title}")
                     
                     # 2. Open Graph title
                     if not title:
                         og_title = soup.find('meta', property='og:title')
                         if og_title and og_title.get('content'):
                             title = og_title['content'].strip()
-                            print(f"Found title in og:title: {title}")
                     
                     # 3. Twitter title
                     if not title:
                         twitter_title = soup.find('meta', attrs={'name': 'twitter:title'})
                         if twitter_title and twitter_title.get('content'):
                             title = twitter_title['content'].strip()
-                            print(f"Found title in twitter:title: {title}")
                     
                     # 4. First h1 tag
                     if not title:
                         h1_tag = soup.find('h1')
                         if h1_tag and h1_tag.get_text().strip():
                             title = h1_tag.get_text().strip()
-                            print(f"Found title in h1: {title}")
                     
                     if title:
                         # Clean up the title
@@ -281,43 +536,44 @@ class BookmarkService:
                         if len(title) > 200:
                             title = title[:197] + "..."
                         
-                        print(f"Successfully fetched title: {title}")
-                        return title
-                    else:
-                        print("No title found in any meta tags")
+                        result.title = title
+                        return result
+                    logger.debug("No title found in page", extra={"url": url})
+                    return result
                 
-                print(f"Failed to fetch title: HTTP {response.status_code}")
+                logger.debug(
+                    "Title fetch failed",
+                    extra={"url": url, "strategy": i + 1, "status": response.status_code, "sampled": True}
+                )
+                if response.status_code not in BLOCKED_STATUSES:
+                    return result
                 
             except requests.exceptions.Timeout:
-                print(f"Timeout fetching title (strategy {i+1})")
-                continue
+                logger.debug("Title fetch timed out", extra={"url": url, "strategy": i + 1, "sampled": True})
+                return FetchResult(error="timeout")
+            except requests.exceptions.ConnectionError as e:
+                logger.debug("Title fetch connection error", extra={"url": url, "error": str(e), "sampled": True})
+                return FetchResult(error="connection")
             except requests.exceptions.RequestException as e:
-                print(f"Request error fetching title (strategy {i+1}): {e}")
-                continue
+                logger.debug("Title fetch request error", extra={"url": url, "strategy": i + 1, "error": str(e), "sampled": True})
+                return FetchResult(error="request")
             except Exception as e:
-                print(f"Unexpected error fetching title (strategy {i+1}): {e}")
+                logger.warning("Unexpected error fetching title", extra={"url": url, "strategy": i + 1, "error": str(e)})
+                result = FetchResult(error="request")
                 continue
         
-        print("All title fetching strategies failed")
-        return None
+        logger.info("All title fetching strategies failed", extra={"url": url})
+        return result
     
-    def _add_tags_to_bookmark(self, db: Session, bookmark: Bookmark, tags_str: str, user_id: int):
-        """Add tags to a bookmark."""
-        # Parse tags (comma or space separated)
-        tag_names = [
-            tag.strip().lower() 
-            for tag in re.split(r'[,\s]+', tags_str) 
-            if tag.strip()
-        ]
-        
-        for tag_name in tag_names:
-            # Get or create tag
-            tag = db.query(Tag).filter(Tag.name == tag_name, Tag.user_id == user_id).first()
-            if not tag:
-                tag = Tag(name=tag_name, user_id=user_id)
-                db.add(tag)
-                db.flush()
-            
-            # Add to bookmark if not already added
-            if tag not in bookmark.tags:
-                bookmark.tags.append(tag)
+    def _add_tags_to_bookmark(self, db: Session, bookmark: Bookmark, tag_names: List[str], user_id: int):
+        """Add tags (already parsed with ``parse_tag_names``) to a bookmark."""
+        # Resolve (and create) all tags at once, then link them without
+        # loading the bookmark's tag collection
+        tag_ids = tag_cache.resolve(db, user_id, tag_names)
+        insert_ignore(db, user_tags, [
+            {"bookmark_id": bookmark.id, "tag_id": tag_id}
+            for tag_id in dict.fromkeys(tag_ids.values())
+        ])
+        db.expire(bookmark, ["tags"])
+        tag_suggestions.record_usage(db, user_id, list(tag_ids))
+        related_tags.record_bookmarks(db, user_id, [list(tag_ids)])
@@ -0,0 +1,321 @@
+"""Server-sent change events: bookmark and tag changes pushed to open streams."""
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import threading
+import time
+from collections import deque
+from functools import partial
+from typing import AsyncIterator, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.responses import StreamingResponse
+
+from services.per_user import PendingOnCommit
+from services.rate_limit import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# Recent events kept per user for clients resuming with Last-Event-ID
+EVENTS_BUFFER_SIZE = max(1, int(os.getenv("EVENTS_BUFFER_SIZE", "1000")))
+# Seconds between keep-alive comments on an idle stream
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+# Open event streams allowed per worker
+EVENTS_MAX_CONNECTIONS = int(os.getenv("EVENTS_MAX_CONNECTIONS", "10000"))
+# "memory" (events reach streams on the same worker) or a redis:// URL relaying them between workers
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+# Reconnect delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+class ChangeEvent(NamedTuple):
+    id: int
+    frame: str
+
+class RedisRelay:
+    """Carries events between workers over Redis pub/sub.
+
+    Ids come from one Redis counter, and the increment and publish run as
+    one script, so every worker sees the same ids in the same order and a
+    client can resume on any of them.
+    """
+
+    SCRIPT = """
+    local id = redis.call('INCR', KEYS[1])
+    redis.call('PUBLISH', KEYS[2], id .. ' ' .. ARGV[1])
+    return id
+    """
+    PREFIX = "stupidbookmarks:events"
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for a shared backend
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._listener: Optional[threading.Thread] = None
+
+    def epoch(self) -> str:
+        """Shared by all workers; changes only if Redis loses the counter."""
+        self._client.set(f"{self.PREFIX}:epoch", secrets.token_hex(4), nx=True)
+        return self._client.get(f"{self.PREFIX}:epoch").decode()
+
+    def last_id(self) -> int:
+        return int(self._client.get(f"{self.PREFIX}:id") or 0)
+
+    def publish(self, user_id: int, event_type: str, payload: str):
+        self._script(keys=[f"{self.PREFIX}:id", f"{self.PREFIX}:channel"], args=[f"{user_id} {event_type} {payload}"])
+
+    def start(self, broker: "ChangeEventBroker"):
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, args=(broker,), name="change-events-relay", daemon=True)
+            self._listener.start()
+
+    def _listen(self, broker: "ChangeEventBroker"):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(f"{self.PREFIX}:channel")
+                while True:
+                    message = pubsub.get_message(timeout=30)
+                    if message:
+                        event_id, user_id, event_type, payload = message["data"].decode().split(" ", 3)
+                        broker._append(int(event_id), int(user_id), event_type, payload)
+            except Exception as e:
+                # Events published meanwhile are lost; the id gap makes streams resync
+                logger.warning("Change event relay disconnected, retrying: %s", e)
+                time.sleep(1)
+
+class ChangeEventBroker:
+    """Fans committed changes out to open event streams.
+
+    Each user's recent events are kept as ready-to-send frames in a bounded
+    ring buffer. An idle stream holds only its position in that buffer and,
+    while waiting, one future; a publish wakes just that user's streams, and
+    one shared timer sends every stream its heartbeat. A stream asking to
+    resume from an event that has already left the buffer (or from another
+    server run) gets a ``reset`` event instead, telling it to reload.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = EVENTS_BUFFER_SIZE,
+        heartbeat: float = EVENTS_HEARTBEAT_SECONDS,
+        max_connections: int = EVENTS_MAX_CONNECTIONS,
+        backend: str = EVENTS_BACKEND
+    ):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.max_connections = max_connections
+        self.connections = 0
+        self._relay = self._create_relay(backend)
+        self._lock = threading.Lock()
+        self._buffers: Dict[int, Deque[ChangeEvent]] = {}
+        # Newest id that fell out of each user's buffer, and newest id never received at all
+        self._dropped_through: Dict[int, int] = {}
+        self._lost_through = 0
+        self._last_id = 0
+        self._epoch = secrets.token_hex(4)
+        self._waiters: Dict[int, Set[asyncio.Future]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._pending = PendingOnCommit(self._publish_committed, list)
+
+    def record(self, db: Session, user_id: int, event_type: str, data: dict):
+        """Publish an event once ``db`` commits (dropped if it rolls back)."""
+        self._pending.queue(db).append((user_id, event_type, data))
+
+    def publish(self, user_id: int, event_type: str, data: dict):
+        """Send an event to the user's streams now; safe to call from any thread."""
+        payload = json.dumps(data, separators=(",", ":"), default=str)
+        if self._relay is not None:
+            try:
+                self._relay.publish(user_id, event_type, payload)
+            except Exception as e:
+                logger.warning("Change event relay failed, event dropped: %s", e)
+            return
+        self._append(None, user_id, event_type, payload)
+
+    def start(self):
+        """Bind to the running loop, start heartbeats, and end streams when the server is told to exit."""
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        if self._relay is not None:
+            try:
+                self._epoch = self._relay.epoch()
+                self._last_id = self._lost_through = self._relay.last_id()
+            except Exception as e:
+                logger.warning("Change event relay unavailable at startup: %s", e)
+            self._relay.start(self)
+        if self._heartbeat_task is None and self.heartbeat > 0:
+            self._heartbeat_task = asyncio.create_task(self._send_heartbeats())
+        # Open streams never finish on their own and would hold up a graceful shutdown
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous = signal.getsignal(signum)
+                if callable(previous):
+                    signal.signal(signum, partial(self._on_exit_signal, previous))
+
+    def close(self):
+        """End every open stream (clients reconnect and resume elsewhere)."""
+        self._closed = True
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        self._wake_all(False)
+
+    def forget(self, user_id: int):
+        """Drop a deleted user's buffered events."""
+        with self._lock:
+            self._buffers.pop(user_id, None)
+            self._dropped_through.pop(user_id, None)
+
+    def open(self, user_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """A stream of SSE frames for ``user_id``; raises ``Overloaded`` when streams are at the limit."""
+        if self.connections >= self.max_connections:
+            raise Overloaded(RETRY_MS / 1000, "Too many open event streams")
+        return self._stream(user_id, self._resume_point(last_event_id))
+
+    async def _stream(self, user_id: int, cursor: Optional[int]) -> AsyncIterator[str]:
+        self.connections += 1
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if cursor is None:
+                cursor = self._last_id
+                yield self._reset_frame(cursor)
+            loop = asyncio.get_running_loop()
+            while not self._closed:
+                frames, cursor = self._since(user_id, cursor)
+                if frames:
+                    yield "".join(frames)
+                waiter = loop.create_future()
+                waiters = self._waiters.setdefault(user_id, set())
+                waiters.add(waiter)
+                try:
+                    if not await waiter and not self._closed:
+                        yield ": ping\n\n"
+                finally:
+                    waiters.discard(waiter)
+                    if not waiters and self._waiters.get(user_id) is waiters:
+                        del self._waiters[user_id]
+        finally:
+            self.connections -= 1
+
+    def _publish_committed(self, pending: List[Tuple[int, str, dict]]):
+        for user_id, event_type, data in pending:
+            self.publish(user_id, event_type, data)
+
+    def _resume_point(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Id to continue after, or ``None`` when the client has to reload."""
+        if not last_event_id:
+            return self._last_id
+        epoch, _, number = last_event_id.partition("-")
+        if epoch != self._epoch or not number.isdigit() or int(number) > self._last_id:
+            return None
+        return int(number)
+
+    def _since(self, user_id: int, cursor: int) -> Tuple[List[str], int]:
+        """Frames after ``cursor`` and the new cursor; a reset frame if some were missed."""
+        with self._lock:
+            last_id = self._last_id
+            if cursor < max(self._lost_through, self._dropped_through.get(user_id, 0)):
+                return [self._reset_frame(last_id)], last_id
+            frames = []
+            for change in reversed(self._buffers.get(user_id, ())):
+                if change.id <= cursor:
+                    break
+                frames.append(change.frame)
+        frames.reverse()
+        return frames, last_id
+
+    def _append(self, event_id: Optional[int], user_id: int, event_type: str, payload: str):
+        with self._lock:
+            if event_id is None:
+                event_id = self._last_id + 1
+            elif event_id <= self._last_id:
+                return
+            if event_id > self._last_id + 1:
+                self._lost_through = event_id - 1
+            self._last_id = event_id
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = deque(maxlen=self.buffer_size)
+            elif len(buffer) == self.buffer_size:
+                self._dropped_through[user_id] = buffer[0].id
+            buffer.append(ChangeEvent(event_id, f"id: {self._epoch}-{event_id}\nevent: {event_type}\ndata: {payload}\n\n"))
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake, user_id)
+
+    def _reset_frame(self, event_id: int) -> str:
+        return f"id: {self._epoch}-{event_id}\nevent: reset\ndata: {{}}\n\n"
+
+    def _wake(self, user_id: int):
+        for waiter in self._waiters.get(user_id, ()):
+            if not waiter.done():
+                waiter.set_result(True)
+
+    def _wake_all(self, value: bool):
+        for waiters in self._waiters.values():
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(value)
+
+    async def _send_heartbeats(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            self._wake_all(False)
+
+    def _on_exit_signal(self, previous, signum, frame):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.close)
+        previous(signum, frame)
+
+    def _create_relay(self, backend: str) -> Optional[RedisRelay]:
+        if backend.startswith(("redis://", "rediss://", "unix://")):
+            try:
+                return RedisRelay(backend)
+            except ImportError:
+                logger.warning("EVENTS_BACKEND is Redis but the redis package is missing; events stay on each worker")
+        elif backend != "memory":
+            logger.warning("Unknown EVENTS_BACKEND %r; events stay on each worker", backend)
+        return None
+
+class EventStreamResponse(StreamingResponse):
+    """A ``text/event-stream`` response that is cheap to keep open.
+
+    ``StreamingResponse`` runs each response in a task group of its own;
+    here the stream runs in one plain task next to a second one that waits
+    for the client to disconnect and then cancels the stream.
+    """
+
+    media_type = "text/event-stream"
+
+    async def __call__(self, scope, receive, send):
+        async def stream():
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            async for chunk in self.body_iterator:
+                await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+        stream_task = asyncio.ensure_future(stream())
+
+        async def cancel_on_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            stream_task.cancel()
+
+        watcher = asyncio.ensure_future(cancel_on_disconnect())
+        try:
+            await stream_task
+        except asyncio.CancelledError:
+            # The client went away; that is how event streams normally end.
+            # Anything else cancelled us rather than just the stream task
+            if not watcher.done():
+                raise
+        finally:
+            watcher.cancel()
+            await self.body_iterator.aclose()
+
+change_events = ChangeEventBroker()
@@ -0,0 +1,342 @@
+"""Near-duplicate bookmark detection with MinHash and locality-sensitive hashing.
+
+Each bookmark is reduced to a set of tokens: the host and path words of its
+normalized URL, the words and word pairs of its title, and the first words
+of its description. A MinHash signature of ``NUM_BANDS * BAND_ROWS`` values
+summarizes that set and is cut into bands; each band is hashed together with
+the user id and stored as a ``duplicate_bands`` row. Bookmarks that share a
+band key are candidates, and candidates are compared exactly before being
+reported, so checking a bookmark reads a few index entries instead of the
+whole collection. Bookmarks whose normalized URLs match (ignoring the
+scheme) also share a key, so they are always found.
+
+With 12 bands of 4 values, a pair with 70% of its tokens in common becomes
+a candidate 96% of the time (80%: over 99%), one with 30% in common less
+than a tenth of the time.
+
+Bands are written with each new bookmark; ``backfill`` indexes bookmarks
+added before this existed, in id order, a batch at a time.
+
+Usage:
+    python -m services.duplicate_index [--report USER_ID]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from functools import lru_cache
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from sqlalchemy import exists, func, select
+from sqlalchemy.orm import Session, aliased
+
+from models.database import DATA_DIR, SessionLocal, file_lock, insert_ignore, user_scopes, user_session
+from models.models import Bookmark, DuplicateBand
+from services.metadata_service import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Share of tokens two bookmarks need in common to be reported
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.7"))
+
+NUM_BANDS = 12
+BAND_ROWS = 4
+SIGNATURE_SIZE = NUM_BANDS * BAND_ROWS
+# Band number used for the normalized URL key
+URL_BAND = NUM_BANDS
+# Bookmarks indexed per commit by backfill
+BACKFILL_BATCH = 1000
+# Bookmarks checked per query when flagging imported ones
+FLAG_BATCH = 500
+MAX_DESCRIPTION_WORDS = 100
+
+WORD_RE = re.compile(r"\w{2,}")
+# Words too common in titles and URLs to say anything about the page
+STOP_WORDS = frozenset(
+    "an and are as at be by com do for from how html in index is it of on or php "
+    "the this to what when why with www you your".split()
+)
+
+# (id, url, title, description)
+BookmarkText = Tuple[int, str, str, str]
+
+def _words(text: Optional[str]) -> List[str]:
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOP_WORDS] if text else []
+
+def comparable(url: str, title: Optional[str], description: Optional[str]) -> Tuple[str, Set[str]]:
+    """What bookmarks are compared on: ``(url_key, tokens)``.
+
+    ``url_key`` is the normalized URL without its scheme, so http and https
+    copies match.
+    """
+    normalized = normalize_url(url)
+    parts = urlsplit(normalized)
+    tokens = {"@" + parts.netloc}
+    tokens.update("/" + word for word in _words(f"{parts.path} {parts.query}"))
+    # Placeholder titles say nothing about the page
+    title = (title or "").strip()
+    if title.lower() != "untitled" and title != url:
+        words = _words(title)
+        tokens.update(words)
+        tokens.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    tokens.update(islice(_words(description), MAX_DESCRIPTION_WORDS))
+    return normalized.partition("://")[2], tokens
+
+def similarity(a: Tuple[str, Set[str]], b: Tuple[str, Set[str]]) -> float:
+    """Jaccard similarity of two ``(url_key, tokens)`` pairs; 1.0 for the same URL."""
+    if a[0] == b[0]:
+        return 1.0
+    return len(a[1] & b[1]) / len(a[1] | b[1])
+
+@lru_cache(maxsize=65536)
+def _token_hashes(token: str) -> array:
+    # One extendable-output hash gives all of a token's independent hash values
+    return array("I", hashlib.shake_128(token.encode()).digest(4 * SIGNATURE_SIZE))
+
+def minhash(tokens: Set[str]) -> List[int]:
+    """MinHash signature: per position, the smallest hash over all tokens."""
+    hashes = [_token_hashes(token) for token in tokens]
+    if len(hashes) == 1:
+        return list(hashes[0])
+    return list(map(min, *hashes))
+
+def _band_key(user_id: int, band: int, data: bytes) -> int:
+    digest = hashlib.blake2b(struct.pack("<qi", user_id, band) + data, digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+def band_keys(user_id: int, key: str, tokens: Set[str]) -> List[int]:
+    """LSH keys for a bookmark: one per signature band, plus its URL's."""
+    signature = minhash(tokens)
+    keys = [
+        _band_key(user_id, band, struct.pack(f"<{BAND_ROWS}I", *signature[band * BAND_ROWS:(band + 1) * BAND_ROWS]))
+        for band in range(NUM_BANDS)
+    ]
+    keys.append(_band_key(user_id, URL_BAND, key.encode()))
+    return keys
+
+class DuplicateIndex:
+    """Finds bookmarks that look like the same page through ``duplicate_bands``."""
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        self._stop = threading.Event()
+
+    def index_bookmarks(self, db: Session, user_id: int, bookmarks: Iterable[BookmarkText]):
+        """Write band rows for new bookmarks of one user, without committing."""
+        insert_ignore(db, DuplicateBand.__table__, [
+            {"band_key": key, "bookmark_id": bookmark_id}
+            for bookmark_id, url, title, description in bookmarks
+            for key in band_keys(user_id, *comparable(url, title, description))
+        ])
+
+    def similar_to(self, db: Session, user_id: int, bookmark_id: int, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """Bookmarks that look like duplicates of this one, most similar first.
+
+        ``None`` if the bookmark doesn't exist or isn't the user's.
+        """
+        columns = (Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description, Bookmark.created_at)
+        target = db.execute(
+            select(*columns).where(Bookmark.id == bookmark_id, Bookmark.user_id == user_id)
+        ).first()
+        if target is None:
+            return None
+        shared = select(DuplicateBand.band_key).where(DuplicateBand.bookmark_id == bookmark_id)
+        rows = db.execute(
+            select(*columns)
+            .join(DuplicateBand, DuplicateBand.bookmark_id == Bookmark.id)
+            .where(DuplicateBand.band_key.in_(shared), Bookmark.id != bookmark_id, Bookmark.user_id == user_id)
+            .distinct()
+        )
+        compared = self._compared(target)
+        matches = []
+        for row in rows:
+            score = similarity(compared, self._compared(row))
+            if score >= self.threshold:
+                matches.append(self._match(row, score))
+        matches.sort(key=lambda match: (-match["similarity"], match["id"]))
+        return matches[:limit]
+
+    def count_flagged(self, db: Session, user_id: int, bookmark_ids: List[int]) -> int:
+        """How many of these (indexed) bookmarks look like a duplicate of an older one."""
+        flagged = 0
+        this, other = aliased(DuplicateBand), aliased(DuplicateBand)
+        for start in range(0, len(bookmark_ids), FLAG_BATCH):
+            chunk = bookmark_ids[start:start + FLAG_BATCH]
+            texts = {
+                row.id: self._compared(row) for row in db.execute(
+                    select(Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description)
+                    .where(Bookmark.user_id == user_id, Bookmark.id.in_(chunk))
+                )
+            }
+            candidates = db.execute(
+                select(this.bookmark_id.label("of"), Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description)
+                .join(other, other.band_key == this.band_key)
+                .join(Bookmark, Bookmark.id == other.bookmark_id)
+                .where(this.bookmark_id.in_(chunk), other.bookmark_id < this.bookmark_id, Bookmark.user_id == user_id)
+                .distinct()
+                .order_by(this.bookmark_id)
+            )
+            for bookmark_id, group in groupby(candidates, key=itemgetter(0)):
+                if bookmark_id in texts and any(
+                    similarity(texts[bookmark_id], self._compared(row)) >= self.threshold for row in group
+                ):
+                    flagged += 1
+        return flagged
+
+    def report(self, db: Session, user_id: int, limit: int = 50) -> Dict[str, Any]:
+        """Groups of bookmarks that look like duplicates of each other, largest first.
+
+        Each group lists its bookmarks oldest first, with their similarity to
+        the oldest one.
+        """
+        started = time.perf_counter()
+        shared = (
+            select(DuplicateBand.band_key)
+            .group_by(DuplicateBand.band_key)
+            .having(func.count() > 1)
+        )
+        buckets = db.execute(
+            select(DuplicateBand.band_key, Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.description, Bookmark.created_at)
+            .join(Bookmark, Bookmark.id == DuplicateBand.bookmark_id)
+            .where(Bookmark.user_id == user_id, DuplicateBand.band_key.in_(shared))
+            .order_by(DuplicateBand.band_key, DuplicateBand.bookmark_id)
+        ).all()
+        rows = {row.id: row for row in buckets}
+        compared: Dict[int, Tuple[str, Set[str]]] = {}
+
+        def compare(a: int, b: int) -> float:
+            for bookmark_id in (a, b):
+                if bookmark_id not in compared:
+                    compared[bookmark_id] = self._compared(rows[bookmark_id])
+            return similarity(compared[a], compared[b])
+
+        # Union-find over verified pairs; each bucket is only compared against
+        # its oldest member, so a large bucket costs one pass, not every pair
+        parent: Dict[int, int] = {}
+
+        def find(bookmark_id: int) -> int:
+            root = bookmark_id
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while bookmark_id != root:
+                parent[bookmark_id], bookmark_id = root, parent[bookmark_id]
+            return root
+
+        for _, bucket in groupby(buckets, key=itemgetter(0)):
+            anchor, *others = [row.id for row in bucket]
+            for other in others:
+                if find(anchor) != find(other) and compare(anchor, other) >= self.threshold:
+                    parent.setdefault(anchor, anchor)
+                    parent[find(other)] = find(anchor)
+
+        groups: Dict[int, List[int]] = {}
+        for bookmark_id in parent:
+            groups.setdefault(find(bookmark_id), []).append(bookmark_id)
+        ranked = sorted(groups.values(), key=lambda members: (-len(members), -max(members)))
+        result = []
+        for members in ranked[:limit]:
+            members.sort()
+            oldest = members[0]
+            result.append([
+                self._match(rows[bookmark_id], compare(oldest, bookmark_id) if bookmark_id != oldest else 1.0)
+                for bookmark_id in members
+            ])
+        logger.info("Duplicate report", extra={
+            "user_id": user_id, "groups": len(groups), "candidates": len(rows),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        return {"groups": result, "total_groups": len(groups), "unindexed": self.unindexed(db, user_id)}
+
+    def unindexed(self, db: Session, user_id: int) -> int:
+        """Bookmarks the backfill hasn't reached yet."""
+        return db.execute(
+            select(func.count(Bookmark.id))
+            .where(Bookmark.user_id == user_id, ~exists().where(DuplicateBand.bookmark_id == Bookmark.id))
+        ).scalar()
+
+    def backfill(self, batch_size: int = BACKFILL_BATCH) -> Dict[str, Any]:
+        """Index every bookmark that has no bands yet, one committed batch at a time."""
+        with file_lock(os.path.join(DATA_DIR, ".duplicates.lock"), blocking=False) as acquired:
+            if not acquired:
+                logger.info("Duplicate backfill already running in another process")
+                return {"indexed": 0, "skipped": True}
+            started = time.perf_counter()
+            indexed = 0
+            for scope in user_scopes():
+                last_id = 0
+                db = user_session(SessionLocal, scope)
+                try:
+                    while not self._stop.is_set():
+                        batch = db.execute(
+                            select(Bookmark.id, Bookmark.user_id, Bookmark.url, Bookmark.title, Bookmark.description)
+                            .where(Bookmark.id > last_id, ~exists().where(DuplicateBand.bookmark_id == Bookmark.id))
+                            .order_by(Bookmark.id)
+                            .limit(batch_size)
+                        ).all()
+                        if not batch:
+                            break
+                        for user_id, rows in groupby(sorted(batch, key=itemgetter(1)), key=itemgetter(1)):
+                            self.index_bookmarks(db, user_id, [
+                                (row.id, row.url, row.title, row.description) for row in rows
+                            ])
+                        db.commit()
+                        indexed += len(batch)
+                        last_id = batch[-1].id
+                finally:
+                    db.close()
+            if indexed:
+                logger.info("Duplicate backfill finished", extra={
+                    "indexed": indexed, "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                })
+            return {"indexed": indexed, "skipped": False}
+
+    def run_backfill(self):
+        """``backfill`` for a background task: errors are logged, not raised."""
+        try:
+            self.backfill()
+        except Exception:
+            logger.exception("Duplicate backfill failed")
+
+    def stop(self):
+        """Make a running backfill stop after its current batch."""
+        self._stop.set()
+
+    @staticmethod
+    def _compared(row: Any) -> Tuple[str, Set[str]]:
+        return comparable(row.url, row.title, row.description)
+
+    @staticmethod
+    def _match(row: Any, score: float) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "url": row.url,
+            "title": row.title,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "similarity": round(score, 2),
+        }
+
+duplicate_index = DuplicateIndex()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index bookmarks for near-duplicate detection.")
+    parser.add_argument("--report", type=int, metavar="USER_ID", help="print this user's possible duplicates afterwards")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    result = duplicate_index.backfill()
+    if args.report is not None:
+        db = user_session(SessionLocal, args.report)
+        try:
+            result["report"] = duplicate_index.report(db, args.report)
+        finally:
+            db.close()
+    print(json.dumps(result, indent=2))
@@ -1,13 +1,19 @@
 """Service for importing and exporting bookmarks in various formats."""
 
-from typing import List, Dict, Any, Optional
+from typing import BinaryIO, Iterator, List, Dict, Any, Optional
 from datetime import datetime
+import codecs
+import logging
 import re
-from bs4 import BeautifulSoup
 from sqlalchemy.orm import Session
 
 from models.models import Bookmark, User, Tag
+from services.bookmark_formats import READERS, WRITERS
+from services.bookmark_reader import bookmark_reader
 from services.bookmark_service import BookmarkService
+from services.duplicate_index import duplicate_index
+
+logger = logging.getLogger(__name__)
 
 class BookmarkExportService:
     """Service for exporting bookmarks to different formats."""
@@ -18,7 +24,7 @@ class BookmarkExportService:
     def export_netscape_html(self, db: Session, user_id: int) -> str:
         """Export bookmarks to Netscape HTML format."""
         # Get all bookmarks for the user
-        bookmarks = self.bookmark_service.get_bookmarks(db, user_id, limit=10000)
+        bookmarks = list(bookmark_reader.iter_bookmarks(db, user_id))
         
         # Create HTML template
         html = f"""<!DOCTYPE NETSCAPE-Bookmark-file-1>
@@ -36,10 +42,10 @@ class BookmarkExportService:
         # Group bookmarks by tag
         tags_dict = {}
         for bookmark in bookmarks:
-            for tag in bookmark.tags:
-                if tag.name not in tags_dict:
-                    tags_dict[tag.name] = []
-                tags_dict[tag.name].append(bookmark)
+            for tag_name in bookmark.tags:
+                if tag_name not in tags_dict:
+                    tags_dict[tag_name] = []
+                tags_dict[tag_name].append(bookmark)
         
         # Add bookmarks with no tags first
         untagged_bookmarks = [b for b in bookmarks if not b.tags]
@@ -68,42 +74,51 @@ class BookmarkExportService:
 """
         return html
 
+    def export_records(self, db: Session, user_id: int, export_format: str) -> Iterator[str]:
+        """Stream all bookmarks as ``ndjson``, ``csv`` or ``pinboard`` JSON."""
+        writer = WRITERS[export_format]
+        return writer(self.bookmark_service.iter_records(db, user_id))
+
+    def import_records(self, db: Session, user_id: int, import_format: str, data: BinaryIO) -> Dict[str, Any]:
+        """Import an ``ndjson``, ``csv`` or ``pinboard`` file through the bulk insert path.
+
+        ``data`` is read line by line, so the file is never loaded whole.
+        """
+        reader = READERS[import_format]
+        lines = codecs.iterdecode(data, "utf-8-sig")
+        logger.info("Starting bulk import", extra={"user_id": user_id, "format": import_format})
+        result = self.bookmark_service.bulk_import(db, user_id, reader(lines))
+        return {**result, "errors": []}
+
     def import_netscape_html(self, db: Session, user_id: int, html_content: str) -> Dict[str, Any]:
         """Import bookmarks from Netscape HTML format."""
+        from bs4 import BeautifulSoup  # only needed here; keep it out of app startup
+        
         imported_count = 0
         skipped_count = 0
+        imported_ids = []
         errors = []
         
         try:
-            print(f"Starting import process. HTML content length: {len(html_content)}")
             # Parse with html.parser which is more forgiving for malformed HTML
             soup = BeautifulSoup(html_content, 'html.parser')
             
-            # Basic HTML structure info
-            print(f"HTML structure summary:")
-            print(f"- Has HTML tag: {bool(soup.find('html'))}")
-            print(f"- Has DL tag: {bool(soup.find('dl'))}")
-            print(f"- Has TITLE tag: {bool(soup.find('title'))}")
-            print(f"- Has H1 tag: {bool(soup.find('h1'))}")
             links = soup.find_all('a')
-            print(f"- Total A tags: {len(links)}")
+            logger.info("Starting Netscape import", extra={"user_id": user_id, "bytes": len(html_content), "links": len(links)})
             
             # Process all links directly for simplicity and reliability
-            print(f"Processing {len(links)} links found in document")
             for a in links:
                 url = a.get('href')
                 title = a.text.strip()
                 
                 if not url or not url.strip():
-                    print(f"Skipping bookmark with empty URL")
+                    logger.debug("Skipping bookmark with empty URL", extra={"sampled": True})
                     skipped_count += 1
                     continue
                 
                 if not title:
                     title = url
                 
-                print(f"Processing bookmark: {title[:30]}... - {url[:30]}...")
-                
                 # Find potential parent folder (H3) to use as tags
                 current_element = a
                 folder_tags = []
@@ -115,7 +130,6 @@ class BookmarkExportService:
                     next_dd = parent_dt.find_next_sibling()
                     if next_dd and next_dd.name == 'dd':
                         description = next_dd.text.strip()
-                        print(f"Found description: {description[:30]}...")
                 
                 # Try to find parent folder structure by traversing up the DOM
                 while current_element:
@@ -130,7 +144,6 @@ class BookmarkExportService:
                                 if folder_name.lower() not in ['bookmarks', 'favorites', 'bookmark bar', 'bookmarks bar', 
                                                              'bookmarks menu', 'other bookmarks', 'personal toolbar folder']:
                                     folder_tags.insert(0, folder_name)
-                                    print(f"Found parent folder: {folder_name}")
                     
                     current_element = current_element.parent
                 
@@ -144,14 +157,13 @@ class BookmarkExportService:
                     tag_attr = a.get('tags', '')
                     if tag_attr:
                         extra_tags = [t.strip() for t in tag_attr.split(',')]
-                        print(f"Found tags attribute: {extra_tags}")
                 
                 # Combine all tags
                 all_tags = folder_tags + extra_tags
                 tags_str = " ".join(all_tags) if all_tags else ""
                 
                 try:
-                    self.bookmark_service.add_bookmark(
+                    bookmark = self.bookmark_service.add_bookmark(
                         db=db,
                         user_id=user_id,
                         url=url,
@@ -160,24 +172,29 @@ class BookmarkExportService:
                         tags=tags_str
                     )
                     imported_count += 1
-                    print(f"Successfully added bookmark. Import count: {imported_count}")
+                    imported_ids.append(bookmark.id)
+                    logger.debug("Imported bookmark", extra={"url": url, "tags": tags_str, "sampled": True})
                 except Exception as e:
-                    print(f"Error importing bookmark: {str(e)}")
+                    logger.warning("Error importing bookmark", extra={"url": url, "error": str(e)})
                     errors.append(f"Error importing {url}: {str(e)}")
                     skipped_count += 1
             
         except Exception as e:
-            print(f"Exception during import: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Exception during import")
             errors.append(f"Error parsing HTML: {str(e)}")
         
-        print(f"Import complete: {imported_count} imported, {skipped_count} skipped, {len(errors)} errors")
-        if errors:
-            print(f"First few errors: {errors[:3]}")
+        possible_duplicates = duplicate_index.count_flagged(db, user_id, imported_ids)
+        logger.info(
+            "Import complete",
+            extra={
+                "user_id": user_id, "imported": imported_count, "skipped": skipped_count,
+                "possible_duplicates": possible_duplicates, "error_count": len(errors),
+            }
+        )
             
         return {
             "imported": imported_count,
             "skipped": skipped_count,
+            "possible_duplicates": possible_duplicates,
             "errors": errors
         }
@@ -0,0 +1,200 @@
+"""Request timing, query counting and metrics for StupidBookmarks."""
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Queries slower than this are logged with their SQL
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+class RequestStats:
+    """Database work done while serving one request."""
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by a label tuple."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            # one slot per bucket, then +Inf, sum
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self, name: str, label_names: Tuple[str, ...]) -> List[str]:
+        lines = []
+        for labels, series in sorted(self._series.items()):
+            base = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(label_names, labels))
+            prefix = base + "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{name}_count{{{base}}} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """In-process metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(LATENCY_BUCKETS)
+        self.request_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.requests_total: Dict[Tuple[str, str, str], int] = {}
+        self.db_seconds_total: Dict[Tuple[str, str], float] = {}
+        self.queries_total = 0
+        self.slow_queries_total = 0
+        self.in_flight = 0
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            key = (method, route, str(status))
+            self.requests_total[key] = self.requests_total.get(key, 0) + 1
+            self.request_duration.observe((method, route), seconds)
+            self.request_queries.observe((method, route), stats.queries)
+            self.db_seconds_total[(method, route)] = self.db_seconds_total.get((method, route), 0.0) + stats.db_seconds
+
+    def record_query(self, slow: bool):
+        with self._lock:
+            self.queries_total += 1
+            if slow:
+                self.slow_queries_total += 1
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP stupidbookmarks_http_requests_total HTTP requests served.",
+                "# TYPE stupidbookmarks_http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests_total.items()):
+                lines.append(
+                    f'stupidbookmarks_http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}'
+                )
+            lines += [
+                "# HELP stupidbookmarks_http_request_duration_seconds Request latency by route.",
+                "# TYPE stupidbookmarks_http_request_duration_seconds histogram",
+            ]
+            lines += self.request_duration.render("stupidbookmarks_http_request_duration_seconds", ("method", "route"))
+            lines += [
+                "# HELP stupidbookmarks_db_queries_per_request SQL statements executed per request.",
+                "# TYPE stupidbookmarks_db_queries_per_request histogram",
+            ]
+            lines += self.request_queries.render("stupidbookmarks_db_queries_per_request", ("method", "route"))
+            lines += [
+                "# HELP stupidbookmarks_db_seconds_total Time spent in SQL statements by route.",
+                "# TYPE stupidbookmarks_db_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self.db_seconds_total.items()):
+                lines.append(
+                    f'stupidbookmarks_db_seconds_total{{method="{method}",route="{_escape(route)}"}} {seconds:.6f}'
+                )
+            lines += [
+                "# HELP stupidbookmarks_db_queries_total SQL statements executed.",
+                "# TYPE stupidbookmarks_db_queries_total counter",
+                f"stupidbookmarks_db_queries_total {self.queries_total}",
+                f"# HELP stupidbookmarks_db_slow_queries_total SQL statements slower than {SLOW_QUERY_MS:g} ms.",
+                "# TYPE stupidbookmarks_db_slow_queries_total counter",
+                f"stupidbookmarks_db_slow_queries_total {self.slow_queries_total}",
+                "# HELP stupidbookmarks_http_requests_in_flight Requests currently being served.",
+                "# TYPE stupidbookmarks_http_requests_in_flight gauge",
+                f"stupidbookmarks_http_requests_in_flight {self.in_flight}",
+            ]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def instrument_engine(engine: Engine):
+    """Count and time every statement run on ``engine``."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+        slow = elapsed * 1000 >= SLOW_QUERY_MS
+        metrics.record_query(slow)
+        if slow:
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split()))
+
+class InstrumentationMiddleware:
+    """ASGI middleware recording per-route latency and DB usage.
+
+    Adds a ``Server-Timing`` header with the number of queries and the time
+    spent in the database, so N+1 patterns show up in browser dev tools.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        metrics.in_flight += 1
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                total_ms = (time.perf_counter() - started) * 1000
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"app;dur={total_ms:.1f}"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.in_flight -= 1
+            _current_stats.reset(token)
+            route = scope.get("route")
+            metrics.record_request(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status_code,
+                time.perf_counter() - started,
+                stats,
+            )
@@ -0,0 +1,329 @@
+"""Background link-health checks for StupidBookmarks.
+
+Stale bookmarks (never checked, or checked more than
+``LINK_CHECK_MAX_AGE_DAYS`` ago) are read in id order a batch at a time and
+checked through one async HTTP client: a HEAD request, repeated as a GET when
+HEAD says the link is broken, since plenty of servers mishandle HEAD. At most
+``LINK_CHECK_CONCURRENCY`` requests are in flight, and at most
+``LINK_CHECK_PER_HOST`` to any one host. Status, final URL after redirects
+and ``last_checked`` are written back one transaction per batch.
+
+Usage:
+    python -m services.link_checker [--all] [--user USER_ID]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from models.database import ReadSessionLocal, SessionLocal, user_scopes, user_session
+from models.models import Bookmark
+from services.scheduled_job import ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+# Hours between scheduled runs (0 turns the schedule off) and when a result goes stale
+LINK_CHECK_INTERVAL_HOURS = float(os.getenv("LINK_CHECK_INTERVAL_HOURS", "24"))
+LINK_CHECK_MAX_AGE_DAYS = float(os.getenv("LINK_CHECK_MAX_AGE_DAYS", "7"))
+# Requests in flight at once, overall and per host
+LINK_CHECK_CONCURRENCY = max(1, int(os.getenv("LINK_CHECK_CONCURRENCY", "50")))
+LINK_CHECK_PER_HOST = max(1, int(os.getenv("LINK_CHECK_PER_HOST", "2")))
+LINK_CHECK_TIMEOUT = float(os.getenv("LINK_CHECK_TIMEOUT", "10"))
+# Bookmarks read, and results written, per transaction
+LINK_CHECK_BATCH = max(1, int(os.getenv("LINK_CHECK_BATCH", "500")))
+
+USER_AGENT = "StupidBookmarks/1.0 link checker (+https://github.com/dannycab/stupidbookmarks)"
+
+@dataclass
+class LinkResult:
+    """Outcome of checking one bookmark's URL."""
+    bookmark_id: int
+    status: Optional[int] = None
+    final_url: Optional[str] = None
+    # "timeout", "connection" or "request" when no response came back
+    error: Optional[str] = None
+
+    @property
+    def broken(self) -> bool:
+        return self.error is not None or (self.status is not None and self.status >= 400)
+
+def broken_condition():
+    """SQL condition matching bookmarks whose last check found them broken."""
+    return or_(Bookmark.link_error.isnot(None), Bookmark.link_status >= 400)
+
+def host_key(url: str) -> str:
+    """What per-host limits count by: host and port."""
+    return urlsplit(url).netloc.lower()
+
+def interleave_hosts(items: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Reorder ``(id, url)`` pairs round-robin by host.
+
+    Imports tend to hold long runs of links to the same site; spreading them
+    out keeps workers from all queueing on one host's limit.
+    """
+    by_host: Dict[str, deque] = defaultdict(deque)
+    for item in items:
+        by_host[host_key(item[1])].append(item)
+    queues = deque(by_host.values())
+    ordered = []
+    while queues:
+        queue = queues.popleft()
+        ordered.append(queue.popleft())
+        if queue:
+            queues.append(queue)
+    return ordered
+
+class LinkChecker(ScheduledJob):
+    """Checks stale bookmark links concurrently and records the results."""
+
+    lock_name = ".link_check.lock"
+    interval_hours = LINK_CHECK_INTERVAL_HOURS
+
+    def __init__(
+        self,
+        concurrency: int = LINK_CHECK_CONCURRENCY,
+        per_host: int = LINK_CHECK_PER_HOST,
+        timeout: float = LINK_CHECK_TIMEOUT,
+        batch_size: int = LINK_CHECK_BATCH,
+        session_factory: Callable[[], Session] = SessionLocal,
+        read_session_factory: Callable[[], Session] = ReadSessionLocal
+    ):
+        super().__init__()
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, user_id: Optional[int] = None) -> bool:
+        """Start checking in the background unless a run is already going."""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self._run_logged(user_id))
+        return True
+
+    def stop(self):
+        """Cancel a running check; results saved so far are kept."""
+        if self.running:
+            self._task.cancel()
+
+    async def check_stale(
+        self,
+        user_id: Optional[int] = None,
+        max_age: timedelta = timedelta(days=LINK_CHECK_MAX_AGE_DAYS)
+    ) -> Optional[Dict[str, Any]]:
+        """Check every bookmark not checked within ``max_age``.
+
+        Returns counts for the run, or None if another process is already
+        checking links.
+        """
+        with self._process_lock() as acquired:
+            if not acquired:
+                return None
+            return await self._check_stale(user_id, datetime.now() - max_age)
+
+    async def check_url(self, client: httpx.AsyncClient, bookmark_id: int, url: str) -> LinkResult:
+        """HEAD ``url``, falling back to GET when HEAD reports an error."""
+        try:
+            response = await client.head(url)
+            if response.status_code >= 400:
+                # Only the headers are needed; the body is never read
+                async with client.stream("GET", url) as response:
+                    pass
+        except httpx.TimeoutException:
+            return LinkResult(bookmark_id, error="timeout")
+        except (httpx.NetworkError, httpx.RemoteProtocolError):
+            return LinkResult(bookmark_id, error="connection")
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError):
+            return LinkResult(bookmark_id, error="request")
+        final_url = str(response.url) if response.history else None
+        return LinkResult(bookmark_id, status=response.status_code, final_url=final_url)
+
+    def summary(self, db: Session, user_id: int) -> Dict[str, Any]:
+        """Counts of unchecked, working and broken links plus the newest check time."""
+        row = db.execute(
+            select(
+                func.count(),
+                func.count(Bookmark.last_checked),
+                func.count().filter(broken_condition()),
+                func.max(Bookmark.last_checked)
+            ).where(Bookmark.user_id == user_id)
+        ).one()
+        total, checked, broken, last_checked = row
+        return {
+            "unchecked": total - checked,
+            "ok": checked - broken,
+            "broken": broken,
+            "last_checked": last_checked,
+        }
+
+    def broken_links(self, db: Session, user_id: int, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Bookmarks whose last check failed, most recently checked first."""
+        rows = db.execute(
+            select(
+                Bookmark.id, Bookmark.url, Bookmark.title, Bookmark.link_status,
+                Bookmark.link_error, Bookmark.final_url, Bookmark.last_checked
+            )
+            .where(Bookmark.user_id == user_id, broken_condition())
+            .order_by(Bookmark.last_checked.desc(), Bookmark.id)
+            .limit(limit).offset(offset)
+        )
+        return [
+            {
+                "id": row.id,
+                "url": row.url,
+                "title": row.title,
+                "status": row.link_status,
+                "error": row.link_error,
+                "final_url": row.final_url,
+                "last_checked": row.last_checked.isoformat() if row.last_checked else None,
+            }
+            for row in rows
+        ]
+
+    async def _run_logged(self, user_id: Optional[int]):
+        try:
+            await self.check_stale(user_id)
+        except Exception:
+            logger.exception("Link check failed")
+            self.progress["error"] = True
+
+    async def _check_stale(self, user_id: Optional[int], cutoff: datetime) -> Dict[str, Any]:
+        started = time.perf_counter()
+        progress = self._start_progress("checked", "broken", "skipped")
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.batch_size)
+        pending: Dict[Optional[int], List[LinkResult]] = self._pending_results()
+        host_slots: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        breaker = self._host_breaker()
+
+        async def produce():
+            for scope in await asyncio.to_thread(user_scopes, user_id):
+                after_id = 0
+                while True:
+                    batch = await asyncio.to_thread(self._stale_batch, cutoff, after_id, scope)
+                    if not batch:
+                        break
+                    after_id = batch[-1][0]
+                    for bookmark_id, url in interleave_hosts(batch):
+                        await queue.put((bookmark_id, url, scope))
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work(client: httpx.AsyncClient):
+            while (item := await queue.get()) is not None:
+                bookmark_id, url, scope = item
+                host = host_key(url)
+                async with host_slots[host]:
+                    if not breaker.allow(host):
+                        progress["skipped"] += 1
+                        continue
+                    result = await self.check_url(client, bookmark_id, url)
+                if result.error in ("timeout", "connection"):
+                    breaker.record_failure(host)
+                else:
+                    breaker.record_success(host)
+
+                progress["checked"] += 1
+                progress["broken"] += result.broken
+                pending[scope].append(result)
+                if len(pending[scope]) >= self.batch_size:
+                    batch = pending.pop(scope)
+                    await asyncio.to_thread(self._save, batch, scope)
+
+        async with httpx.AsyncClient(
+            timeout=self.timeout,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        ) as client:
+            tasks = [asyncio.create_task(produce())]
+            tasks += [asyncio.create_task(work(client)) for _ in range(self.concurrency)]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                for scope, batch in list(pending.items()):
+                    await asyncio.to_thread(self._save, batch, scope)
+
+        progress["finished_at"] = datetime.now()
+        elapsed = time.perf_counter() - started
+        logger.info("Checked links", extra={
+            "checked": progress["checked"], "broken": progress["broken"], "skipped": progress["skipped"],
+            "duration_ms": round(elapsed * 1000, 1),
+        })
+        return {
+            "checked": progress["checked"],
+            "broken": progress["broken"],
+            "skipped": progress["skipped"],
+            "urls_per_minute": round(progress["checked"] / elapsed * 60) if elapsed else None,
+        }
+
+    def _stale_batch(self, cutoff: datetime, after_id: int, user_id: Optional[int]) -> List[Tuple[int, str]]:
+        db = user_session(self.read_session_factory, user_id)
+        try:
+            stmt = (
+                select(Bookmark.id, Bookmark.url)
+                .where(Bookmark.id > after_id, or_(Bookmark.last_checked.is_(None), Bookmark.last_checked < cutoff))
+                .order_by(Bookmark.id)
+                .limit(self.batch_size)
+            )
+            if user_id is not None:
+                stmt = stmt.where(Bookmark.user_id == user_id)
+            return [tuple(row) for row in db.execute(stmt)]
+        finally:
+            db.close()
+
+    def _save(self, results: List[LinkResult], user_id: Optional[int]):
+        table = Bookmark.__table__
+        now = datetime.now()
+        db = user_session(self.session_factory, user_id)
+        try:
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("bookmark_id"))
+                .values(
+                    link_status=bindparam("status"),
+                    link_error=bindparam("error"),
+                    final_url=bindparam("final"),
+                    last_checked=now,
+                    # A check isn't an edit; keep updated_at's onupdate from firing
+                    updated_at=table.c.updated_at,
+                ),
+                [
+                    {"bookmark_id": r.bookmark_id, "status": r.status, "error": r.error, "final": r.final_url}
+                    for r in results
+                ]
+            )
+            db.commit()
+        finally:
+            db.close()
+
+link_checker = LinkChecker()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check bookmark links now.")
+    parser.add_argument("--all", action="store_true", help="recheck every link, not just stale ones")
+    parser.add_argument("--user", type=int, help="only this user's bookmarks")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    max_age = timedelta(0) if args.all else timedelta(days=LINK_CHECK_MAX_AGE_DAYS)
+    print(json.dumps(asyncio.run(link_checker.check_stale(args.user, max_age=max_age))))
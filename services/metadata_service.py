@@ -0,0 +1,175 @@
+"""Cached page metadata (titles) with negative caching for StupidBookmarks."""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy.orm import Session
+
+from models.database import upsert
+from models.models import PageMetadata
+
+logger = logging.getLogger(__name__)
+
+TITLE_CACHE_TTL = timedelta(days=int(os.getenv("TITLE_CACHE_TTL_DAYS", "30")))
+NEGATIVE_TTL_BASE = timedelta(hours=1)
+NEGATIVE_TTL_MAX = timedelta(days=7)
+
+# Query parameters that never change what page is served
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref_src", "igshid"}
+
+@dataclass
+class FetchResult:
+    """Outcome of fetching a page."""
+    title: Optional[str] = None
+    status_code: Optional[int] = None
+    # "timeout", "connection" or "request" when no usable response came back
+    error: Optional[str] = None
+
+    @property
+    def host_failure(self) -> bool:
+        """Whether the failure says something about the host rather than the URL."""
+        if self.error in ("timeout", "connection"):
+            return True
+        return self.status_code is not None and (self.status_code >= 500 or self.status_code == 429)
+
+    @property
+    def permanent(self) -> bool:
+        """Whether retrying the same URL later is pointless."""
+        if self.status_code is None or self.error:
+            return False
+        return self.status_code == 200 or (400 <= self.status_code < 500 and self.status_code not in (403, 408, 429))
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for use as a cache key.
+
+    Lowercases scheme and host, drops ``www.``, default ports, fragments,
+    trailing slashes and tracking parameters, and sorts the query string.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or "https").lower()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and (scheme, port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = urlencode(sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))
+
+class HostCircuitBreaker:
+    """Stops fetching from hosts that keep timing out or erroring.
+
+    After ``threshold`` consecutive host-level failures the circuit opens for
+    a cooldown that doubles each time it trips again (capped at
+    ``max_cooldown``). Once the cooldown passes a single trial request is let
+    through; success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 60.0, max_cooldown: float = 3600.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._failures: Dict[str, int] = {}
+        self._trips: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+
+    def allow(self, host: str) -> bool:
+        with self._lock:
+            open_until = self._open_until.get(host)
+            if open_until is None:
+                return True
+            if time.monotonic() < open_until:
+                return False
+            # Half-open: let one trial request through, keep others out
+            self._open_until[host] = time.monotonic() + self.cooldown
+            return True
+
+    def record_success(self, host: str):
+        with self._lock:
+            self._failures.pop(host, None)
+            self._trips.pop(host, None)
+            self._open_until.pop(host, None)
+
+    def record_failure(self, host: str):
+        with self._lock:
+            failures = self._failures.get(host, 0) + 1
+            self._failures[host] = failures
+            if failures >= self.threshold:
+                trips = self._trips.get(host, 0) + 1
+                self._trips[host] = trips
+                cooldown = min(self.cooldown * 2 ** (trips - 1), self.max_cooldown)
+                self._open_until[host] = time.monotonic() + cooldown
+                logger.info("Circuit opened for host", extra={"host": host, "cooldown_seconds": cooldown})
+
+class PageMetadataCache:
+    """Persistent title cache in front of the network fetch."""
+
+    def __init__(self, breaker: Optional[HostCircuitBreaker] = None):
+        self.breaker = breaker or HostCircuitBreaker()
+
+    def get_title(self, db: Session, url: str, fetch: Callable[[str], FetchResult]) -> Optional[str]:
+        """Return the page title for ``url``, fetching it only when needed."""
+        url_key = normalize_url(url)
+        now = datetime.now()
+
+        cached = db.get(PageMetadata, url_key)
+        if cached is not None and cached.expires_at > now:
+            return cached.title
+
+        host = urlsplit(url_key).hostname or ""
+        if not self.breaker.allow(host):
+            logger.debug("Skipping fetch, circuit open", extra={"host": host, "url": url})
+            return None
+
+        result = fetch(url)
+        if result.host_failure:
+            self.breaker.record_failure(host)
+        else:
+            self.breaker.record_success(host)
+
+        if result.title:
+            failure_count = 0
+            expires_at = now + TITLE_CACHE_TTL
+        else:
+            failure_count = (cached.failure_count if cached is not None else 0) + 1
+            if result.permanent:
+                backoff = NEGATIVE_TTL_MAX
+            else:
+                backoff = min(NEGATIVE_TTL_BASE * 2 ** (failure_count - 1), NEGATIVE_TTL_MAX)
+            expires_at = now + backoff
+
+        upsert(db, PageMetadata.__table__, {
+            "url_key": url_key,
+            "title": result.title,
+            "http_status": result.status_code,
+            "error": result.error,
+            "failure_count": failure_count,
+            "fetched_at": now,
+            "expires_at": expires_at,
+        }, ["url_key"])
+        if cached is not None:
+            db.expire(cached)
+        return result.title
+
+page_metadata_cache = PageMetadataCache()
@@ -0,0 +1,80 @@
+"""Building blocks for in-process, per-user state kept in step with commits."""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+T = TypeVar("T")
+
+class PendingOnCommit:
+    """Work queued on a session and handed to ``publish`` once it commits.
+
+    The queue lives in ``session.info`` (keyed by this object) and is dropped
+    if the session rolls back, so nothing from a transaction that never
+    happened is published.
+    """
+
+    def __init__(self, publish: Callable[[Any], None], factory: Callable[[], Any] = dict):
+        self.publish = publish
+        self.factory = factory
+        event.listen(Session, "after_commit", self._after_commit)
+        event.listen(Session, "after_rollback", self._after_rollback)
+
+    def queue(self, session: Session) -> Any:
+        """The queue for ``session``, created empty on first use."""
+        pending = session.info.get(self)
+        if pending is None:
+            pending = session.info[self] = self.factory()
+        return pending
+
+    def _after_commit(self, session: Session):
+        pending = session.info.pop(self, None)
+        if pending:
+            self.publish(pending)
+
+    def _after_rollback(self, session: Session):
+        session.info.pop(self, None)
+
+class PerUserIndex(ABC, Generic[T]):
+    """Per-user in-memory index built from the database on first use.
+
+    Subclasses build a user's index in ``_build`` and keep it up to date with
+    this process's own commits. It is rebuilt after ``ttl`` seconds so
+    changes made by other workers show up eventually.
+    """
+
+    def __init__(self, ttl: int = 300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes: Dict[int, T] = {}
+        self._built_at: Dict[int, float] = {}
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop the index for one user, or for everyone."""
+        with self._lock:
+            if user_id is None:
+                self._indexes.clear()
+                self._built_at.clear()
+            else:
+                self._indexes.pop(user_id, None)
+                self._built_at.pop(user_id, None)
+
+    def _index(self, db: Session, user_id: int) -> T:
+        """The user's index, built first if missing or older than ``ttl``."""
+        with self._lock:
+            built_at = self._built_at.get(user_id)
+            if built_at is not None and time.monotonic() - built_at <= self.ttl:
+                return self._indexes[user_id]
+        index = self._build(db, user_id)
+        with self._lock:
+            self._indexes[user_id] = index
+            self._built_at[user_id] = time.monotonic()
+        return index
+
+    @abstractmethod
+    def _build(self, db: Session, user_id: int) -> T:
+        """Build a user's index from the database."""
@@ -0,0 +1,256 @@
+"""On-demand profiling of live requests and time-boxed stack sampling for flamegraphs."""
+
+import cProfile
+import glob
+import io
+import logging
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool as _run_in_threadpool
+
+from models.database import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to ignore profiling headers and refuse captures
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() == "true"
+# Where per-request profiles are written, and how many are kept
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+# Longest stack-sampling capture allowed, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_SUFFIX = ".prof"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+class ProfilerBusy(Exception):
+    """Another capture is already running in this worker."""
+
+class RequestProfile:
+    """``cProfile`` profilers for one request, one per thread it runs on (the
+    event loop's and each thread-pool thread it hands work to), merged when
+    saved."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._profilers: Dict[int, cProfile.Profile] = {}
+
+    def profiler(self) -> cProfile.Profile:
+        """This thread's profiler for the request."""
+        with self._lock:
+            return self._profilers.setdefault(threading.get_ident(), cProfile.Profile())
+
+    def runcall(self, func: Callable, *args, **kwargs):
+        return self.profiler().runcall(func, *args, **kwargs)
+
+    def save(self, directory: str) -> str:
+        profilers = list(self._profilers.values())
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.name)
+        stats.dump_stats(path)
+        return path
+
+async def run_in_threadpool(func: Callable, *args, **kwargs):
+    """``starlette.concurrency.run_in_threadpool``, profiling ``func`` too when the request is being profiled."""
+    profile = _current_profile.get()
+    if profile is not None:
+        func = partial(profile.runcall, func)
+    return await _run_in_threadpool(func, *args, **kwargs)
+
+def profiled_iterator(iterator: Iterable) -> Iterable:
+    """Profile each step of a sync iterator that a streaming response will run in the thread pool."""
+    profile = _current_profile.get()
+    if profile is None:
+        return iterator
+    return _profiled_steps(profile, iter(iterator))
+
+def _profiled_steps(profile: RequestProfile, iterator: Iterator) -> Iterator:
+    try:
+        while True:
+            try:
+                item = profile.runcall(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that carry an ``X-Profile`` header.
+
+    Only requests ``authorize`` accepts are profiled; others, and requests
+    arriving while one is already being profiled in this worker, run as
+    usual. The profile is written to ``PROFILE_DIR`` when the request ends
+    and its location is returned in the ``X-Profile`` response header.
+    Without the header the only cost is scanning the request headers.
+    """
+
+    def __init__(self, app, authorize: Callable[[dict], bool], profile_dir: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.app = app
+        self.authorize = authorize
+        self.profile_dir = profile_dir
+        self.keep = keep
+        # cProfile hooks the whole event loop thread, so one profiled request at a time
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not PROFILING_ENABLED
+            or not any(name == PROFILE_HEADER for name, _ in scope["headers"])
+            or not self.authorize(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, self._with_header(send, b"busy"))
+            return
+
+        profile = RequestProfile(profile_name(scope["method"], scope["path"]))
+        token = _current_profile.set(profile)
+        loop_profiler = profile.profiler()
+        started = time.perf_counter()
+        loop_profiler.enable()
+        try:
+            await self.app(scope, receive, self._with_header(send, f"/admin/profiles/{profile.name}".encode()))
+        finally:
+            loop_profiler.disable()
+            _current_profile.reset(token)
+            self._busy.release()
+            try:
+                profile.save(self.profile_dir)
+                self._rotate()
+                logger.info("Saved request profile", extra={
+                    "profile": profile.name, "path": scope["path"],
+                    "ms": round((time.perf_counter() - started) * 1000, 1),
+                })
+            except OSError as e:
+                logger.warning("Could not save request profile", extra={"profile": profile.name, "error": str(e)})
+
+    def _with_header(self, send, value: bytes):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(PROFILE_HEADER, value)]
+            await send(message)
+        return send_wrapper
+
+    def _rotate(self):
+        for profile in list_profiles(self.profile_dir)[self.keep:]:
+            os.remove(profile["path"])
+
+def profile_name(method: str, path: str) -> str:
+    """Sortable, filesystem-safe name for a request's profile."""
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-")[:60] or "root"
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{slug}-{secrets.token_hex(3)}{PROFILE_SUFFIX}"
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[Dict]:
+    """Saved request profiles, newest first, as dicts with name, path, size and created_at."""
+    profiles = []
+    for path in glob.glob(os.path.join(directory, f"*{PROFILE_SUFFIX}")):
+        stat = os.stat(path)
+        profiles.append({
+            "name": os.path.basename(path),
+            "path": path,
+            "size": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_mtime),
+        })
+    return sorted(profiles, key=lambda profile: profile["name"], reverse=True)
+
+def profile_path(name: str, directory: str = PROFILE_DIR) -> Optional[str]:
+    """Path of the saved profile called ``name``, or None (also for anything that isn't one)."""
+    for profile in list_profiles(directory):
+        if profile["name"] == name:
+            return profile["path"]
+    return None
+
+def profile_report(path: str, sort: str = "cumulative", limit: int = 50) -> str:
+    """The ``pstats`` table of a saved profile, most expensive functions first."""
+    stream = io.StringIO()
+    stats = pstats.Stats(path, stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+class StackSampler:
+    """Samples the stacks of every thread in this worker at a fixed interval.
+
+    The result is in the collapsed format read by ``flamegraph.pl``,
+    speedscope and inferno: one line per distinct stack, root first, frames
+    separated by ``;``, followed by how many samples saw it. Nothing runs
+    between captures.
+    """
+
+    def __init__(self, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    def capture(self, seconds: float, interval: float = 0.01) -> str:
+        """Sample for ``seconds`` (capped at ``max_seconds``); raises ``ProfilerBusy`` if a capture is running."""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A capture is already running")
+        try:
+            return self._capture(min(max(seconds, 0.1), self.max_seconds), max(interval, 0.001))
+        finally:
+            self._lock.release()
+
+    def _capture(self, seconds: float, interval: float) -> str:
+        me = threading.get_ident()
+        labels: Dict = {}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        samples = 0
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                # Code objects are cheap to key on; turn them into text once per capture
+                stacks[(names.get(ident, str(ident)), tuple(reversed(codes)))] += 1
+            samples += 1
+            time.sleep(interval)
+        lines = []
+        for (thread_name, codes), count in stacks.most_common():
+            frames = [thread_name.replace(";", ":")]
+            for code in codes:
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                frames.append(label)
+            lines.append(f"{';'.join(frames)} {count}")
+        logger.info("Captured stack samples", extra={"seconds": seconds, "samples": samples, "stacks": len(stacks)})
+        return "\n".join(lines) + "\n"
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(REPO_ROOT + os.sep):
+        filename = os.path.relpath(filename, REPO_ROOT)
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename})".replace(";", ":")
+
+stack_sampler = StackSampler()
@@ -0,0 +1,225 @@
+"""Per-API-key rate limiting and admission control for expensive operations."""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sustained requests per minute per API key (0 disables) and the burst allowed on top
+API_RATE_LIMIT = float(os.getenv("API_RATE_LIMIT", "120"))
+API_RATE_BURST = int(os.getenv("API_RATE_BURST", "30"))
+# "memory" (per worker) or a redis:// URL shared by all workers
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+# Title-fetching creates, imports and exports running at once, per worker
+MAX_EXPENSIVE_OPERATIONS = max(1, int(os.getenv("MAX_EXPENSIVE_OPERATIONS", "4")))
+# Largest page of bookmarks the API returns
+API_MAX_LIMIT = int(os.getenv("API_MAX_LIMIT", "500"))
+
+class Overloaded(Exception):
+    """A request was refused; the client should retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.detail = detail
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+class MemoryBucketStore:
+    """Token buckets in this process: ``key -> (tokens, updated_at)``."""
+
+    # Prune full buckets once this many keys are tracked
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, List[float]] = {}
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_KEYS:
+                    self._prune(rate, burst, now)
+                bucket = self._buckets[key] = [float(burst), now]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def _prune(self, rate: float, burst: int, now: float):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * rate < burst
+        }
+
+class RedisBucketStore:
+    """Token buckets in Redis, shared by every worker and host.
+
+    The refill-and-take step runs as one Lua script, so concurrent requests
+    for the same key can't both spend the last token.
+    """
+
+    SCRIPT = """
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for a shared backend
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        return float(self._script(keys=[f"stupidbookmarks:ratelimit:{key}"], args=[rate, burst, now]))
+
+class RateLimiter:
+    """Token bucket per key: ``burst`` requests at once, refilled at ``per_minute``."""
+
+    def __init__(self, per_minute: float = API_RATE_LIMIT, burst: int = API_RATE_BURST, backend: str = RATE_LIMIT_BACKEND):
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+        self.store = self._create_store(backend)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, key: str):
+        """Spend a token for ``key`` or raise ``Overloaded``."""
+        if not self.enabled:
+            return
+        try:
+            wait = self.store.take(key, self.rate, self.burst, time.time())
+        except Exception as e:
+            # A shared backend being down shouldn't take the API with it
+            logger.warning("Rate limit backend failed, allowing request: %s", e)
+            return
+        if wait > 0:
+            raise Overloaded(wait, "Rate limit exceeded")
+
+    def _create_store(self, backend: str):
+        if backend.startswith(("redis://", "rediss://", "unix://")):
+            try:
+                return RedisBucketStore(backend)
+            except ImportError:
+                logger.warning("RATE_LIMIT_BACKEND is Redis but the redis package is missing; limiting per worker")
+        elif backend != "memory":
+            logger.warning("Unknown RATE_LIMIT_BACKEND %r; limiting per worker", backend)
+        return MemoryBucketStore()
+
+class AdmissionSlot:
+    """A claimed place in ``AdmissionControl``; releasing twice is harmless."""
+
+    def __init__(self, control: "AdmissionControl"):
+        self._control = control
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._control._leave(time.monotonic() - self._started)
+
+class AdmissionControl:
+    """Caps how many expensive operations run at once.
+
+    Requests over the cap are refused straight away rather than queued, with
+    a retry hint based on how long operations have recently been taking.
+    """
+
+    def __init__(self, limit: int = MAX_EXPENSIVE_OPERATIONS):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+        self._average_seconds = 1.0
+
+    def acquire(self) -> AdmissionSlot:
+        with self._lock:
+            if self.active >= self.limit:
+                raise Overloaded(self._average_seconds, "Too many expensive operations in progress, try again shortly")
+            self.active += 1
+        return AdmissionSlot(self)
+
+    @contextmanager
+    def slot(self):
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def _leave(self, seconds: float):
+        with self._lock:
+            self.active -= 1
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * seconds
+
+class RateLimitMiddleware:
+    """ASGI middleware applying ``api_rate_limiter`` to Bearer-authenticated ``/api/`` requests.
+
+    Buckets are keyed by a hash of the presented key, so requests with
+    invalid keys are limited too. Browser requests using the session cookie
+    are not limited.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or api_rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith("/api/") or not self.limiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        token = _bearer_token(scope)
+        if token:
+            try:
+                self.limiter.check(hashlib.sha256(token).hexdigest())
+            except Overloaded as e:
+                await send_overloaded(send, e)
+                return
+        await self.app(scope, receive, send)
+
+def _bearer_token(scope) -> Optional[bytes]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, credentials = value.partition(b" ")
+            if scheme.lower() == b"bearer" and credentials.strip():
+                return credentials.strip()
+    return None
+
+async def send_overloaded(send, error: Overloaded):
+    body = json.dumps({"detail": error.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", error.retry_after_header.encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+api_rate_limiter = RateLimiter()
+expensive_operations = AdmissionControl()
@@ -0,0 +1,72 @@
+"""Shared scaffolding for the scheduled bookmark jobs (link checks, page archiving)."""
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, ContextManager, DefaultDict, Dict, List, Optional
+
+from models.database import DATA_DIR, file_lock
+from services.metadata_service import HostCircuitBreaker
+
+# Let the app finish starting before the first scheduled run
+SCHEDULE_START_DELAY = 60
+
+class ScheduledJob(ABC):
+    """A job over every user's bookmarks, started by hand or on a schedule.
+
+    Subclasses run the job in the background (a thread or an asyncio task)
+    through ``start`` and ``running``, and set ``lock_name``, ``interval_hours``
+    and ``timeout``. This class keeps the progress shown on the admin page,
+    the schedule loop and the lock that keeps two processes from running
+    the same job at once.
+    """
+
+    # Lock file in DATA_DIR held for the length of a run
+    lock_name = ""
+    # Hours between scheduled runs
+    interval_hours = 0.0
+    # Seconds allowed per fetch
+    timeout = 10.0
+
+    def __init__(self):
+        # Progress of the current (or last) run in this process, for the admin page
+        self.progress: Dict[str, Any] = {}
+
+    @property
+    @abstractmethod
+    def running(self) -> bool:
+        """Whether a run started by this process is still going."""
+
+    @abstractmethod
+    def start(self, user_id: Optional[int] = None) -> bool:
+        """Start a run in the background unless one is already going."""
+
+    async def run_schedule(self, interval_hours: Optional[float] = None):
+        """Run the job for all users every ``interval_hours``."""
+        if interval_hours is None:
+            interval_hours = self.interval_hours
+        await asyncio.sleep(SCHEDULE_START_DELAY)
+        while True:
+            self.start(None)
+            while self.running:
+                await asyncio.sleep(1)
+            await asyncio.sleep(interval_hours * 3600)
+
+    def _process_lock(self) -> ContextManager[bool]:
+        """Yields False, without waiting, while another process runs the job."""
+        return file_lock(os.path.join(DATA_DIR, self.lock_name), blocking=False)
+
+    def _start_progress(self, *counters: str) -> Dict[str, Any]:
+        self.progress = {**dict.fromkeys(counters, 0), "started_at": datetime.now(), "finished_at": None}
+        return self.progress
+
+    def _host_breaker(self) -> HostCircuitBreaker:
+        # Hosts that keep timing out are left for the next run instead of tying up workers
+        return HostCircuitBreaker(threshold=3, cooldown=self.timeout * 6)
+
+    @staticmethod
+    def _pending_results() -> DefaultDict[Optional[int], List[Any]]:
+        # Results waiting to be saved, by the user (database) they belong to
+        return defaultdict(list)
@@ -0,0 +1,109 @@
+"""Shared tag-name to tag-id cache for StupidBookmarks."""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from models.database import insert_ignore
+from models.models import Tag, TagVersion
+from services.per_user import PendingOnCommit
+
+# Keep IN (...) lists below SQLite's bound-parameter limit
+IN_CHUNK_SIZE = 500
+
+class TagCache:
+    """Per-user cache of tag name -> tag id, shared by all requests.
+
+    A user's cached ids are kept with the user's tag version, which renames,
+    merges and deletes bump in the same transaction, so while it is unchanged
+    a fully cached tag list costs one primary-key read. Names not cached yet
+    cost one ``IN (...)`` query plus one bulk insert for tags that don't
+    exist yet. Ids resolved inside a transaction are only published to the
+    shared cache once that transaction commits, so a rollback can never leave
+    ids of vanished rows behind.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user id -> (tag version, {name: tag id})
+        self._entries: Dict[int, Tuple[int, Dict[str, int]]] = {}
+        self._pending = PendingOnCommit(self._publish)
+
+    def resolve(self, db: Session, user_id: int, names: Iterable[str]) -> Dict[str, int]:
+        """Return ``{name: tag_id}`` for every name, creating missing tags."""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+
+        version = self._version(db, user_id)
+        with self._lock:
+            cached_version, cached = self._entries.get(user_id, (None, {}))
+            if cached_version != version:
+                cached = {}
+            resolved = {name: cached[name] for name in names if name in cached}
+        missing = [name for name in names if name not in resolved]
+
+        if missing:
+            found = self._select_ids(db, user_id, missing)
+            to_create = [name for name in missing if name not in found]
+            if to_create:
+                # Concurrent writers may create the same tags; the unique
+                # (user_id, name) index makes the losers no-ops.
+                insert_ignore(db, Tag.__table__, [
+                    {"name": name, "user_id": user_id} for name in to_create
+                ])
+                found.update(self._select_ids(db, user_id, to_create))
+
+            resolved.update(found)
+            self._pending.queue(db).setdefault(user_id, {}).setdefault(version, {}).update(found)
+
+        return resolved
+
+    def bump_version(self, db: Session, user_id: int):
+        """Mark the user's cached ids stale in every worker once ``db`` commits.
+
+        Call this in the transaction that renames or deletes the user's tags.
+        """
+        insert_ignore(db, TagVersion.__table__, [{"user_id": user_id, "version": 0}])
+        db.execute(
+            update(TagVersion)
+            .where(TagVersion.user_id == user_id)
+            .values(version=TagVersion.version + 1)
+        )
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop cached ids for one user, or for everyone."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _version(self, db: Session, user_id: int) -> int:
+        return db.execute(select(TagVersion.version).where(TagVersion.user_id == user_id)).scalar() or 0
+
+    def _publish(self, pending: Dict[int, Dict[int, Dict[str, int]]]):
+        with self._lock:
+            for user_id, by_version in pending.items():
+                for version, ids in sorted(by_version.items()):
+                    cached_version, cached = self._entries.get(user_id, (None, {}))
+                    if cached_version is None or cached_version < version:
+                        self._entries[user_id] = (version, dict(ids))
+                    elif cached_version == version:
+                        cached.update(ids)
+
+    def _select_ids(self, db: Session, user_id: int, names: List[str]) -> Dict[str, int]:
+        found = {}
+        for start in range(0, len(names), IN_CHUNK_SIZE):
+            chunk = names[start:start + IN_CHUNK_SIZE]
+            rows = (
+                db.query(Tag.name, Tag.id)
+                .filter(Tag.user_id == user_id, Tag.name.in_(chunk))
+                .all()
+            )
+            found.update({name: tag_id for name, tag_id in rows})
+        return found
+
+tag_cache = TagCache()
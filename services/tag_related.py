@@ -0,0 +1,108 @@
+"""Tag co-occurrence index for "often used with" suggestions."""
+
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.models import Tag, user_tags
+from services.per_user import PendingOnCommit, PerUserIndex
+
+class UserTagCooccurrence:
+    """Sparse tag x tag co-occurrence counts for one user.
+
+    ``rows[a][b]`` is the number of bookmarks tagged both ``a`` and ``b``;
+    the diagonal ``rows[a][a]`` is how many bookmarks have ``a`` at all.
+    Only pairs that occur are stored. A row's ranking is computed the first
+    time it is asked for and kept until a change touches that row, so top-k
+    is a slice of a ready list.
+    """
+
+    def __init__(self, rows: Dict[str, Counter]):
+        self.rows = rows
+        self._ranked: Dict[str, List[Tuple[str, int]]] = {}
+
+    @classmethod
+    def from_tag_sets(cls, tag_sets: Iterable[List[str]]) -> "UserTagCooccurrence":
+        rows: Dict[str, Counter] = defaultdict(Counter)
+        for names in tag_sets:
+            # Counter.update counts a whole row in C instead of pair by pair
+            for name in names:
+                rows[name].update(names)
+        return cls(dict(rows))
+
+    def related(self, name: str, limit: int) -> List[Dict[str, int]]:
+        ranked = self._ranked.get(name)
+        if ranked is None:
+            row = self.rows.get(name)
+            if not row:
+                return []
+            ranked = sorted(
+                ((other, count) for other, count in row.items() if other != name),
+                key=lambda item: (-item[1], item[0])
+            )
+            self._ranked[name] = ranked
+        return [{"name": other, "count": count} for other, count in ranked[:limit]]
+
+    def add(self, names: Iterable[str], delta: int = 1):
+        """Count one bookmark with ``names`` (``delta=-1`` takes it back out)."""
+        names = list(dict.fromkeys(names))
+        for name in names:
+            row = self.rows.setdefault(name, Counter())
+            for other in names:
+                count = row[other] + delta
+                if count > 0:
+                    row[other] = count
+                else:
+                    del row[other]
+            if not row:
+                del self.rows[name]
+            self._ranked.pop(name, None)
+
+class RelatedTagIndex(PerUserIndex[UserTagCooccurrence]):
+    """Per-user co-occurrence matrices answering "often used with" without the database.
+
+    A user's matrix is built from ``bookmark_tags`` in one pass on first use
+    and kept up to date as bookmarks are added or deleted in this process.
+    Bulk changes (imports, merges, retagging) drop it to be rebuilt.
+    """
+
+    def __init__(self, ttl: int = 300):
+        super().__init__(ttl)
+        self._pending = PendingOnCommit(self._publish)
+
+    def related(self, db: Session, user_id: int, tag_name: str, limit: int = 10) -> List[Dict[str, int]]:
+        """Tags most often on the same bookmarks as ``tag_name``, with shared counts."""
+        tag_name = tag_name.strip().lower()
+        matrix = self._index(db, user_id)
+        with self._lock:
+            return matrix.related(tag_name, limit)
+
+    def record_bookmarks(self, db: Session, user_id: int, tag_sets: List[List[str]], delta: int = 1):
+        """Count bookmarks with these tag lists (or uncount them) when ``db`` commits."""
+        pending = self._pending.queue(db)
+        pending.setdefault(user_id, []).extend((names, delta) for names in tag_sets if names)
+
+    def _build(self, db: Session, user_id: int) -> UserTagCooccurrence:
+        rows = db.execute(
+            select(user_tags.c.bookmark_id, Tag.name)
+            .join(Tag, Tag.id == user_tags.c.tag_id)
+            .where(Tag.user_id == user_id)
+            .order_by(user_tags.c.bookmark_id)
+        )
+        return UserTagCooccurrence.from_tag_sets(
+            [name for _, name in group] for _, group in groupby(rows, key=itemgetter(0))
+        )
+
+    def _publish(self, pending: Dict[int, List[Tuple[List[str], int]]]):
+        with self._lock:
+            for user_id, changes in pending.items():
+                matrix = self._indexes.get(user_id)
+                if matrix is not None:
+                    for names, delta in changes:
+                        matrix.add(names, delta)
+
+related_tags = RelatedTagIndex()
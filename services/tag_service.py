@@ -0,0 +1,172 @@
+"""Set-based tag maintenance for StupidBookmarks: rename, merge and bulk retag."""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from models.models import Bookmark, Tag, user_tags
+from services.change_events import change_events
+from services.tag_cache import tag_cache
+from services.tag_related import related_tags
+from services.tag_suggest import tag_suggestions
+
+logger = logging.getLogger(__name__)
+
+def parse_tag_names(value: Iterable[str]) -> List[str]:
+    """Normalize tag names the way ``add_bookmark`` does (lowercase, no separators)."""
+    if isinstance(value, str):
+        value = [value]
+    names = []
+    for item in value:
+        names.extend(tag.strip().lower() for tag in re.split(r'[,\s]+', item) if tag.strip())
+    return list(dict.fromkeys(names))
+
+class TagService:
+    """Tag operations that touch many bookmarks with a few statements each.
+
+    Every operation runs in one transaction and rewrites ``bookmark_tags``
+    with set-based ``INSERT ... SELECT`` / ``DELETE`` statements; a
+    ``NOT EXISTS`` guard skips bookmark/tag pairs that already exist.
+    """
+
+    def rename_tag(self, db: Session, user_id: int, old_name: str, new_name: str) -> Dict[str, int]:
+        """Rename a tag, merging it into ``new_name`` if that tag already exists."""
+        old_name = self._single_name(old_name)
+        new_name = self._single_name(new_name)
+        old_tag = self._get_tag(db, user_id, old_name)
+        if old_name == new_name:
+            return {"added": 0, "removed": 0}
+        if self._tag_ids(db, user_id, [new_name]):
+            return self.merge_tags(db, user_id, [old_name], new_name)
+
+        moved = db.execute(
+            select(func.count()).select_from(user_tags).where(user_tags.c.tag_id == old_tag.id)
+        ).scalar()
+        db.execute(update(Tag).where(Tag.id == old_tag.id).values(name=new_name))
+        tag_cache.bump_version(db, user_id)
+        change_events.record(db, user_id, "tags.renamed", {"from": old_name, "to": new_name, "bookmarks": moved})
+        self._commit(db, user_id)
+        logger.info("Renamed tag", extra={"user_id": user_id, "old": old_name, "new": new_name, "bookmarks": moved})
+        return {"added": moved, "removed": moved}
+
+    def merge_tags(self, db: Session, user_id: int, sources: List[str], target: str) -> Dict[str, int]:
+        """Move every bookmark tagged with any of ``sources`` to ``target`` and delete the sources."""
+        target = self._single_name(target)
+        source_tags = {
+            name: tag_id for name, tag_id in self._tag_ids(db, user_id, parse_tag_names(sources)).items()
+            if name != target
+        }
+        source_ids = list(source_tags.values())
+        if not source_ids:
+            raise ValueError("No existing source tags to merge")
+        target_id = tag_cache.resolve(db, user_id, [target])[target]
+
+        source_links = user_tags.alias("source_links")
+        added = db.execute(
+            insert(user_tags).from_select(
+                ["bookmark_id", "tag_id"],
+                select(source_links.c.bookmark_id, literal(target_id))
+                .where(source_links.c.tag_id.in_(source_ids))
+                .where(~self._has_link(source_links.c.bookmark_id, target_id))
+                .distinct()
+            )
+        ).rowcount
+        removed = db.execute(delete(user_tags).where(user_tags.c.tag_id.in_(source_ids))).rowcount
+        db.execute(delete(Tag).where(Tag.id.in_(source_ids), Tag.user_id == user_id))
+        tag_cache.bump_version(db, user_id)
+        change_events.record(db, user_id, "tags.merged", {"sources": list(source_tags), "target": target, "added": added, "removed": removed})
+        self._commit(db, user_id)
+        logger.info("Merged tags", extra={
+            "user_id": user_id, "sources": len(source_ids), "target": target, "added": added, "removed": removed,
+        })
+        return {"added": added, "removed": removed}
+
+    def bulk_retag(
+        self,
+        db: Session,
+        user_id: int,
+        add: Iterable[str] = (),
+        remove: Iterable[str] = (),
+        tag_filter: Optional[str] = None,
+        bookmark_ids: Optional[List[int]] = None
+    ) -> Dict[str, int]:
+        """Add and/or remove tags on every bookmark matching the filter.
+
+        With neither ``tag_filter`` nor ``bookmark_ids`` the change applies
+        to all of the user's bookmarks.
+        """
+        add_names = parse_tag_names(add)
+        remove_names = [name for name in parse_tag_names(remove) if name not in add_names]
+        if not add_names and not remove_names:
+            raise ValueError("Nothing to add or remove")
+
+        targets = select(Bookmark.id).where(Bookmark.user_id == user_id)
+        if tag_filter:
+            filter_tag = self._get_tag(db, user_id, self._single_name(tag_filter))
+            targets = targets.where(self._has_link(Bookmark.id, filter_tag.id))
+        if bookmark_ids is not None:
+            targets = targets.where(Bookmark.id.in_(bookmark_ids))
+        targets = targets.subquery()
+
+        added = 0
+        for tag_id in tag_cache.resolve(db, user_id, add_names).values():
+            added += db.execute(
+                insert(user_tags).from_select(
+                    ["bookmark_id", "tag_id"],
+                    select(targets.c.id, literal(tag_id)).where(~self._has_link(targets.c.id, tag_id))
+                )
+            ).rowcount
+
+        removed = 0
+        remove_ids = list(self._tag_ids(db, user_id, remove_names).values())
+        if remove_ids:
+            removed = db.execute(
+                delete(user_tags).where(
+                    user_tags.c.tag_id.in_(remove_ids),
+                    user_tags.c.bookmark_id.in_(select(targets.c.id))
+                )
+            ).rowcount
+
+        change_events.record(db, user_id, "tags.retagged", {"add": add_names, "remove": remove_names, "added": added, "removed": removed})
+        self._commit(db, user_id)
+        logger.info("Bulk retagged bookmarks", extra={
+            "user_id": user_id, "tag_filter": tag_filter, "added": added, "removed": removed,
+        })
+        return {"added": added, "removed": removed}
+
+    def _commit(self, db: Session, user_id: int):
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        # Renamed and deleted tags invalidate cached name -> id mappings (other
+        # workers see the bumped tag version) and counts
+        tag_cache.invalidate(user_id)
+        tag_suggestions.invalidate(user_id)
+        related_tags.invalidate(user_id)
+
+    def _has_link(self, bookmark_id_column, tag_id: int):
+        existing = user_tags.alias("existing_links")
+        return exists().where(and_(existing.c.bookmark_id == bookmark_id_column, existing.c.tag_id == tag_id))
+
+    def _get_tag(self, db: Session, user_id: int, name: str) -> Tag:
+        tag = db.query(Tag).filter(Tag.user_id == user_id, Tag.name == name).first()
+        if tag is None:
+            raise LookupError(f"Tag not found: {name}")
+        return tag
+
+    def _tag_ids(self, db: Session, user_id: int, names: List[str]) -> Dict[str, int]:
+        if not names:
+            return {}
+        rows = db.query(Tag.name, Tag.id).filter(Tag.user_id == user_id, Tag.name.in_(names)).all()
+        return {name: tag_id for name, tag_id in rows}
+
+    def _single_name(self, value: str) -> str:
+        names = parse_tag_names(value)
+        if len(names) != 1:
+            raise ValueError(f"Expected a single tag name, got {value!r}")
+        return names[0]
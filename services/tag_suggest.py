@@ -0,0 +1,102 @@
+"""In-memory tag autocomplete index for StupidBookmarks."""
+
+import heapq
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.models import Tag, user_tags
+from services.per_user import PendingOnCommit, PerUserIndex
+
+# Memoized (prefix, limit) results kept per user before starting over
+RESULT_CACHE_SIZE = 1024
+
+class UserTagIndex:
+    """Sorted tag names with usage counts for one user.
+
+    Names sharing a prefix are a contiguous slice of the sorted list, found
+    with two binary searches. Ranked results are memoized per prefix, since
+    short prefixes can match thousands of tags.
+    """
+
+    def __init__(self, counts: Dict[str, int]):
+        self.names: List[str] = sorted(counts)
+        self.counts: Dict[str, int] = dict(counts)
+        self._results: Dict[Tuple[str, int], List[Dict[str, int]]] = {}
+
+    def suggest(self, prefix: str, limit: int) -> List[Dict[str, int]]:
+        key = (prefix, limit)
+        if key not in self._results:
+            if len(self._results) >= RESULT_CACHE_SIZE:
+                self._results.clear()
+            self._results[key] = self._rank(prefix, limit)
+        return self._results[key]
+
+    def _rank(self, prefix: str, limit: int) -> List[Dict[str, int]]:
+        start = bisect_left(self.names, prefix)
+        end = bisect_left(self.names, prefix + "\uffff", lo=start)
+        matches = self.names[start:end]
+        if len(matches) > limit:
+            matches = heapq.nsmallest(limit, matches, key=lambda name: (-self.counts[name], name))
+        else:
+            matches.sort(key=lambda name: (-self.counts[name], name))
+        return [{"name": name, "count": self.counts[name]} for name in matches]
+
+    def add_usage(self, usage: Counter):
+        self._results.clear()
+        for name, uses in usage.items():
+            count = self.counts.get(name, 0) + uses
+            if count > 0:
+                if name not in self.counts:
+                    insort(self.names, name)
+                self.counts[name] = count
+            elif name in self.counts:
+                # Tags on no bookmark are not worth suggesting
+                del self.counts[name]
+                del self.names[bisect_left(self.names, name)]
+
+class TagSuggestIndex(PerUserIndex[UserTagIndex]):
+    """Per-user prefix index answering tag autocomplete without the database.
+
+    A user's index is built from the ``tags`` table on first use (leaving out
+    tags no bookmark uses any more) and kept up to date as bookmarks are
+    tagged in this process.
+    """
+
+    def __init__(self, ttl: int = 300):
+        super().__init__(ttl)
+        self._pending = PendingOnCommit(self._publish)
+
+    def suggest(self, db: Session, user_id: int, prefix: str, limit: int = 10) -> List[Dict[str, int]]:
+        """Tags starting with ``prefix``, most used first."""
+        prefix = prefix.strip().lower()
+        index = self._index(db, user_id)
+        with self._lock:
+            return index.suggest(prefix, limit)
+
+    def record_usage(self, db: Session, user_id: int, names: List[str]):
+        """Count ``names`` as used once more when ``db`` commits."""
+        pending = self._pending.queue(db)
+        pending.setdefault(user_id, Counter()).update(names)
+
+    def _build(self, db: Session, user_id: int) -> UserTagIndex:
+        rows = (
+            db.query(Tag.name, func.count(user_tags.c.bookmark_id))
+            .join(user_tags, Tag.id == user_tags.c.tag_id)
+            .filter(Tag.user_id == user_id)
+            .group_by(Tag.id, Tag.name)
+            .all()
+        )
+        return UserTagIndex({name: count for name, count in rows})
+
+    def _publish(self, pending: Dict[int, Counter]):
+        with self._lock:
+            for user_id, usage in pending.items():
+                index = self._indexes.get(user_id)
+                if index is not None:
+                    index.add_usage(usage)
+
+tag_suggestions = TagSuggestIndex()
@@ -0,0 +1,174 @@
+"""Group commit for single-bookmark adds.
+
+Bookmarklets and browser extensions send bursts of one-bookmark requests.
+Committing each on its own means one fsync and one trip through SQLite's
+writer lock per bookmark. Instead, requests are queued to a single writer
+thread that takes everything arriving within ``WRITE_BATCH_WAIT_MS`` (up to
+``WRITE_BATCH_MAX``) and inserts it in one transaction with one commit.
+
+Durability: a caller's future resolves only after the commit containing its
+bookmark has returned, so an acknowledged bookmark is on disk (SQLite runs
+with ``synchronous=FULL``). If the batch fails, each request is retried in
+its own transaction, so one bad request can't fail the others.
+
+With per-user storage (``STORAGE_MODE=per_user``) each user's adds go to
+their own database, so a batch is committed as one transaction per user.
+
+Back-pressure: at most ``WRITE_QUEUE_MAX`` adds wait at once. When the queue
+is full, ``submit`` raises ``Overloaded``, which the API answers with a 429.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from models.database import SessionLocal, route_to_user, shard_router
+from services.bookmark_reader import BookmarkRow
+from services.bookmark_service import BookmarkService
+from services.rate_limit import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# How long the writer waits for more adds after the first one, and the batch cap
+WRITE_BATCH_WAIT_MS = float(os.getenv("WRITE_BATCH_WAIT_MS", "2"))
+WRITE_BATCH_MAX = max(1, int(os.getenv("WRITE_BATCH_MAX", "100")))
+# Adds allowed to wait for the writer before new ones get a 429
+WRITE_QUEUE_MAX = max(1, int(os.getenv("WRITE_QUEUE_MAX", "1000")))
+
+class WriteCoalescer:
+    """Single writer thread committing queued bookmark adds in batches."""
+
+    def __init__(
+        self,
+        session_factory: Callable = SessionLocal,
+        batch_wait_ms: float = WRITE_BATCH_WAIT_MS,
+        batch_max: int = WRITE_BATCH_MAX,
+        queue_max: int = WRITE_QUEUE_MAX
+    ):
+        self.session_factory = session_factory
+        self.service = BookmarkService()
+        self.batch_wait = batch_wait_ms / 1000
+        self.batch_max = batch_max
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_max)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        # Recent commit duration, for the Retry-After hint when the queue is full
+        self._commit_seconds = 0.01
+
+    def submit(self, item: Dict[str, Any]) -> "Future[BookmarkRow]":
+        """Queue one add (see ``BookmarkService.insert_bookmarks`` for the fields)."""
+        self._ensure_started()
+        future: "Future[BookmarkRow]" = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            batches_ahead = self._queue.maxsize / self.batch_max
+            raise Overloaded(batches_ahead * self._commit_seconds, "Too many bookmark writes queued, try again shortly")
+        return future
+
+    async def add(self, item: Dict[str, Any]) -> BookmarkRow:
+        """Queue one add and wait until it is committed."""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def start(self):
+        """Accept writes again after ``stop`` (the thread itself starts on first use)."""
+        with self._lock:
+            self._stopping = False
+
+    def stop(self, timeout: float = 10.0):
+        """Commit everything already queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._stopping = self._thread, True
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+            with self._lock:
+                self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None and not self._stopping:
+            return
+        with self._lock:
+            if self._stopping:
+                raise Overloaded(1, "Server is shutting down")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-coalescer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.batch_wait
+            stop = False
+            while len(batch) < self.batch_max:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            if stop:
+                # Also commit anything queued before stop() was called
+                while not self._queue.empty():
+                    entry = self._queue.get_nowait()
+                    if entry is not None:
+                        batch.append(entry)
+            # Skip adds whose caller went away; the rest can no longer be cancelled
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[tuple]):
+        if shard_router is not None and len({item["user_id"] for item, _ in batch}) > 1:
+            by_user: Dict[int, List[tuple]] = {}
+            for entry in batch:
+                by_user.setdefault(entry[0]["user_id"], []).append(entry)
+            for entries in by_user.values():
+                self._write(entries)
+            return
+        started = time.perf_counter()
+        try:
+            rows = self._commit([item for item, _ in batch])
+        except Exception:
+            if len(batch) == 1:
+                logger.exception("Bookmark write failed")
+                batch[0][1].set_exception(RuntimeError("Could not save bookmark"))
+                return
+            logger.warning("Batched bookmark write failed, retrying one by one", exc_info=True)
+            for entry in batch:
+                self._write([entry])
+            return
+
+        elapsed = time.perf_counter() - started
+        self._commit_seconds = 0.8 * self._commit_seconds + 0.2 * elapsed
+        logger.debug("Committed bookmark batch", extra={"size": len(batch), "duration_ms": round(elapsed * 1000, 2)})
+        for (_, future), row in zip(batch, rows):
+            future.set_result(row)
+
+    def _commit(self, items: List[Dict[str, Any]]) -> List[BookmarkRow]:
+        db = self.session_factory()
+        route_to_user(db, items[0]["user_id"])
+        try:
+            rows = self.service.insert_bookmarks(db, items)
+            db.commit()
+            return rows
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+write_coalescer = WriteCoalescer()